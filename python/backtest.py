@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+
+from hexbytes import HexBytes
+
+from lib.address import Address
+from lib.replay import Replay, ReplayFeed, ReplayProvider, ReplayRPC
+from lib.scheduler import BlockScheduler
+from main import MyArbitrage, SEARCH_EVALUATIONS
+from simulator import SimulationError
+
+
+class SimulatorFallback:
+    """Answers the simulation eth_calls missing from a recording with the off-chain model.
+
+    A changed optimizer probes amounts the live run never asked for; they are
+    evaluated by an `ArbitrageSimulator` loaded from the recorded state of the block.
+    """
+
+    functions = {"profitOpen": "profit_open", "profitClose": "profit_close", "deleverageClose": "deleverage_close"}
+
+    def __init__(self, replay: Replay, arbitrage: MyArbitrage):
+        self.replay = replay
+        self.arbitrage = arbitrage
+        self.simulators = {}
+
+    def __call__(self, method, params):
+        if method != "eth_call" or self.arbitrage.snapshot_loader is None:
+            return None
+        transaction, block_identifier = params
+        arb = self.arbitrage.arb
+        if Address(transaction["to"]) != arb.address:
+            return None
+        function, args = arb.contract.decode_function_input(transaction["data"])
+        name = self.functions.get(function.fn_name)
+        if name is None:
+            return None
+        block_number = int(block_identifier, 16) if block_identifier.startswith("0x") else self.replay.block_number
+        try:
+            simulator = self.simulator(transaction["from"], block_number)
+        except Exception:
+            return None
+        try:
+            profit = getattr(simulator, name)(*args.values())
+        except SimulationError as e:
+            return {"error": {"code": 3, "message": f"execution reverted: {e}"}}
+        return {"result": HexBytes(arb.web3.codec.encode_abi(["int256"], [profit])).hex()}
+
+    def simulator(self, caller, block_number):
+        key = (caller, block_number)
+        if key not in self.simulators:
+            self.simulators[key] = self.arbitrage.snapshot_loader.load(caller, block_number)
+        return self.simulators[key]
+
+
+async def backtest(arbitrage, replay, blocks=None):
+    """Runs the strategy over the recorded blocks, returns the seconds spent per block."""
+    scheduler = BlockScheduler(ReplayFeed(replay, blocks), logger=arbitrage.logger())
+    scheduler.add("block", arbitrage.on_block)
+    scheduler.add("state", arbitrage.track_state)
+    scheduler.add("strategy", arbitrage.strategy_check, arbitrage.state_key)
+    seconds = []
+    async for block_number in scheduler.feed:
+        started = time.perf_counter()
+        await scheduler.run_block(block_number)
+        seconds.append(time.perf_counter() - started)
+        # receipts of the replay are immediate
+        await arbitrage.tracker.poll()
+    return seconds
+
+
+def print_report(replay, seconds):
+    seconds = sorted(seconds)
+    total = sum(seconds)
+    print(f"blocks:{len(seconds)} seconds:{round(total, 3)} blocks/s:{round(len(seconds) / total, 1) if total > 0 else 0}")
+    if len(seconds) > 0:
+        def percentile(p):
+            return round(seconds[min(int(p * len(seconds)), len(seconds) - 1)] * 1000, 3)
+        print(f"decision ms: mean:{round(statistics.mean(seconds) * 1000, 3)} p50:{percentile(0.5)} "
+              f"p90:{percentile(0.9)} p99:{percentile(0.99)} max:{round(seconds[-1] * 1000, 3)}")
+    for (search,), (counts, total_evaluations) in sorted(SEARCH_EVALUATIONS.series.items()):
+        print(f"{search}: searches:{sum(counts)} evaluations/search:{round(total_evaluations / sum(counts), 2)}")
+    print(f"transactions sent:{len(replay.sent)} replies not recorded:{replay.misses}")
+
+
+if __name__ == "__main__":
+    recording_path = ""
+    arb_address = ""
+    wallet_key = ""
+    uniswap_pool_address = ""
+    # parameters under test
+    profit_limit = 50
+    max_trade_amount = 100
+    trade_amount_atol = 0.01
+    max_leverage = 5
+    min_funding_rate = -0.004
+
+    replay = Replay(recording_path)
+    arbitrage = MyArbitrage(arb_address, wallet_key, profit_limit, max_trade_amount, trade_amount_atol, max_leverage,
+                            min_funding_rate, batch_size=64, uniswap_pool_address=uniswap_pool_address,
+                            provider=ReplayProvider(replay), rpc=ReplayRPC(replay))
+    replay.fallback = SimulatorFallback(replay, arbitrage)
+    seconds = asyncio.get_event_loop().run_until_complete(backtest(arbitrage, replay))
+    print_report(replay, seconds)
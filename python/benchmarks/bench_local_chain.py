@@ -0,0 +1,186 @@
+"""Benchmark of the decision loop of MyArbitrage against a local chain.
+
+Measures, per block, the decision latency (from the block to the opportunities),
+the amounts evaluated by each search, the eth_calls and requests sent, and the
+transactions sent per minute. The index price of the perpetual follows a sine so
+that the open and close opportunities come and go. The results are written as
+JSON, compare the files of two versions to see hot path regressions.
+
+The fixture is the mock MAI3 pool, tokens and Uniswap V3 pool of
+solidity/scripts/deploy_bench.ts, from the solidity directory:
+
+    npx hardhat node
+    npx hardhat run scripts/deploy_bench.ts --network localhost
+
+then from the python directory: python benchmarks/bench_local_chain.py
+
+The mock pool doesn't serve the reads of the off-chain simulator, the searches
+evaluate through eth_calls.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+from eth_account import Account
+from web3 import Web3, HTTPProvider
+from web3.middleware import construct_sign_and_send_raw_middleware
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.replay import RecordingHTTPProvider  # noqa: E402
+from lib.rpc import AsyncRPC  # noqa: E402
+from main import MyArbitrage, Opportunity, SEARCH_EVALUATIONS  # noqa: E402
+
+
+SOLIDITY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "solidity")
+# accounts 0 and 1 of `npx hardhat node`
+OWNER_KEY = "0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80"
+TRADER_KEY = "0x59c6995e998f97a5a0044966f0945389dc9e86dae88c7a8412f4603b6b78690d"
+
+
+class RequestCounter:
+    """Counts the JSON-RPC requests by method, in place of a `lib.replay.Recorder`."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, method, params, reply):
+        with self.lock:
+            self.counts[method] += 1
+
+    def record_batch(self, payload, replies):
+        with self.lock:
+            for request in payload:
+                self.counts[request["method"]] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.counts)
+
+
+class PriceMover:
+    """Sets the index price of the mock liquidity pool, one block per move."""
+
+    def __init__(self, node_uri, liquidity_pool_address, owner_key):
+        self.web3 = Web3(HTTPProvider(endpoint_uri=node_uri))
+        account = Account().from_key(owner_key)
+        self.web3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
+        self.web3.eth.default_account = account.address
+        with open(os.path.join(SOLIDITY, "artifacts/contracts/test/MockLiquidityPool.sol/MockLiquidityPool.json")) as f:
+            abi = json.load(f)["abi"]
+        self.pool = self.web3.eth.contract(address=Web3.toChecksumAddress(liquidity_pool_address), abi=abi)
+
+    def move(self, price):
+        """Returns the block of the move."""
+        tx_hash = self.pool.functions.setIndexPrice(Web3.toWei(price, "ether")).transact()
+        return self.web3.eth.waitForTransactionReceipt(tx_hash).blockNumber
+
+
+def evaluations():
+    return {search: (sum(counts), total) for (search,), (counts, total) in SEARCH_EVALUATIONS.series.items()}
+
+
+def percentiles(values):
+    values = sorted(values)
+    if len(values) == 0:
+        return {}
+
+    def percentile(p):
+        return values[min(int(p * len(values)), len(values) - 1)]
+    return {"mean": statistics.mean(values), "p50": percentile(0.5), "p90": percentile(0.9),
+            "p99": percentile(0.99), "max": values[-1]}
+
+
+async def bench(arbitrage, counter, mover, iterations, base_price, amplitude, period):
+    loop = asyncio.get_event_loop()
+    decision_ms, eth_calls, requests = [], [], []
+    sent = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        price = base_price * (1 + amplitude * math.sin(2 * math.pi * i / period))
+        block_number = await loop.run_in_executor(None, mover.move, price)
+        before = counter.snapshot()
+        decision_started = time.perf_counter()
+        arbitrage.on_block(block_number)
+        await arbitrage.track_state(block_number)
+        opportunities = await arbitrage.find_opportunities(block_number)
+        decision_ms.append((time.perf_counter() - decision_started) * 1000)
+        delta = counter.snapshot() - before
+        eth_calls.append(delta["eth_call"])
+        requests.append(sum(delta.values()))
+        if len(opportunities) > 0:
+            if await loop.run_in_executor(None, arbitrage.execute, min(opportunities, key=Opportunity.rank)):
+                sent += 1
+        # the node mines on every transaction
+        await arbitrage.tracker.poll()
+    return decision_ms, eth_calls, requests, sent, time.perf_counter() - started
+
+
+def version():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--node", default="http://127.0.0.1:8545")
+    parser.add_argument("--deployment", default=os.path.join(SOLIDITY, "deployments/localhost.deployment.js"))
+    parser.add_argument("--owner-key", default=OWNER_KEY)
+    parser.add_argument("--wallet-key", default=TRADER_KEY)
+    parser.add_argument("--iterations", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--amplitude", type=float, default=0.02, help="relative amplitude of the index price")
+    parser.add_argument("--period", type=int, default=20, help="blocks per period of the index price")
+    parser.add_argument("--output", default="bench_local_chain.json")
+    args = parser.parse_args()
+
+    with open(args.deployment) as f:
+        deployment = json.load(f)
+    counter = RequestCounter()
+    mover = PriceMover(args.node, deployment["LiquidityPool"]["address"], args.owner_key)
+    base_price = float(Web3.fromWei(mover.pool.functions.indexPrice().call(), "ether"))
+    os.makedirs("logs", exist_ok=True)
+    arbitrage = MyArbitrage(deployment["UniswapV3Arbitrage"]["address"], args.wallet_key, 1, 10, 0.01, 5, -0.004,
+                            batch_size=args.batch_size, provider=RecordingHTTPProvider(args.node, counter),
+                            rpc=AsyncRPC(args.node, recorder=counter))
+    before = evaluations()
+    decision_ms, eth_calls, requests, sent, seconds = asyncio.get_event_loop().run_until_complete(
+        bench(arbitrage, counter, mover, args.iterations, base_price, args.amplitude, args.period))
+    searches = {}
+    for search, (count, total) in evaluations().items():
+        count -= before.get(search, (0, 0))[0]
+        total -= before.get(search, (0, 0))[1]
+        if count > 0:
+            searches[search] = {"searches": count, "evaluations_per_search": total / count}
+
+    results = {
+        "version": version(),
+        "node": args.node,
+        "iterations": args.iterations,
+        "batch_size": args.batch_size,
+        "seconds": seconds,
+        "decision_ms": percentiles(decision_ms),
+        "eth_calls_per_iteration": statistics.mean(eth_calls),
+        "requests_per_iteration": statistics.mean(requests),
+        "searches": searches,
+        "transactions": sent,
+        "transactions_per_minute": sent / seconds * 60 if seconds > 0 else 0,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Micro-benchmark of the vectorized profit scan against the exact simulator.
+
+Run from the python directory: python benchmarks/bench_profit_scan.py
+"""
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib import profit_scan  # noqa: E402
+from lib.mai3 import ONE, PerpetualState  # noqa: E402
+from lib.uniswap_v3 import PoolState, get_sqrt_ratio_at_tick  # noqa: E402
+from simulator import AccountState, ArbitrageSimulator, SimulationError  # noqa: E402
+
+
+def synthetic_simulator(position, amm_position, seed=0):
+    """An 18 decimals underlying at about 3000 of a 6 decimals collateral, 40 random positions."""
+    rng = random.Random(seed)
+    spacing = 60
+    center = int(math.log(3000e6 / 1e18) / math.log(1.0001)) // spacing * spacing
+    ticks = {}
+    for _ in range(40):
+        lower, upper = center - rng.randrange(1, 100) * spacing, center + rng.randrange(1, 100) * spacing
+        liquidity = rng.randrange(10**14, 10**16)
+        ticks[lower] = ticks.get(lower, 0) + liquidity
+        ticks[upper] = ticks.get(upper, 0) - liquidity
+    tick = center + 7
+    pool = PoolState(get_sqrt_ratio_at_tick(tick) + 12345, tick, sum(net for t, net in ticks.items() if t <= tick),
+                     3000, spacing, ticks)
+    perpetual = PerpetualState(
+        index_price=3000 * ONE, mark_price=3001 * ONE, amm_position=amm_position, available_cash=5000000 * ONE,
+        half_spread=ONE // 1000, open_slippage_factor=ONE // 20, close_slippage_factor=ONE // 25,
+        max_close_price_discount=ONE // 20, lp_fee_rate=ONE // 2000, operator_fee_rate=ONE // 10000,
+        vault_fee_rate=ONE // 5000, referral_rebate_rate=ONE // 5, keeper_gas_reward=ONE // 1000)
+    account = AccountState(0, 200000 * ONE, 100000 * ONE, position, 50000 * ONE)
+    return ArbitrageSimulator(pool, perpetual, account, 3 * ONE, ONE // 10000, 18, 6, True)
+
+
+def bench(name, stmt, number):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    return name, seconds / number * 1e6
+
+
+def main(number=20):
+    grid = profit_scan.Grid(0, 100 * ONE, ONE // 100)
+    rows = []
+    for label, position, amm_position in (("flat", 0, -500 * ONE), ("short", -80 * ONE, 300 * ONE)):
+        simulator = synthetic_simulator(position, amm_position)
+
+        def exact():
+            for i in range(grid.size):
+                for func in (simulator.profit_open, simulator.profit_close):
+                    try:
+                        func(grid.amount(i), -ONE * 10**12)
+                    except SimulationError:
+                        pass
+
+        rows.append(bench(f"scan {grid.size} x3 {label}", lambda: profit_scan.scan(simulator, grid, 5 * ONE), number))
+        rows.append(bench(f"exact {grid.size} x2 {label}", exact, 1))
+    for name, us in rows:
+        print(f"{name:28s} {us:12.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Latency of the RPC router against local stub nodes, one of them slow and flaky.
+
+Run from the python directory: python benchmarks/bench_router.py
+"""
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.router import RPCRouter  # noqa: E402
+from lib.rpc import AsyncRPC  # noqa: E402
+
+
+def stub_node(delay, stall_rate=0.0, error_rate=0.0, seed=0):
+    """Starts a node answering eth_blockNumber and eth_call after `delay` seconds, returns its uri.
+
+    A `stall_rate` of the requests take 20 times longer, an `error_rate` of them fail.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                stall, error = rng.random() < stall_rate, rng.random() < error_rate
+            time.sleep(delay * (20 if stall else 1))
+            if error:
+                self.send_error(502)
+                return
+            requests = payload if isinstance(payload, list) else [payload]
+            replies = [{"jsonrpc": "2.0", "id": request["id"], "result": "0x1"} for request in requests]
+            body = json.dumps(replies if isinstance(payload, list) else replies[0]).encode()
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except ConnectionError:
+                # the router dropped the request, another node answered first
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def measure(rpc, count):
+    seconds = []
+    errors = 0
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            await rpc.request("eth_call", [{"to": "0x" + "00" * 20, "data": "0x"}, "latest"])
+        except Exception:
+            errors += 1
+        seconds.append(time.perf_counter() - started)
+    await rpc.close()
+    seconds.sort()
+    return {"mean_ms": statistics.mean(seconds) * 1000, "p50_ms": seconds[len(seconds) // 2] * 1000,
+            "p99_ms": seconds[int(len(seconds) * 0.99)] * 1000, "errors": errors}
+
+
+if __name__ == "__main__":
+    count = 300
+    flaky = stub_node(0.01, stall_rate=0.1, error_rate=0.05, seed=1)
+    steady = stub_node(0.02, seed=2)
+    loop = asyncio.get_event_loop()
+    print("flaky node only ", loop.run_until_complete(measure(AsyncRPC(flaky), count)))
+    print("router          ", loop.run_until_complete(measure(RPCRouter([flaky, steady]).rpc(), count)))
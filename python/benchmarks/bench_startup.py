@@ -0,0 +1,49 @@
+"""Startup time of the bot: seconds to import main in a fresh interpreter, and the slowest imports.
+
+The first runs are without the pickled ABI cache, the others with it. The
+construction of MyArbitrage needs a node, its time is reported by main itself as
+arbitrage_startup_seconds{stage="init"} and in the [startup] log line.
+
+Run from the python directory: python benchmarks/bench_startup.py
+"""
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ABI_CACHE = os.path.join(PYTHON_DIR, "abi", "__pycache__")
+
+
+def import_seconds():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=PYTHON_DIR, check=True)
+    return time.perf_counter() - started
+
+
+def slowest_imports(count=15):
+    """Returns (cumulative microseconds, module) of the slowest imports of main."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=PYTHON_DIR,
+                            check=True, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    runs = 5
+    cold = []
+    for _ in range(runs):
+        shutil.rmtree(ABI_CACHE, ignore_errors=True)
+        cold.append(import_seconds())
+    warm = [import_seconds() for _ in range(runs)]
+    print(f"import main without abi cache: median {round(statistics.median(cold) * 1000, 1)} ms")
+    print(f"import main with abi cache:    median {round(statistics.median(warm) * 1000, 1)} ms")
+    for cumulative, module in slowest_imports():
+        print(f"{round(cumulative / 1000, 1):>10} ms  {module}")
@@ -0,0 +1,55 @@
+"""Time to sign a profitOpen transaction: from the template of `TemplateSubmitter`, and with
+eth_account as `TransactionSubmitter` does once web3 has built the transaction.
+
+Neither asks the node anything, the gas price and chain id are set by hand. Signing
+is much faster with coincurve installed.
+
+Run from the python directory: python benchmarks/bench_submit.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from eth_abi import encode_abi  # noqa: E402
+from eth_account import Account  # noqa: E402
+
+from lib import transaction  # noqa: E402
+from lib.abi import load_abi  # noqa: E402
+
+ARBITRAGE_ADDRESS = "0x5FbDB2315678afecb367f032d93F642f64180aa3"
+CHAIN_ID = 421611
+GAS_PRICE = 10**9
+GAS = 3000000
+
+
+def template_seconds(account, template, count):
+    submitter = transaction.TemplateSubmitter.__new__(transaction.TemplateSubmitter)
+    submitter.private_key = transaction.keys.PrivateKey(bytes(account.key))
+    submitter.chain_id = CHAIN_ID
+    submitter.chain_items = transaction._rlp_int(CHAIN_ID) + b"\x80\x80"
+    submitter.gas_price_item = transaction._rlp_int(GAS_PRICE)
+    started = time.perf_counter()
+    for nonce in range(count):
+        submitter.sign(template, (10**18 + nonce, 10**17), nonce, GAS)
+    return (time.perf_counter() - started) / count
+
+
+def eth_account_seconds(account, selector, input_types, count):
+    started = time.perf_counter()
+    for nonce in range(count):
+        data = selector + encode_abi(input_types, [10**18 + nonce, 10**17])
+        account.sign_transaction({"nonce": nonce, "gasPrice": GAS_PRICE, "gas": GAS, "to": ARBITRAGE_ADDRESS,
+                                  "value": 0, "data": data, "chainId": CHAIN_ID})
+    return (time.perf_counter() - started) / count
+
+
+if __name__ == "__main__":
+    count = 1000
+    account = Account.create()
+    abi = load_abi(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "abi", "UniswapV3Arbitrage.json"))
+    selector, input_types, _ = abi.functions["profitOpen"]
+    template = transaction.CallTemplate(ARBITRAGE_ADDRESS, selector, input_types, GAS)
+    print(f"template:    {round(template_seconds(account, template, count) * 1e6, 1)} us")
+    print(f"eth_account: {round(eth_account_seconds(account, bytes.fromhex(selector[2:]), input_types, count) * 1e6, 1)} us")
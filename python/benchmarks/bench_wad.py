@@ -0,0 +1,64 @@
+"""Micro-benchmark of the integer Wad against the previous Decimal implementation.
+
+Run from the python directory: python benchmarks/bench_wad.py
+"""
+import os
+import sys
+import timeit
+from decimal import Context, Decimal, ROUND_DOWN
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.wad import Wad  # noqa: E402
+
+
+_context = Context(prec=1000, rounding=ROUND_DOWN)
+
+
+class DecimalWad:
+    """The Decimal based Wad arithmetic this repo used before."""
+
+    def __init__(self, value):
+        self.value = value
+
+    @classmethod
+    def from_number(cls, number):
+        dec = Decimal(str(number)) * (Decimal(10) ** 18)
+        return DecimalWad(int(dec.quantize(1, context=_context)))
+
+    def __mul__(self, other):
+        result = Decimal(self.value) * Decimal(other.value) / (Decimal(10) ** Decimal(18))
+        return DecimalWad(int(result.quantize(1, context=_context)))
+
+    def __truediv__(self, other):
+        return DecimalWad(int((Decimal(self.value) * (Decimal(10) ** Decimal(18)) / Decimal(other.value)).quantize(1, context=_context)))
+
+
+def bench(name, stmt, number):
+    seconds = min(timeit.repeat(stmt, number=number, repeat=5))
+    return name, seconds / number * 1e9
+
+
+def main(number=100000):
+    a, b = Wad.from_number(1234.5678), Wad.from_number(0.987654321)
+    da, db = DecimalWad.from_number(1234.5678), DecimalWad.from_number(0.987654321)
+    amounts = [Wad.from_number(i / 7).value for i in range(1000)]
+
+    rows = [
+        bench("from_number decimal", lambda: DecimalWad.from_number(1234.5678), number),
+        bench("from_number int", lambda: Wad.from_number(1234.5678), number),
+        bench("mul decimal", lambda: da * db, number),
+        bench("mul int", lambda: a * b, number),
+        bench("div decimal", lambda: da / db, number),
+        bench("div int", lambda: a / b, number),
+        bench("add int", lambda: a + b, number),
+        bench("compare int", lambda: a < b, number),
+        bench("mul 1000 Wads", lambda: [Wad(x) * b for x in amounts], number // 1000),
+        bench("mul_values 1000", lambda: Wad.mul_values(amounts, b), number // 1000),
+    ]
+    for name, ns in rows:
+        print(f"{name:24s} {ns:12.1f} ns/op")
+
+
+if __name__ == "__main__":
+    main()
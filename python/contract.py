@@ -2,71 +2,58 @@ from web3 import Web3
 import time
 
 from lib.address import Address
-from lib.contract import Contract
+from lib.cache import BlockCache
+from lib.contract import RPC_SECONDS, AsyncContract, Contract
+from lib.rpc import AsyncRPC, batch_caller
 from lib.wad import Wad
 
 
 class Arbitrage(Contract):
     abi = Contract._load_abi(__name__, 'abi/UniswapV3Arbitrage.json')
 
-    def __init__(self, web3: Web3, address: Address):
+    def __init__(self, web3: Web3, address: Address, cache: BlockCache = None, check_code=True):
         assert(isinstance(web3, Web3))
         assert(isinstance(address, Address))
 
         self.web3 = web3
         self.address = address
-        self.contract = self._get_contract(web3, self.abi, address)
-        self.timeout = 120
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
+        self.cache = cache
 
     def profit_open(self, amount, profit_limit, caller):
-        return self.contract.functions.profitOpen(amount, profit_limit).call({'from': caller})
-
-    def execute_profit_open(self, amount, profit_limit, caller):
-        tx_hash = self.contract.functions.profitOpen(
-            amount,
-            profit_limit).transact({
-                'from': caller,
-            })
-        tx_receipt = self.web3.eth.waitForTransactionReceipt(
-            tx_hash, timeout=self.timeout)
-        return tx_receipt["status"], self.parse_int256(tx_receipt["returnData"])
+        return self._call('profitOpen', (amount, profit_limit), caller)
+
+    def submit_profit_open(self, amount, profit_limit, submitter):
+        return submitter.submit_call(self, 'profitOpen', (amount, profit_limit))
 
     def profit_close(self, amount, profit_limit, caller):
-        return self.contract.functions.profitClose(amount, profit_limit).call({'from': caller})
-
-    def execute_profit_close(self, amount, profit_limit, caller):
-        tx_hash = self.contract.functions.profitClose(
-            amount,
-            profit_limit).transact({
-                'from': caller,
-            })
-        tx_receipt = self.web3.eth.waitForTransactionReceipt(
-            tx_hash, timeout=self.timeout)
-        return tx_receipt["status"], self.parse_int256(tx_receipt["returnData"])
+        return self._call('profitClose', (amount, profit_limit), caller)
+
+    def submit_profit_close(self, amount, profit_limit, submitter):
+        return submitter.submit_call(self, 'profitClose', (amount, profit_limit))
 
     def deleverage_close(self, amount, max_leverage, caller):
-        return self.contract.functions.deleverageClose(amount, max_leverage).call({'from': caller})
-
-    def execute_deleverage_close(self, amount, max_leverage, caller):
-        tx_hash = self.contract.functions.deleverageClose(
-            amount,
-            max_leverage).transact({
-                'from': caller,
-            })
-        tx_receipt = self.web3.eth.waitForTransactionReceipt(
-            tx_hash, timeout=self.timeout)
-        return tx_receipt["status"], self.parse_int256(tx_receipt["returnData"])
+        return self._call('deleverageClose', (amount, max_leverage), caller)
 
-    def execute_all_close(self, caller):
-        tx_hash = self.contract.functions.allClose().transact({
-            'from': caller,
-        })
-        tx_receipt = self.web3.eth.waitForTransactionReceipt(
-            tx_hash, timeout=self.timeout)
-        return tx_receipt["status"], self.parse_int256(tx_receipt["returnData"])
+    def submit_deleverage_close(self, amount, max_leverage, submitter):
+        return submitter.submit_call(self, 'deleverageClose', (amount, max_leverage))
 
-    def account_info(self, caller):
-        return self.contract.functions.readAccountInfo().call({'from': caller})
+    def submit_all_close(self, submitter):
+        return submitter.submit_call(self, 'allClose', ())
+
+    def account_info(self, caller, block_identifier='latest'):
+        return self._call('readAccountInfo', (), caller, block_identifier)
+
+    def block_number(self):
+        with RPC_SECONDS.time(method="eth_blockNumber", kind="call"):
+            return self.web3.eth.block_number
+
+    def market(self):
+        """Returns (underlying asset, collateral, uniswap fee, liquidity pool, perpetual index, target leverage)."""
+        functions = self.contract.functions
+        return (functions.underlyingAsset().call(), functions.collateral().call(), functions.fee().call(),
+                functions.pool().call(), functions.perpetualIndex().call(), functions.targetLeverage().call())
 
     def parse_int256(self, x):
         x = int(x, 16)
@@ -76,16 +63,63 @@ class Arbitrage(Contract):
             return x
 
 
+class AsyncArbitrage(AsyncContract):
+    """asyncio client of the simulation calls of UniswapV3Arbitrage, see `Arbitrage`."""
+
+    abi = Arbitrage.abi
+
+    def __init__(self, web3: Web3, address: Address, rpc: AsyncRPC, cache: BlockCache = None, check_code=True):
+        assert(isinstance(web3, Web3))
+        assert(isinstance(address, Address))
+        assert(isinstance(rpc, AsyncRPC))
+
+        self.web3 = web3
+        self.address = address
+        self.rpc = rpc
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
+        self.cache = cache
+
+    async def profit_open(self, amount, profit_limit, caller, block_identifier='latest'):
+        return await self._call('profitOpen', (amount, profit_limit), caller, block_identifier)
+
+    async def profit_open_batch(self, amounts, profit_limit, caller, block_identifier='latest'):
+        return await self._call_batch('profitOpen', [(amount, profit_limit) for amount in amounts], caller, block_identifier)
+
+    async def profit_close(self, amount, profit_limit, caller, block_identifier='latest'):
+        return await self._call('profitClose', (amount, profit_limit), caller, block_identifier)
+
+    async def profit_close_batch(self, amounts, profit_limit, caller, block_identifier='latest'):
+        return await self._call_batch('profitClose', [(amount, profit_limit) for amount in amounts], caller, block_identifier)
+
+    async def deleverage_close(self, amount, max_leverage, caller, block_identifier='latest'):
+        return await self._call('deleverageClose', (amount, max_leverage), caller, block_identifier)
+
+    async def deleverage_close_batch(self, amounts, max_leverage, caller, block_identifier='latest'):
+        return await self._call_batch('deleverageClose', [(amount, max_leverage) for amount in amounts], caller, block_identifier)
+
+    async def account_info(self, caller, block_identifier='latest'):
+        return await self._call('readAccountInfo', (), caller, block_identifier)
+
+    async def estimate_gas(self, fn_name, args, caller):
+        return await self._estimate_gas(fn_name, args, caller)
+
+    async def block_number(self):
+        with RPC_SECONDS.time(method="eth_blockNumber", kind="call"):
+            return await self.rpc.block_number()
+
+
 class ERC20(Contract):
     abi = Contract._load_abi(__name__, 'abi/ERC20.json')
 
-    def __init__(self, web3: Web3, address: Address):
+    def __init__(self, web3: Web3, address: Address, check_code=True):
         assert(isinstance(web3, Web3))
         assert(isinstance(address, Address))
 
         self.web3 = web3
         self.address = address
-        self.contract = self._get_contract(web3, self.abi, address)
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
         self.timeout = 120
 
     def approve(self, spender, caller):
@@ -98,17 +132,81 @@ class ERC20(Contract):
             tx_hash, timeout=self.timeout)
         print(receipt)
 
+    def balance_of(self, owner, block_identifier='latest'):
+        return self.contract.functions.balanceOf(owner).call(block_identifier=block_identifier)
+
+    def decimals(self):
+        return self.contract.functions.decimals().call()
+
+
+class UniswapV3Pool(Contract):
+    abi = Contract._load_abi(__name__, 'abi/UniswapV3Pool.json')
+
+    def __init__(self, web3: Web3, address: Address, check_code=True):
+        assert(isinstance(web3, Web3))
+        assert(isinstance(address, Address))
+
+        self.web3 = web3
+        self.address = address
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
+        self.batch = batch_caller(web3.provider)
+
+    def slot0(self, block_identifier='latest'):
+        return self.contract.functions.slot0().call(block_identifier=block_identifier)
+
+    def liquidity(self, block_identifier='latest'):
+        return self.contract.functions.liquidity().call(block_identifier=block_identifier)
+
+    def fee(self):
+        return self.contract.functions.fee().call()
+
+    def tick_spacing(self):
+        return self.contract.functions.tickSpacing().call()
+
+    def token0(self):
+        return self.contract.functions.token0().call()
+
+    def tick_bitmap_batch(self, word_positions, block_identifier='latest'):
+        return self._call_batch('tickBitmap', [(word,) for word in word_positions], self.address.address, block_identifier)
+
+    def ticks_batch(self, ticks, block_identifier='latest'):
+        return self._call_batch('ticks', [(tick,) for tick in ticks], self.address.address, block_identifier)
+
+
+class LiquidityPool(Contract):
+    abi = Contract._load_abi(__name__, 'abi/LiquidityPool.json')
+
+    def __init__(self, web3: Web3, address: Address, check_code=True):
+        assert(isinstance(web3, Web3))
+        assert(isinstance(address, Address))
+
+        self.web3 = web3
+        self.address = address
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
+
+    def liquidity_pool_info(self, block_identifier='latest'):
+        return self.contract.functions.getLiquidityPoolInfo().call(block_identifier=block_identifier)
+
+    def perpetual_info(self, perpetual_index, block_identifier='latest'):
+        return self.contract.functions.getPerpetualInfo(perpetual_index).call(block_identifier=block_identifier)
+
+    def margin_account(self, perpetual_index, trader, block_identifier='latest'):
+        return self.contract.functions.getMarginAccount(perpetual_index, trader).call(block_identifier=block_identifier)
+
 
 class AccessControl(Contract):
     abi = Contract._load_abi(__name__, 'abi/AccessControl.json')
 
-    def __init__(self, web3: Web3, address: Address):
+    def __init__(self, web3: Web3, address: Address, check_code=True):
         assert(isinstance(web3, Web3))
         assert(isinstance(address, Address))
 
         self.web3 = web3
         self.address = address
-        self.contract = self._get_contract(web3, self.abi, address)
+        self.check_code = check_code
+        self.contract = self._get_contract(web3, self.abi, address, check_code)
         self.timeout = 120
 
     def grant_privilege(self, grantee, caller):
@@ -0,0 +1,67 @@
+import json
+import os
+import pickle
+
+from eth_utils import function_abi_to_4byte_selector
+from eth_utils.abi import collapse_if_tuple
+
+
+# bump when ContractABI changes, older pickles are rebuilt
+CACHE_VERSION = 1
+
+
+class ContractABI(list):
+    """A contract ABI with the selector, input types and output types of each function by name.
+
+    The ABI entries stay a list for web3. Overloaded functions are left out of
+    `functions`, they go through web3.
+    """
+
+    def __init__(self, abi):
+        super().__init__(abi)
+        self.functions = {}
+        overloaded = set()
+        for entry in abi:
+            if entry.get("type") != "function":
+                continue
+            name = entry["name"]
+            if name in self.functions:
+                overloaded.add(name)
+            self.functions[name] = (
+                "0x" + function_abi_to_4byte_selector(entry).hex(),
+                [collapse_if_tuple(value) for value in entry.get("inputs", [])],
+                [collapse_if_tuple(value) for value in entry.get("outputs", [])],
+            )
+        for name in overloaded:
+            del self.functions[name]
+
+
+def load_abi(path):
+    """Returns the `ContractABI` of the artifact at `path`.
+
+    It is parsed once, then kept in a pickle under __pycache__ next to the artifact
+    until the artifact changes.
+    """
+    stat = os.stat(path)
+    directory, name = os.path.split(path)
+    cache_path = os.path.join(directory, "__pycache__", name + ".pickle")
+    key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, abi = pickle.load(f)
+        if cached_key == key:
+            return abi
+    except (OSError, pickle.PickleError, EOFError, ValueError, AttributeError):
+        pass
+    with open(path) as f:
+        abi = ContractABI(json.load(f)["abi"])
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # written aside and renamed, processes starting together don't see half a file
+        temporary_path = f"{cache_path}.{os.getpid()}"
+        with open(temporary_path, "wb") as f:
+            pickle.dump((key, abi), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass
+    return abi
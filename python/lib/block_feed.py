@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+from web3 import Web3
+
+
+class BlockFeed:
+    """Async iterator over new block numbers, driven by an eth_newBlockFilter.
+
+    One filter is polled in the background for all the consumers: each iteration of
+    the feed, or `subscribe()`, gets every new block at its own pace. Blocks mined
+    while a consumer is busy are coalesced, only the latest one is delivered to it.
+    If the node drops the filter it is installed again.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, web3: Web3, poll_interval=0.25, retry_interval=2, logger=None):
+        assert(isinstance(web3, Web3))
+        if logger is not None:
+            self.logger = logger
+        self.web3 = web3
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.block_number = None
+        self.subscribers = []
+        self.poller = None
+
+    def __aiter__(self):
+        return self.subscribe()
+
+    def subscribe(self):
+        """Returns an async iterator over the new blocks, starts polling on the first one."""
+        subscriber = _Subscriber()
+        self.subscribers.append(subscriber)
+        if self.poller is None:
+            self.poller = asyncio.ensure_future(self._poll())
+        return subscriber.blocks()
+
+    async def _poll(self):
+        async for block_number in self._blocks():
+            for subscriber in self.subscribers:
+                subscriber.publish(block_number)
+
+    async def _blocks(self):
+        loop = asyncio.get_event_loop()
+        block_filter = None
+        while True:
+            try:
+                if block_filter is None:
+                    block_filter = await loop.run_in_executor(None, self.web3.eth.filter, 'latest')
+                    changed = True
+                else:
+                    changed = len(await loop.run_in_executor(None, block_filter.get_new_entries)) > 0
+                if changed:
+                    block_number = await loop.run_in_executor(None, lambda: self.web3.eth.block_number)
+                    if self.block_number is None or block_number > self.block_number:
+                        self.block_number = block_number
+                        yield block_number
+                        continue
+            except Exception as e:
+                self.logger.warning(f"[block feed] error:{e}")
+                block_filter = None
+                await asyncio.sleep(self.retry_interval)
+                continue
+            await asyncio.sleep(self.poll_interval)
+
+
+class _Subscriber:
+    def __init__(self):
+        self.block_number = None
+        self.event = asyncio.Event()
+
+    def publish(self, block_number):
+        self.block_number = block_number
+        self.event.set()
+
+    async def blocks(self):
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            yield self.block_number
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+
+class BlockCache:
+    """LRU cache of contract reads, keyed by (block, contract, method, args, caller).
+
+    Only reads pinned to a block number are cached: 'latest' may already be a newer
+    block than the last one the feed saw, so it is never cached. `set_block` with a
+    new number and `invalidate` (e.g. when one of our transactions confirmed) drop
+    everything; the epoch in the keys makes sure a read started before that is
+    never served after it.
+    """
+
+    def __init__(self, max_size=4096):
+        self.max_size = max_size
+        self.block_number = None
+        self.epoch = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, address, fn_name, args, caller, block_identifier):
+        """Returns the key of a read, None if it can't be cached."""
+        if not isinstance(block_identifier, int):
+            return None
+        return (self.epoch, block_identifier, address, fn_name, tuple(args), caller)
+
+    def get(self, key):
+        """Returns (True, value) on a hit, (False, None) otherwise."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            if key[0] != self.epoch:
+                return
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def set_block(self, block_number):
+        with self.lock:
+            if block_number == self.block_number:
+                return
+            self.block_number = block_number
+            self._clear()
+
+    def invalidate(self):
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.epoch += 1
+        self.entries.clear()
@@ -1,28 +1,169 @@
 import logging
-import json
-import pkg_resources
+import os
+import sys
 
 import eth_utils
+from hexbytes import HexBytes
 from web3 import Web3
+from web3.exceptions import ContractLogicError
+from . import metrics
+from .abi import load_abi
 from .address import Address
 
 
+RPC_SECONDS = metrics.histogram(
+    "arbitrage_rpc_seconds", "Duration of the eth_calls sent by the contract clients.", ["method", "kind"])
+
+
 class Contract:
     logger = logging.getLogger()
+    # a lib.cache.BlockCache shared by the clients that set it
+    cache = None
+    # False trusts the address of the client, saves an eth_getCode at startup
+    check_code = True
 
     @staticmethod
-    def _get_contract(web3: Web3, abi: list, address: Address):
+    def _get_contract(web3: Web3, abi: list, address: Address, check_code=True):
         assert(isinstance(web3, Web3))
         assert(isinstance(abi, list))
         assert(isinstance(address, Address))
 
-        code = web3.eth.getCode(address.address)
-        if (code == "0x") or (code == "0x0") or (code == b"\x00") or (code is None):
-            raise Exception(f"No contract found at {address}")
+        if check_code:
+            code = web3.eth.getCode(address.address)
+            if (code == "0x") or (code == "0x0") or (code == b"\x00") or (code is None):
+                raise Exception(f"No contract found at {address}")
 
         return web3.eth.contract(address=address.address, abi=abi)
 
     @staticmethod
     def _load_abi(package, resource) -> list:
-        return json.loads(pkg_resources.resource_string(package, resource))["abi"]
+        # relative to the module, which is being imported
+        return load_abi(os.path.join(os.path.dirname(os.path.abspath(sys.modules[package].__file__)), resource))
+
+    def _transaction(self, fn_name, args, caller):
+        function = getattr(self.abi, "functions", {}).get(fn_name)
+        if function is None:
+            data = self.contract.encodeABI(fn_name=fn_name, args=args)
+        else:
+            # selector and types from the ABI cache, no function lookup in web3
+            data = function[0] + self.web3.codec.encode_abi(function[1], args).hex()
+        return {
+            'from': caller,
+            'to': self.address.address,
+            'data': data,
+        }
+
+    def _decode_output(self, fn_name, result):
+        function = getattr(self.abi, "functions", {}).get(fn_name)
+        if function is None:
+            output_types = [output['type'] for output in self.contract.get_function_by_name(fn_name).abi['outputs']]
+        else:
+            output_types = function[2]
+        values = self.web3.codec.decode_abi(output_types, HexBytes(result))
+        return values[0] if len(values) == 1 else list(values)
+
+    def _decode_batch(self, fn_name, results):
+        return [result if isinstance(result, Exception) else self._decode_output(fn_name, result)
+                for result in results]
+
+    def _cache_key(self, fn_name, args, caller, block_identifier):
+        if self.cache is None:
+            return None
+        return self.cache.key(self.address.address, fn_name, args, caller, block_identifier)
+
+    def _cache_get(self, key):
+        if key is None:
+            return False, None
+        return self.cache.get(key)
+
+    def _cache_put(self, key, result):
+        # reverts are as deterministic as results, other errors may not be
+        if key is not None and (not isinstance(result, Exception) or _is_revert(result)):
+            self.cache.put(key, result)
+
+    def _call(self, fn_name, args, caller, block_identifier='latest'):
+        """eth_call of `fn_name`, served from the cache when possible."""
+        key = self._cache_key(fn_name, args, caller, block_identifier)
+        hit, result = self._cache_get(key)
+        if not hit:
+            try:
+                with RPC_SECONDS.time(method=fn_name, kind="call"):
+                    result = self.contract.get_function_by_name(fn_name)(*args).call(
+                        {'from': caller}, block_identifier=block_identifier)
+            except Exception as e:
+                self._cache_put(key, e)
+                raise
+            self._cache_put(key, result)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _lookup_batch(self, fn_name, args_list, caller, block_identifier):
+        """Returns the cache keys of the calls, their results so far and the indices still to call."""
+        keys = [self._cache_key(fn_name, args, caller, block_identifier) for args in args_list]
+        results = [None] * len(args_list)
+        missing = []
+        for i, key in enumerate(keys):
+            hit, results[i] = self._cache_get(key)
+            if not hit:
+                missing.append(i)
+        return keys, results, missing
+
+    def _store_batch(self, fn_name, keys, results, missing, raw_results):
+        for i, result in zip(missing, self._decode_batch(fn_name, raw_results)):
+            results[i] = result
+            self._cache_put(keys[i], result)
+
+    def _call_batch(self, fn_name, args_list, caller, block_identifier='latest'):
+        """Calls `fn_name` once per entry of `args_list` in a single batch request.
+
+        Returns the decoded results in order, reverted calls are returned as exceptions.
+        Only the calls missing from the cache are sent.
+        """
+        keys, results, missing = self._lookup_batch(fn_name, args_list, caller, block_identifier)
+        if len(missing) > 0:
+            transactions = [self._transaction(fn_name, args_list[i], caller) for i in missing]
+            with RPC_SECONDS.time(method=fn_name, kind="batch"):
+                raw_results = self.batch.call(transactions, block_identifier)
+            self._store_batch(fn_name, keys, results, missing, raw_results)
+        return results
+
+
+class AsyncContract(Contract):
+    """Base of the asyncio contract clients, calls go through a shared `AsyncRPC`.
+
+    The web3 contract object is only used to encode calls and decode results.
+    """
+
+    async def _call(self, fn_name, args, caller, block_identifier='latest'):
+        key = self._cache_key(fn_name, args, caller, block_identifier)
+        hit, result = self._cache_get(key)
+        if not hit:
+            try:
+                with RPC_SECONDS.time(method=fn_name, kind="call"):
+                    raw_result = await self.rpc.call(self._transaction(fn_name, args, caller), block_identifier)
+                result = self._decode_output(fn_name, raw_result)
+            except Exception as e:
+                self._cache_put(key, e)
+                raise
+            self._cache_put(key, result)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _call_batch(self, fn_name, args_list, caller, block_identifier='latest'):
+        keys, results, missing = self._lookup_batch(fn_name, args_list, caller, block_identifier)
+        if len(missing) > 0:
+            transactions = [self._transaction(fn_name, args_list[i], caller) for i in missing]
+            with RPC_SECONDS.time(method=fn_name, kind="batch"):
+                raw_results = await self.rpc.call_batch(transactions, block_identifier)
+            self._store_batch(fn_name, keys, results, missing, raw_results)
+        return results
+
+    async def _estimate_gas(self, fn_name, args, caller):
+        with RPC_SECONDS.time(method=fn_name, kind="estimate"):
+            return int(await self.rpc.request("eth_estimateGas", [self._transaction(fn_name, args, caller)]), 16)
+
 
+def _is_revert(e):
+    return isinstance(e, ContractLogicError) or "revert" in str(e)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+from .rpc import AsyncRPC
+
+
+class GasEstimator:
+    """Expected gas cost of the transactions of the strategies, in wei of the gas token.
+
+    The gas price follows the base fee of each block (the node's gas price on chains
+    without one) plus `priority_fee`. Gas amounts come from eth_estimateGas, cached
+    per (tag, amount bucket) for `ttl` blocks, a bucket being the amounts of the same
+    bit length. `gas` never waits for an estimate: a missing bucket is estimated in
+    the background by `estimate(tag, amount)` (a coroutine function returning the gas)
+    and meanwhile the last estimate of the tag, or `default_gas`, stands in. A
+    failed estimate is not retried before `ttl` blocks either.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, rpc: AsyncRPC, estimate, default_gas=2000000, priority_fee=0, margin=1.2, ttl=100, logger=None):
+        assert(isinstance(rpc, AsyncRPC))
+        if logger is not None:
+            self.logger = logger
+        self.rpc = rpc
+        self.estimate = estimate
+        self.default_gas = default_gas
+        self.priority_fee = priority_fee
+        # estimates are scaled up by `margin`, the real transaction varies a bit
+        self.margin = margin
+        self.ttl = ttl
+        self.gas_price = None
+        self.block_number = None
+        self.loop = None
+        # (tag, bucket) -> (gas or None if the estimate failed, block estimated at)
+        self.estimates = {}
+        self.last = {}
+        self.in_flight = set()
+
+    async def on_block(self, block_number):
+        """Reads the base fee of `block_number`."""
+        self.loop = asyncio.get_event_loop()
+        block, gas_price = await self.rpc.batch([
+            ("eth_getBlockByNumber", [hex(block_number), False]),
+            ("eth_gasPrice", []),
+        ])
+        if not isinstance(block, Exception) and block is not None and block.get("baseFeePerGas") is not None:
+            self.gas_price = int(block["baseFeePerGas"], 16) + self.priority_fee
+        elif not isinstance(gas_price, Exception):
+            self.gas_price = int(gas_price, 16)
+        self.block_number = block_number
+
+    def gas(self, tag, amount):
+        key = (tag, int(amount).bit_length())
+        entry = self.estimates.get(key)
+        if entry is None or (self.block_number is not None and self.block_number - entry[1] >= self.ttl):
+            self._schedule(key, amount)
+        if entry is not None and entry[0] is not None:
+            return entry[0]
+        return self.last.get(tag, self.default_gas)
+
+    def cost(self, tag, amount):
+        """Returns the expected cost in wei of sending `tag` for `amount`, 0 before the first block."""
+        if self.gas_price is None:
+            return 0
+        return self.gas(tag, amount) * self.gas_price
+
+    def _schedule(self, key, amount):
+        if self.loop is None or key in self.in_flight:
+            return
+        self.in_flight.add(key)
+        # the costs are evaluated on the loop and in executor threads
+        self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._estimate(key, amount)))
+
+    async def _estimate(self, key, amount):
+        tag, _ = key
+        try:
+            gas = int(await self.estimate(tag, int(amount)) * self.margin)
+            self.last[tag] = gas
+        except Exception as e:
+            self.logger.debug(f"[gas] {tag} amount:{round(int(amount) / 10**18, 4)} estimate error:{e}")
+            gas = None
+        finally:
+            self.in_flight.discard(key)
+        self.estimates[key] = (gas, self.block_number or 0)
@@ -0,0 +1,67 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line: time, level, message and the fields of `EventLogger.event`."""
+
+    def format(self, record):
+        entry = {"time": round(record.created, 6), "level": record.levelname, "message": record.getMessage()}
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        # wad amounts stay exact integers, exceptions and the rest become strings
+        return json.dumps(entry, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """Puts the records on the queue as they are, the message is only built by the listener."""
+
+    def prepare(self, record):
+        return record
+
+
+def queue_handler(*handlers):
+    """Returns a handler that queues the records for `handlers`, which run on a listener thread.
+
+    Logging costs the caller building the record and a queue put, the formatting
+    and the disk writes happen on the thread. The listener is flushed at exit.
+    """
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return LazyQueueHandler(records)
+
+
+class EventLogger:
+    """Structured events sent to `logger`, sampled per stage.
+
+    `event(stage, **fields)` logs `stage` with the raw values of the fields, nothing is
+    formatted when the level is filtered out or the event is not sampled. `sample`
+    maps a stage to N, one event of the stage out of N is logged, all by default.
+    """
+
+    def __init__(self, logger, sample=None, level=logging.DEBUG):
+        self.logger = logger
+        self.sample = dict(sample or {})
+        self.level = level
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def event(self, stage, **fields):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        every = self.sample.get(stage, 1)
+        if every > 1:
+            with self.lock:
+                count = self.counts[stage] = self.counts.get(stage, 0) + 1
+            if count % every != 0:
+                return
+        self.logger.log(self.level, stage, extra={"fields": fields})
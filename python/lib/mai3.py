@@ -0,0 +1,175 @@
+from math import isqrt
+
+# Integer model of the MAI3 perpetual AMM as seen by a market order of a single
+# trader, ported from the mai-protocol-v3 AMMModule/TradeModule with the same
+# signed wad rounding as SafeMathExt.sol. Checks that only make the real trade
+# revert (max AMM position, open interest limit, margin safety, fee caps) are not
+# modeled, callers are expected to confirm the final amount on chain.
+
+ONE = 10**18
+MAX_EFFECTIVE_LEVERAGE = 9999 * ONE
+
+
+class TradeError(Exception):
+    pass
+
+
+def _div(x, y):
+    # solidity signed division truncates toward zero
+    q = abs(x) // abs(y)
+    return q if (x >= 0) == (y > 0) else -q
+
+
+def _round_half_up(x, y):
+    return x + y // 2 if x >= 0 else x - y // 2
+
+
+def wmul(x, y):
+    return _div(_round_half_up(x * y, ONE), ONE)
+
+
+def wdiv(x, y):
+    if y < 0:
+        x, y = -x, -y
+    return _div(_round_half_up(x * ONE, y), y)
+
+
+def wfrac(x, y, z):
+    t = x * y
+    if z < 0:
+        z, t = -z, -t
+    return _div(_round_half_up(t, z), z)
+
+
+def has_the_same_sign(x, y):
+    if x == 0 or y == 0:
+        return True
+    return (x < 0) == (y < 0)
+
+
+def split_amount(amount, delta):
+    """Splits `delta` into the part closing `amount` and the part opening a new position."""
+    if has_the_same_sign(amount, delta):
+        return 0, delta
+    if abs(amount) >= abs(delta):
+        return delta, 0
+    return -amount, amount + delta
+
+
+class PerpetualState:
+    """Snapshot of one MAI3 perpetual and the AMM context around it.
+
+    All values are signed wads. `available_cash` is the pool cash plus the AMM's
+    available cash in every perpetual, `other_position_value` and `other_square_value`
+    (scaled by 1e36) aggregate the AMM positions in the other perpetuals of the
+    liquidity pool.
+    """
+
+    def __init__(self, index_price, mark_price, amm_position, available_cash,
+                 half_spread, open_slippage_factor, close_slippage_factor, max_close_price_discount,
+                 lp_fee_rate, operator_fee_rate, vault_fee_rate, referral_rebate_rate, keeper_gas_reward,
+                 other_position_value=0, other_square_value=0):
+        self.index_price = index_price
+        self.mark_price = mark_price
+        self.amm_position = amm_position
+        self.available_cash = available_cash
+        self.half_spread = half_spread
+        self.open_slippage_factor = open_slippage_factor
+        self.close_slippage_factor = close_slippage_factor
+        self.max_close_price_discount = max_close_price_discount
+        self.lp_fee_rate = lp_fee_rate
+        self.operator_fee_rate = operator_fee_rate
+        self.vault_fee_rate = vault_fee_rate
+        self.referral_rebate_rate = referral_rebate_rate
+        self.keeper_gas_reward = keeper_gas_reward
+        self.other_position_value = other_position_value
+        self.other_square_value = other_square_value
+
+    def copy(self):
+        return PerpetualState(**self.__dict__)
+
+    def pool_margin(self, position, available_cash, slippage_factor):
+        """Returns the pool margin, or None if the AMM is unsafe."""
+        position_value = wmul(self.index_price, position)
+        margin = position_value + self.other_position_value + available_cash
+        tmp = wmul(position_value, position) * slippage_factor + self.other_square_value
+        before_sqrt = margin * margin - tmp * 2
+        if margin < 0 or before_sqrt < 0:
+            return None
+        return (isqrt(before_sqrt) + margin) // 2
+
+    def mid_price(self, pool_margin, position, slippage_factor):
+        return wmul(ONE - wfrac(wmul(self.index_price, position), slippage_factor, pool_margin), self.index_price)
+
+    def delta_cash(self, pool_margin, position_before, position_after, slippage_factor):
+        delta_cash = wfrac(_div(wmul(position_after + position_before, self.index_price), 2), slippage_factor, pool_margin)
+        delta_cash = ONE - delta_cash
+        return wmul(wmul(delta_cash, self.index_price), position_before - position_after)
+
+    def _amm_close(self, position, available_cash, amount):
+        if amount == 0:
+            return 0, 0
+        slippage_factor = self.close_slippage_factor
+        half_spread = self.half_spread if amount < 0 else -self.half_spread
+        pool_margin = self.pool_margin(position, available_cash, slippage_factor)
+        if pool_margin is not None:
+            if pool_margin <= 0:
+                raise TradeError("pool margin must be positive")
+            best_price = wmul(self.mid_price(pool_margin, position, slippage_factor), half_spread + ONE)
+            delta_cash = self.delta_cash(pool_margin, position, position + amount, slippage_factor)
+        else:
+            best_price = self.index_price
+            delta_cash = -wmul(best_price, amount)
+        price_limit = ONE + self.max_close_price_discount if amount > 0 else ONE - self.max_close_price_discount
+        delta_cash = max(delta_cash, -wmul(wmul(self.index_price, price_limit), amount))
+        return delta_cash, best_price
+
+    def _amm_open(self, position, available_cash, amount):
+        if amount == 0:
+            return 0, 0
+        slippage_factor = self.open_slippage_factor
+        pool_margin = self.pool_margin(position, available_cash, slippage_factor)
+        if pool_margin is None:
+            raise TradeError("AMM is unsafe when open")
+        if pool_margin <= 0:
+            raise TradeError("pool margin must be positive")
+        delta_cash = self.delta_cash(pool_margin, position, position + amount, slippage_factor)
+        half_spread = self.half_spread if amount < 0 else -self.half_spread
+        best_price = wmul(self.mid_price(pool_margin, position, slippage_factor), half_spread + ONE)
+        return delta_cash, best_price
+
+    def query_trade_with_amm(self, amount):
+        """Returns the AMM's (delta cash, delta position) when the AMM trades `amount`."""
+        if amount == 0:
+            raise TradeError("trading amount is zero")
+        close_position, open_position = split_amount(self.amm_position, amount)
+        delta_cash, close_best_price = self._amm_close(self.amm_position, self.available_cash, close_position)
+        open_delta_cash, open_best_price = self._amm_open(
+            self.amm_position + close_position, self.available_cash + delta_cash, open_position)
+        delta_cash += open_delta_cash
+        best_price = close_best_price if close_position != 0 else open_best_price
+        return max(delta_cash, -wmul(best_price, amount)), amount
+
+    def trade(self, amount):
+        """Trader buys `amount` (sells if negative) from the AMM at market price.
+
+        The arbitrage contract sets the trader as its own referrer, so the result is
+        (delta cash of the trader's margin account after fees, referral rebate paid
+        back to the trader's wallet).
+        """
+        delta_cash, delta_position = self.query_trade_with_amm(-amount)
+        trade_value = abs(delta_cash)
+        lp_fee = wmul(trade_value, self.lp_fee_rate)
+        operator_fee = wmul(trade_value, self.operator_fee_rate)
+        vault_fee = wmul(trade_value, self.vault_fee_rate)
+        total_fee = lp_fee + operator_fee + vault_fee
+        rebate = wmul(lp_fee + operator_fee, self.referral_rebate_rate)
+        return -delta_cash - total_fee, rebate
+
+    def effective_leverage(self, position, available_cash):
+        """Same as the effectiveLeverage of UniswapV3Arbitrage.accountInfo."""
+        margin = available_cash + wmul(position, self.mark_price)
+        if margin == self.keeper_gas_reward:
+            return 0 if position == 0 else MAX_EFFECTIVE_LEVERAGE
+        leverage = wfrac(abs(position), self.mark_price, margin - self.keeper_gas_reward)
+        return MAX_EFFECTIVE_LEVERAGE if leverage < 0 else leverage
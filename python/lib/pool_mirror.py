@@ -0,0 +1,94 @@
+import threading
+
+from .state_tracker import apply_pool_log
+from .uniswap_v3 import MAX_TICK, MIN_TICK, PoolState, SwapError, TickIndex
+
+
+class PoolMirror:
+    """Local copy of a Uniswap V3 pool, kept current from its Swap, Mint and Burn logs.
+
+    `load` reads slot0, the liquidity and every initialized tick once, then a
+    `StateTracker` feeds it the pool logs (`apply_log`) and the blocks they bring it
+    to (`set_block`). The ticks are kept in a `TickIndex`, so quotes and the pool
+    states handed to the simulator cost no RPC call. `uniswap_pool` is a
+    `contract.UniswapV3Pool`.
+    """
+
+    def __init__(self, uniswap_pool, chunk_size=256):
+        self.uniswap_pool = uniswap_pool
+        self.chunk_size = chunk_size
+        self.fee = uniswap_pool.fee()
+        self.tick_spacing = uniswap_pool.tick_spacing()
+        self.block_number = None
+        # (sqrtPriceX96, tick, liquidity, TickIndex), replaced as a whole
+        self.slot = None
+        self.lock = threading.Lock()
+
+    def load(self, block_number):
+        """Reads the pool at `block_number`, returns (sqrtPriceX96, tick, liquidity)."""
+        sqrt_price_x96, tick = self.uniswap_pool.slot0(block_number)[:2]
+        liquidity = self.uniswap_pool.liquidity(block_number)
+        net, gross = self.load_ticks(block_number)
+        with self.lock:
+            self.slot = (sqrt_price_x96, tick, liquidity, TickIndex(self.tick_spacing, net, gross))
+            self.block_number = block_number
+        return sqrt_price_x96, tick, liquidity
+
+    def load_ticks(self, block_number):
+        """Returns the liquidityNet and liquidityGross of every initialized tick."""
+        words = list(range((MIN_TICK // self.tick_spacing) >> 8, ((MAX_TICK // self.tick_spacing) >> 8) + 1))
+        ticks = []
+        for start in range(0, len(words), self.chunk_size):
+            chunk = words[start:start + self.chunk_size]
+            for word, bitmap in zip(chunk, self.uniswap_pool.tick_bitmap_batch(chunk, block_number)):
+                if isinstance(bitmap, Exception):
+                    raise bitmap
+                while bitmap != 0:
+                    bit = (bitmap & -bitmap).bit_length() - 1
+                    ticks.append((word * 256 + bit) * self.tick_spacing)
+                    bitmap &= bitmap - 1
+        net, gross = {}, {}
+        for start in range(0, len(ticks), self.chunk_size):
+            chunk = ticks[start:start + self.chunk_size]
+            for tick, info in zip(chunk, self.uniswap_pool.ticks_batch(chunk, block_number)):
+                if isinstance(info, Exception):
+                    raise info
+                gross[tick], net[tick] = info[0], info[1]
+        return net, gross
+
+    def apply_log(self, log):
+        with self.lock:
+            sqrt_price_x96, tick, liquidity, index = self.slot
+            sqrt_price_x96, tick, liquidity, change = apply_pool_log(log, sqrt_price_x96, tick, liquidity)
+            if change is not None and change[2] != 0:
+                tick_lower, tick_upper, delta = change
+                index = index.update(tick_lower, delta, False).update(tick_upper, delta, True)
+            self.slot = (sqrt_price_x96, tick, liquidity, index)
+
+    def set_block(self, block_number):
+        self.block_number = block_number
+
+    def state(self, block_number=None):
+        """Returns the `PoolState` at `block_number` (default the current one), None if not there."""
+        if self.slot is None or (block_number is not None and block_number != self.block_number):
+            return None
+        sqrt_price_x96, tick, liquidity, index = self.slot
+        return PoolState(sqrt_price_x96, tick, liquidity, self.fee, self.tick_spacing, index)
+
+    def quote_exact_input(self, zero_for_one, amount_in):
+        """Returns (amount out, sqrtPriceX96 after) of swapping `amount_in`."""
+        state = self._loaded_state()
+        amount_out = state.exact_input(zero_for_one, amount_in, commit=True)
+        return amount_out, state.sqrt_price_x96
+
+    def quote_exact_output(self, zero_for_one, amount_out):
+        """Returns (amount in, sqrtPriceX96 after) of receiving `amount_out`."""
+        state = self._loaded_state()
+        amount_in = state.exact_output(zero_for_one, amount_out, commit=True)
+        return amount_in, state.sqrt_price_x96
+
+    def _loaded_state(self):
+        state = self.state()
+        if state is None:
+            raise SwapError("pool not loaded")
+        return state
@@ -0,0 +1,294 @@
+"""Vectorized scan of the profit curves of profitOpen, profitClose and deleverageClose.
+
+Evaluates an `ArbitrageSimulator` snapshot on a whole array of amounts at once: the
+swap path through the Uniswap V3 ticks is walked once per direction with the exact
+integer math, the amounts are placed on it with `searchsorted` and finished with the
+closed form of a swap within one tick range; the MAI3 trade is closed form too once
+the pool margins are known. The curves are float64 and only used to rank the
+amounts, the best ones are evaluated again exactly (see `best_candidates`).
+
+NumPy is imported by the first call to `available`, not with the module.
+"""
+
+from .mai3 import MAX_EFFECTIVE_LEVERAGE, ONE, TradeError, wmul
+from .uniswap_v3 import (MAX_SQRT_RATIO, MAX_TICK, MIN_SQRT_RATIO, MIN_TICK, Q96, SwapError, compute_swap_step,
+                         get_sqrt_ratio_at_tick)
+
+# remaining amount of a swap step that always reaches the step's target
+_UNLIMITED = 2**200
+
+numpy = None
+_imported = False
+
+
+def available():
+    """Returns True if NumPy is installed, imports it the first time."""
+    global numpy, _imported
+    if not _imported:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy, _imported = module, True
+    return numpy is not None
+
+
+class Grid:
+    """`size` amounts evenly spread over the integer interval [begin, end], `xatol` apart
+    unless that needs more than `max_size` of them."""
+
+    def __init__(self, begin, end, xatol, max_size=10001):
+        self.begin, self.end = int(begin), int(end)
+        self.size = max(min(max_size, (self.end - self.begin) // max(int(xatol), 1) + 1), 2)
+
+    def amount(self, i):
+        """The exact integer amount at index `i`."""
+        return self.begin + (self.end - self.begin) * int(i) // (self.size - 1)
+
+    def array(self):
+        return numpy.linspace(float(self.begin), float(self.end), self.size)
+
+
+def scan(simulator, grid, max_leverage):
+    """Returns the profit at each amount (wad) of `grid` for "open", "close" and "deleverage".
+
+    The curves are float64 arrays, NaN where the simulator would raise.
+    """
+    assert available(), "numpy is not installed"
+    amounts = grid.array()
+    account = simulator.account
+    with numpy.errstate(all="ignore"):
+        tokens = numpy.floor(amounts / simulator.underlying_scale)
+        curves = {"open": _open(simulator, tokens)}
+        # close and deleverage trade the same way, they only differ in their checks
+        close, cash, position = _close(simulator, tokens)
+        close[amounts > -account.position] = numpy.nan
+        curves["close"] = close
+        deleverage = close.copy()
+        perpetual = simulator.perpetual
+        if max_leverage < simulator.target_leverage or \
+                perpetual.effective_leverage(account.position, account.available_cash) < max_leverage:
+            deleverage[:] = numpy.nan
+        else:
+            deleverage[_effective_leverage(perpetual, position, cash) > simulator.target_leverage] = numpy.nan
+        curves["deleverage"] = deleverage
+    for curve in curves.values():
+        curve[~numpy.isfinite(curve)] = numpy.nan
+    return curves
+
+
+def best_candidates(grid, profits, begin, end, count):
+    """Returns the `count` amounts of `grid` within [begin, end] of highest profit, best first."""
+    first = max(0, -(-(int(begin) - grid.begin) * (grid.size - 1) // max(grid.end - grid.begin, 1)))
+    indices = numpy.flatnonzero(~numpy.isnan(profits[first:])) + first
+    indices = [i for i in indices[numpy.argsort(-profits[indices], kind="stable")] if grid.amount(i) <= end]
+    return [grid.amount(i) for i in indices[:count]]
+
+
+def _open(simulator, tokens):
+    account = simulator.account
+    profits = numpy.full(len(tokens), numpy.nan)
+    if account.position > 0:
+        return profits
+    mcdex_amount = -tokens * simulator.underlying_scale
+    withdrawn = max(account.available_margin, 0)
+    wallet = account.collateral_balance + withdrawn
+    # collateral -> underlying asset
+    amount_in = _swap(simulator.pool, not simulator.underlying_is_token0, False, tokens) * simulator.collateral_scale
+    available_cash = account.available_cash - withdrawn + wallet - amount_in
+    delta_cash, rebate = _trade(simulator.perpetual, mcdex_amount)
+    available_cash = available_cash + delta_cash
+    position = account.position + mcdex_amount
+    amm_position = simulator.perpetual.amm_position - mcdex_amount
+    feasible = (tokens > 0) & (amount_in <= wallet)
+    # has_the_same_sign
+    feasible &= (position == 0) | (amm_position == 0) | ((position < 0) == (amm_position < 0))
+    feasible &= _effective_leverage(simulator.perpetual, position, available_cash) <= simulator.target_leverage
+    profits[feasible] = (available_cash + rebate - account.available_cash - account.collateral_balance)[feasible]
+    return profits
+
+
+def _close(simulator, tokens):
+    """Returns the profits, available cash and position after `close`."""
+    account = simulator.account
+    if account.position >= 0:
+        nan = numpy.full(len(tokens), numpy.nan)
+        return nan, nan, nan
+    mcdex_amount = tokens * simulator.underlying_scale
+    # underlying asset -> collateral
+    amount_out = _swap(simulator.pool, simulator.underlying_is_token0, True, tokens) * simulator.collateral_scale
+    available_cash = account.available_cash + account.collateral_balance + amount_out
+    delta_cash, rebate = _trade(simulator.perpetual, mcdex_amount)
+    available_cash = available_cash + delta_cash
+    profits = available_cash + rebate - account.available_cash - account.collateral_balance
+    profits[tokens <= 0] = numpy.nan
+    return profits, available_cash, account.position + mcdex_amount
+
+
+def _swap(pool, zero_for_one, exact_input, amounts):
+    """Amount out of exact input swaps, or amount in of exact output swaps, of `amounts`."""
+    result = numpy.full(len(amounts), numpy.nan)
+    if len(amounts) == 0:
+        return result
+    try:
+        specified, calculated, prices, liquidities, complete = _swap_path(
+            pool, zero_for_one, exact_input, int(numpy.nanmax(amounts)))
+    except SwapError:
+        return result
+    k = numpy.searchsorted(specified, amounts, side="right") - 1
+    remaining = amounts - specified[k]
+    sqrt_price = prices[k]
+    liquidity = liquidities[k]
+    fee_factor = (10**6 - pool.fee) / 10**6
+    if exact_input:
+        net = remaining * fee_factor
+        if zero_for_one:
+            next_price = liquidity * sqrt_price / (liquidity + net * sqrt_price)
+            step = liquidity * (sqrt_price - next_price)
+        else:
+            next_price = sqrt_price + net / liquidity
+            step = liquidity * (next_price - sqrt_price) / (sqrt_price * next_price)
+    else:
+        if zero_for_one:
+            next_price = sqrt_price - remaining / liquidity
+            step = liquidity * (sqrt_price - next_price) / (sqrt_price * next_price) / fee_factor
+        else:
+            next_price = liquidity * sqrt_price / (liquidity - remaining * sqrt_price)
+            step = liquidity * (next_price - sqrt_price) / fee_factor
+        # the price can't cross zero or infinity within a tick range
+        step[next_price <= 0] = numpy.nan
+    step[remaining == 0] = 0
+    result = calculated[k] + step
+    if not complete:
+        result[(k == len(specified) - 1) & (remaining > 0)] = numpy.nan
+    return result
+
+
+def _swap_path(pool, zero_for_one, exact_input, max_amount):
+    """Walks the swap from the current price until `max_amount` is specified.
+
+    Returns the cumulated specified and calculated amounts at each tick crossed, the
+    sqrt price (float, not X96) and liquidity of the range starting there, and
+    whether `max_amount` is reached before the price limit.
+    """
+    limit = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+    sqrt_price_x96, tick, liquidity = pool.sqrt_price_x96, pool.tick, pool.liquidity
+    specified, calculated, prices, liquidities = [0], [0], [sqrt_price_x96 / Q96], [liquidity]
+    while specified[-1] <= max_amount:
+        if sqrt_price_x96 == limit:
+            return _arrays(specified, calculated, prices, liquidities) + (False,)
+        tick_next, initialized = pool.next_initialized_tick_within_one_word(tick, zero_for_one)
+        tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+        sqrt_price_next = get_sqrt_ratio_at_tick(tick_next)
+        if (sqrt_price_next < limit) if zero_for_one else (sqrt_price_next > limit):
+            target = limit
+        else:
+            target = sqrt_price_next
+        remaining = _UNLIMITED if exact_input else -_UNLIMITED
+        sqrt_price_x96, amount_in, amount_out, fee_amount = compute_swap_step(
+            sqrt_price_x96, target, liquidity, remaining, pool.fee)
+        if sqrt_price_x96 == sqrt_price_next and initialized:
+            liquidity_net = pool.liquidity_net(tick_next)
+            liquidity += -liquidity_net if zero_for_one else liquidity_net
+            if liquidity < 0:
+                raise SwapError("LS")
+        tick = tick_next - 1 if zero_for_one else tick_next
+        if exact_input:
+            specified.append(specified[-1] + amount_in + fee_amount)
+            calculated.append(calculated[-1] + amount_out)
+        else:
+            specified.append(specified[-1] + amount_out)
+            calculated.append(calculated[-1] + amount_in + fee_amount)
+        prices.append(sqrt_price_x96 / Q96)
+        liquidities.append(liquidity)
+    return _arrays(specified, calculated, prices, liquidities) + (True,)
+
+
+def _arrays(*lists):
+    return tuple(numpy.asarray(values, dtype=numpy.float64) for values in lists)
+
+
+def _trade(perpetual, amount):
+    """Vectorized `PerpetualState.trade`, NaN where the AMM can't take the trade."""
+    amm_amount = -amount
+    sign = 1 if numpy.nansum(amm_amount) >= 0 else -1
+    amm_position, available_cash = perpetual.amm_position, perpetual.available_cash
+    if amm_position == 0 or (amm_position > 0) == (sign > 0):
+        close_amount = numpy.zeros(len(amount))
+        open_position, open_cash = amm_position, available_cash
+    else:
+        close_amount = numpy.where(numpy.abs(amm_amount) <= abs(amm_position), amm_amount, -amm_position)
+        # the open part only starts once the AMM position is closed
+        try:
+            full_close_cash, _ = perpetual._amm_close(amm_position, available_cash, -amm_position)
+        except TradeError:
+            return _nan(amount), _nan(amount)
+        open_position, open_cash = 0, available_cash + full_close_cash
+    open_amount = amm_amount - close_amount
+
+    delta_cash = numpy.zeros(len(amount))
+    best_price = numpy.zeros(len(amount))
+    if numpy.any(close_amount != 0):
+        close_delta_cash, close_best_price = _amm_close(perpetual, amm_position, available_cash, close_amount, sign)
+        delta_cash += close_delta_cash
+        best_price[close_amount != 0] = close_best_price
+    if numpy.any(open_amount != 0):
+        open_delta_cash, open_best_price = _amm_open(perpetual, open_position, open_cash, open_amount, sign)
+        delta_cash += numpy.where(open_amount != 0, open_delta_cash, 0)
+        best_price[close_amount == 0] = open_best_price
+    delta_cash = numpy.maximum(delta_cash, -best_price * amm_amount / ONE)
+    delta_cash[amm_amount == 0] = numpy.nan
+
+    trade_value = numpy.abs(delta_cash)
+    lp_fee = trade_value * perpetual.lp_fee_rate / ONE
+    operator_fee = trade_value * perpetual.operator_fee_rate / ONE
+    vault_fee = trade_value * perpetual.vault_fee_rate / ONE
+    rebate = (lp_fee + operator_fee) * perpetual.referral_rebate_rate / ONE
+    return -delta_cash - lp_fee - operator_fee - vault_fee, rebate
+
+
+def _amm_close(perpetual, position, available_cash, amount, sign):
+    slippage_factor = perpetual.close_slippage_factor
+    half_spread = perpetual.half_spread if sign < 0 else -perpetual.half_spread
+    pool_margin = perpetual.pool_margin(position, available_cash, slippage_factor)
+    index_price = perpetual.index_price
+    if pool_margin is None:
+        best_price = index_price
+        delta_cash = -index_price * amount / ONE
+    elif pool_margin <= 0:
+        return _nan(amount), 0
+    else:
+        best_price = wmul(perpetual.mid_price(pool_margin, position, slippage_factor), half_spread + ONE)
+        delta_cash = _delta_cash(index_price, pool_margin, position, amount, slippage_factor)
+    price_limit = ONE + perpetual.max_close_price_discount if sign > 0 else ONE - perpetual.max_close_price_discount
+    delta_cash = numpy.maximum(delta_cash, -(index_price * price_limit / ONE) * amount / ONE)
+    return numpy.where(amount != 0, delta_cash, 0), best_price
+
+
+def _amm_open(perpetual, position, available_cash, amount, sign):
+    slippage_factor = perpetual.open_slippage_factor
+    pool_margin = perpetual.pool_margin(position, available_cash, slippage_factor)
+    if pool_margin is None or pool_margin <= 0:
+        # unsafe AMM
+        return _nan(amount), 0
+    half_spread = perpetual.half_spread if sign < 0 else -perpetual.half_spread
+    best_price = wmul(perpetual.mid_price(pool_margin, position, slippage_factor), half_spread + ONE)
+    return _delta_cash(perpetual.index_price, pool_margin, position, amount, slippage_factor), best_price
+
+
+def _delta_cash(index_price, pool_margin, position, amount, slippage_factor):
+    """Vectorized `PerpetualState.delta_cash` from `position` to `position + amount`."""
+    position_after = position + amount
+    factor = ONE - (position_after + position) * index_price / ONE / 2 * slippage_factor / pool_margin
+    return factor * index_price / ONE * -amount / ONE
+
+
+def _effective_leverage(perpetual, position, available_cash):
+    margin = available_cash + position * perpetual.mark_price / ONE - perpetual.keeper_gas_reward
+    leverage = numpy.abs(position) * perpetual.mark_price / margin
+    leverage = numpy.where(margin == 0, numpy.where(position == 0, 0.0, float(MAX_EFFECTIVE_LEVERAGE)), leverage)
+    return numpy.where(leverage < 0, float(MAX_EFFECTIVE_LEVERAGE), leverage)
+
+
+def _nan(amount):
+    return numpy.full(len(amount), numpy.nan)
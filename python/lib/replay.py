@@ -0,0 +1,231 @@
+"""Recording of the JSON-RPC traffic of a live run, and replaying it without a node.
+
+A recording is a gzipped JSON lines file. Each line is
+[block, method, params, result, error]: the reply to one request, with `block` the
+latest block number seen when it was made (None before the first). Requests on
+'latest' are looked up by the block, requests pinned to a block number by their
+params.
+"""
+import bisect
+import gzip
+import json
+import threading
+
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import HTTPProvider
+from web3.providers.base import BaseProvider
+
+from .rpc import AsyncRPC, BatchCaller
+
+
+RECORDING_VERSION = 1
+# requests a replay answers by itself
+_NOT_RECORDED = {"eth_newBlockFilter", "eth_newFilter", "eth_getFilterChanges", "eth_uninstallFilter",
+                 "eth_sendRawTransaction"}
+
+
+class Recorder:
+    """Appends the replies of the requests made through its transports to a recording."""
+
+    def __init__(self, path, flush_every=1000):
+        self.file = gzip.open(path, "wt")
+        self.file.write(json.dumps({"version": RECORDING_VERSION}) + "\n")
+        self.flush_every = flush_every
+        self.block_number = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def record(self, method, params, reply):
+        if method in _NOT_RECORDED:
+            return
+        result, error = reply.get("result"), reply.get("error")
+        with self.lock:
+            if method == "eth_blockNumber" and result is not None:
+                self.block_number = int(result, 16)
+            self.file.write(json.dumps([self.block_number, method, params, result, error], default=_json_default) + "\n")
+            self.count += 1
+            if self.count % self.flush_every == 0:
+                self.file.flush()
+
+    def record_batch(self, payload, replies):
+        if isinstance(replies, dict):
+            return
+        by_id = {reply.get("id"): reply for reply in replies}
+        for request in payload:
+            reply = by_id.get(request["id"])
+            if reply is not None:
+                self.record(request["method"], request["params"], reply)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class RecordingHTTPProvider(HTTPProvider):
+    """HTTPProvider that records its replies, its batch callers record too."""
+
+    def __init__(self, endpoint_uri, recorder: Recorder, **kwargs):
+        super().__init__(endpoint_uri, **kwargs)
+        self.recorder = recorder
+
+    def make_request(self, method, params):
+        response = super().make_request(method, params)
+        self.recorder.record(method, params, response)
+        return response
+
+    def batch_caller(self):
+        return BatchCaller(self.endpoint_uri, recorder=self.recorder)
+
+
+class Replay:
+    """Answers JSON-RPC requests from a recording, as of the current replay block.
+
+    A request is answered with the last reply recorded for the same method and params
+    at or before the current block, or the first one recorded after it. Transactions
+    are accepted without being executed and get a successful receipt. Other requests
+    that were not recorded go to `fallback(method, params)` if set, which returns
+    a reply dict or None.
+    """
+
+    def __init__(self, path, fallback=None):
+        self.replies = {}
+        blocks = set()
+        with gzip.open(path, "rt") as file:
+            header = json.loads(file.readline())
+            assert header.get("version") == RECORDING_VERSION, "unsupported recording"
+            try:
+                for line in file:
+                    block, method, params, result, error = json.loads(line)
+                    self.replies.setdefault(_key(method, params), []).append((-1 if block is None else block, result, error))
+                    if block is not None:
+                        blocks.add(block)
+            except (EOFError, json.JSONDecodeError):
+                # the recording process was killed, keep what was flushed
+                pass
+        for key, replies in self.replies.items():
+            # stable, so the last reply of a block wins
+            replies.sort(key=lambda reply: reply[0])
+            self.replies[key] = ([reply[0] for reply in replies], replies)
+        self.blocks = sorted(blocks)
+        self.block_number = self.blocks[0] if len(self.blocks) > 0 else 0
+        self.fallback = fallback
+        self.sent = []
+        self.receipts = {}
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def set_block(self, block_number):
+        self.block_number = block_number
+
+    def respond(self, method, params):
+        """Returns the reply to a request, a dict with either "result" or "error"."""
+        if method == "eth_blockNumber":
+            return {"result": hex(self.block_number)}
+        if method == "eth_sendRawTransaction":
+            return {"result": self._send(params[0])}
+        if method == "eth_getTransactionReceipt" and params[0] in self.receipts:
+            return {"result": self.receipts[params[0]]}
+        key = _key(method, params)
+        if key in self.replies:
+            blocks, replies = self.replies[key]
+            _, result, error = replies[max(bisect.bisect_right(blocks, self.block_number) - 1, 0)]
+            return {"error": error} if error is not None else {"result": result}
+        with self.lock:
+            self.misses += 1
+        if self.fallback is not None:
+            reply = self.fallback(method, params)
+            if reply is not None:
+                return reply
+        return _default_reply(self, method, params)
+
+    def _send(self, raw_transaction):
+        tx_hash = HexBytes(keccak(HexBytes(raw_transaction))).hex()
+        with self.lock:
+            self.sent.append((self.block_number, tx_hash))
+            self.receipts[tx_hash] = {
+                "transactionHash": tx_hash, "blockNumber": hex(self.block_number), "status": "0x1",
+                "gasUsed": "0x0", "logs": [], "returnData": "0x0"}
+        return tx_hash
+
+
+class ReplayProvider(BaseProvider):
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self._ids = 0
+
+    def make_request(self, method, params):
+        self._ids += 1
+        return dict(self.replay.respond(method, params), jsonrpc="2.0", id=self._ids)
+
+    def isConnected(self):
+        return True
+
+    def batch_caller(self):
+        return ReplayBatchCaller(self.replay)
+
+
+class ReplayBatchCaller(BatchCaller):
+    def __init__(self, replay: Replay):
+        super().__init__(None)
+        self.replay = replay
+
+    def _post(self, payload):
+        return _replay_payload(self.replay, payload)
+
+
+class ReplayRPC(AsyncRPC):
+    def __init__(self, replay: Replay):
+        super().__init__(None)
+        self.replay = replay
+
+    async def _post(self, payload):
+        return _replay_payload(self.replay, payload)
+
+    async def close(self):
+        pass
+
+
+class ReplayFeed:
+    """Block feed over the blocks of a replay, moving the replay along."""
+
+    def __init__(self, replay: Replay, blocks=None):
+        self.replay = replay
+        self.blocks = replay.blocks if blocks is None else blocks
+
+    def __aiter__(self):
+        return self._blocks()
+
+    async def _blocks(self):
+        for block_number in self.blocks:
+            self.replay.set_block(block_number)
+            yield block_number
+
+
+def _replay_payload(replay, payload):
+    if isinstance(payload, dict):
+        return dict(replay.respond(payload["method"], payload["params"]), jsonrpc="2.0", id=payload["id"])
+    return [dict(replay.respond(request["method"], request["params"]), jsonrpc="2.0", id=request["id"])
+            for request in payload]
+
+
+def _default_reply(replay, method, params):
+    if method == "eth_getTransactionCount":
+        return {"result": hex(len(replay.sent))}
+    if method == "eth_getTransactionReceipt":
+        return {"result": None}
+    if method == "eth_estimateGas":
+        return {"result": hex(2000000)}
+    if method in ("eth_gasPrice", "eth_maxPriorityFeePerGas"):
+        return {"result": hex(10**9)}
+    return {"error": {"code": -32000, "message": f"{method} not recorded"}}
+
+
+def _key(method, params):
+    return method + json.dumps(params, sort_keys=True, default=_json_default)
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return HexBytes(value).hex()
+    raise TypeError(f"{type(value)} is not JSON serializable")
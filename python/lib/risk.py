@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+
+class RiskGuard:
+    """Runs the risk checks of markets on every block of a feed, next to the strategies.
+
+    A strategy can take several blocks to search and send, the risk checks don't
+    wait for it: on each new block `market.risk_check(block_number)` is awaited for
+    all the markets at once. `feed` iterates over the block numbers, e.g.
+    `BlockFeed.subscribe()` next to the strategies' iteration of the same feed,
+    which coalesces the blocks mined meanwhile. The markets added leave the risk
+    actions out of their strategies, their `risk_guard` is set.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, feed, markets=(), logger=None):
+        if logger is not None:
+            self.logger = logger
+        self.feed = feed
+        self.markets = []
+        for market in markets:
+            self.add(market)
+
+    def add(self, market):
+        market.risk_guard = self
+        self.markets.append(market)
+
+    async def run(self):
+        async for block_number in self.feed:
+            await self.run_block(block_number)
+
+    async def run_block(self, block_number):
+        results = await asyncio.gather(
+            *[market.risk_check(block_number) for market in self.markets], return_exceptions=True)
+        for market, result in zip(self.markets, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"[risk] {market.name} block {block_number} error:{result}")
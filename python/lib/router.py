@@ -0,0 +1,342 @@
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+import time
+
+import aiohttp
+import requests
+from web3 import HTTPProvider
+
+from . import metrics
+from .rpc import AsyncRPC, BatchCaller, RPCError
+
+
+ENDPOINT_SECONDS = metrics.histogram(
+    "arbitrage_rpc_endpoint_seconds", "Duration of the requests sent to each node by the router.", ["endpoint", "outcome"])
+
+# position of the block parameter of the reads pinned to the block of the strategy
+PINNED_PARAMS = {"eth_call": 1, "eth_getBalance": 1, "eth_getCode": 1, "eth_getStorageAt": 2}
+# filters live on the node that installed them
+STICKY_METHODS = {"eth_newFilter", "eth_newBlockFilter", "eth_getFilterChanges", "eth_getFilterLogs", "eth_uninstallFilter"}
+# sent to one node at a time, never hedged
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+# replies of a node that hasn't got the pinned block yet
+BEHIND_ERRORS = ("header not found", "unknown block", "missing trie node")
+
+
+class Endpoint:
+    """Latency and error rate of a node, as moving averages."""
+
+    def __init__(self, uri, alpha=0.2):
+        self.uri = uri
+        self.alpha = alpha
+        # None until the first reply, untried nodes go first
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.down_until = 0
+
+    def score(self):
+        return (self.latency or 0) * (1 + 10 * self.error_rate)
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def succeeded(self, seconds):
+        self.observe(seconds)
+        self.error_rate -= self.alpha * self.error_rate
+        self.failures = 0
+
+    def failed(self, seconds, max_failures, cooldown):
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        self.slower(seconds)
+        self.failures += 1
+        if self.failures >= max_failures:
+            self.down_until = time.monotonic() + cooldown
+
+    def slower(self, seconds):
+        """A request without reply took at least `seconds`."""
+        if self.latency is None or seconds > self.latency:
+            self.observe(seconds)
+
+    def observe(self, seconds):
+        self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+
+
+class RPCRouter:
+    """Sends the JSON-RPC requests of the bot to the fastest healthy of several nodes.
+
+    Requests go to the node with the best latency, weighted by its error rate. When
+    it hasn't answered after `hedge_factor` times its usual latency (at least
+    `min_hedge` seconds) the request is sent to the next node too, the first reply
+    wins. A node failing is replaced by the next one, and after `max_failures` in a
+    row it rests for `cooldown` seconds. `set_block` pins the reads sent with the
+    'latest' tag to that block, so that all the calls of a block see the same state
+    whichever node serves them; a node that hasn't got the block yet counts as failing.
+    Filters are kept on one node. Transactions are not hedged, they only go to the
+    next node when the one sending them failed.
+
+    `provider()` and `rpc()` are the web3 provider and the `AsyncRPC` going through
+    the router.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, endpoint_uris, hedge_factor=3, min_hedge=0.05, max_failures=3, cooldown=10, timeout=30, logger=None):
+        assert len(endpoint_uris) > 0, "no endpoint"
+        if logger is not None:
+            self.logger = logger
+        self.endpoints = [Endpoint(uri) for uri in endpoint_uris]
+        self.hedge_factor = hedge_factor
+        self.min_hedge = min_hedge
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.timeout = timeout
+        self.pool_size = 16
+        self.block_tag = None
+        self.sticky = None
+        self.lock = threading.Lock()
+        # requests sessions aren't thread safe, each thread of the pool has its own
+        self.local = threading.local()
+        self.async_sessions = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4 * len(self.endpoints), thread_name_prefix="router")
+
+    def set_block(self, block_number):
+        self.block_tag = hex(block_number)
+
+    def provider(self):
+        return RouterProvider(self)
+
+    def rpc(self, pool_size=16):
+        return RouterRPC(self, pool_size)
+
+    def ranked(self, payload):
+        """Returns the endpoints to try for `payload`, in order."""
+        now = time.monotonic()
+        with self.lock:
+            if _methods(payload) & STICKY_METHODS:
+                if self.sticky is None or not self.sticky.healthy(now):
+                    self.sticky = min(self.endpoints, key=lambda endpoint: (not endpoint.healthy(now), endpoint.score()))
+                return [self.sticky]
+            healthy = sorted((endpoint for endpoint in self.endpoints if endpoint.healthy(now)), key=Endpoint.score)
+            # every node down, try them anyway
+            return healthy or sorted(self.endpoints, key=Endpoint.score)
+
+    def pin(self, payload):
+        """Returns `payload` with the reads at 'latest' pinned to the block."""
+        block_tag = self.block_tag
+        if block_tag is None:
+            return payload
+
+        def pinned(request):
+            index = PINNED_PARAMS.get(request["method"])
+            params = request["params"]
+            if index is None:
+                return request
+            if len(params) == index:
+                params = list(params) + [block_tag]
+            elif params[index] == "latest":
+                params = list(params)
+                params[index] = block_tag
+            else:
+                return request
+            return dict(request, params=params)
+        if isinstance(payload, list):
+            return [pinned(request) for request in payload]
+        return pinned(payload)
+
+    def hedges(self, payload):
+        return not (_methods(payload) & WRITE_METHODS)
+
+    def hedge_delay(self, endpoint):
+        return max(self.min_hedge, self.hedge_factor * (endpoint.latency or 0))
+
+    def record(self, endpoint, seconds, error):
+        with self.lock:
+            if error is None:
+                endpoint.succeeded(seconds)
+            else:
+                endpoint.failed(seconds, self.max_failures, self.cooldown)
+                if endpoint is self.sticky:
+                    self.sticky = None
+        ENDPOINT_SECONDS.observe(seconds, endpoint=endpoint.uri, outcome="ok" if error is None else "error")
+        if error is not None:
+            self.logger.warning(f"[router] {endpoint.uri} error:{error}")
+
+    def post(self, payload):
+        """Sends `payload` and returns the reply, blocking."""
+        payload = self.pin(payload)
+        endpoints = self.ranked(payload)
+        candidates = iter(endpoints)
+        sent = []
+        futures = {}
+
+        def send(endpoint):
+            sent.append(endpoint)
+            futures[self.executor.submit(self._post, endpoint, payload)] = endpoint
+
+        send(next(candidates))
+        error = None
+        hedges = self.hedges(payload)
+        while len(futures) > 0:
+            hedge = hedges and len(futures) == 1 and len(sent) < len(endpoints)
+            done, _ = concurrent.futures.wait(
+                futures, timeout=self.hedge_delay(sent[-1]) if hedge else None,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            if len(done) == 0:
+                send(next(candidates))
+                continue
+            for future in done:
+                del futures[future]
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            if len(futures) == 0:
+                endpoint = next(candidates, None)
+                if endpoint is not None:
+                    send(endpoint)
+        raise error
+
+    async def post_async(self, payload):
+        """Sends `payload` and returns the reply."""
+        payload = self.pin(payload)
+        endpoints = self.ranked(payload)
+        candidates = iter(endpoints)
+        sent = []
+        tasks = {}
+
+        def send(endpoint):
+            sent.append(endpoint)
+            tasks[asyncio.ensure_future(self._post_async(endpoint, payload))] = endpoint
+
+        send(next(candidates))
+        error = None
+        hedges = self.hedges(payload)
+        try:
+            while len(tasks) > 0:
+                hedge = hedges and len(tasks) == 1 and len(sent) < len(endpoints)
+                done, _ = await asyncio.wait(
+                    tasks, timeout=self.hedge_delay(sent[-1]) if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if len(done) == 0:
+                    send(next(candidates))
+                    continue
+                for task in done:
+                    del tasks[task]
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        error = e
+                if len(tasks) == 0:
+                    endpoint = next(candidates, None)
+                    if endpoint is not None:
+                        send(endpoint)
+            raise error
+        finally:
+            # the slower requests of a hedge are dropped
+            for task in tasks:
+                task.cancel()
+
+    def _post(self, endpoint, payload):
+        sessions = getattr(self.local, "sessions", None)
+        if sessions is None:
+            sessions = self.local.sessions = {}
+        session = sessions.get(endpoint.uri)
+        if session is None:
+            session = sessions[endpoint.uri] = requests.Session()
+        started = time.perf_counter()
+        try:
+            response = session.post(endpoint.uri, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            reply = response.json()
+            _check_behind(reply)
+        except Exception as e:
+            self.record(endpoint, time.perf_counter() - started, e)
+            raise
+        self.record(endpoint, time.perf_counter() - started, None)
+        return reply
+
+    async def _post_async(self, endpoint, payload):
+        started = time.perf_counter()
+        try:
+            async with self._session(endpoint).post(endpoint.uri, json=payload) as response:
+                response.raise_for_status()
+                reply = await response.json(content_type=None)
+            _check_behind(reply)
+        except asyncio.CancelledError:
+            with self.lock:
+                endpoint.slower(time.perf_counter() - started)
+            raise
+        except Exception as e:
+            self.record(endpoint, time.perf_counter() - started, e)
+            raise
+        self.record(endpoint, time.perf_counter() - started, None)
+        return reply
+
+    def _session(self, endpoint):
+        session = self.async_sessions.get(endpoint.uri)
+        if session is None or session.closed:
+            session = self.async_sessions[endpoint.uri] = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return session
+
+    async def close(self):
+        for session in self.async_sessions.values():
+            await session.close()
+
+
+class RouterProvider(HTTPProvider):
+    """web3 provider sending its requests through an `RPCRouter`."""
+
+    def __init__(self, router: RPCRouter):
+        super().__init__(router.endpoints[0].uri)
+        self.router = router
+        self._ids = itertools.count()
+
+    def make_request(self, method, params):
+        return self.router.post({"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params})
+
+    def batch_caller(self):
+        return RouterBatchCaller(self.router)
+
+
+class RouterBatchCaller(BatchCaller):
+    def __init__(self, router: RPCRouter):
+        super().__init__(router.endpoints[0].uri)
+        self.router = router
+
+    def _post(self, payload):
+        return self.router.post(payload)
+
+
+class RouterRPC(AsyncRPC):
+    """`AsyncRPC` sending its requests through an `RPCRouter`."""
+
+    def __init__(self, router: RPCRouter, pool_size=16):
+        super().__init__(router.endpoints[0].uri, pool_size=pool_size, timeout=router.timeout)
+        self.router = router
+        router.pool_size = pool_size
+
+    async def _post(self, payload):
+        return await self.router.post_async(payload)
+
+    async def close(self):
+        await self.router.close()
+
+
+def _methods(payload):
+    return {request["method"] for request in payload} if isinstance(payload, list) else {payload["method"]}
+
+
+def _check_behind(reply):
+    """Raises if the node didn't have the block asked for."""
+    replies = reply if isinstance(reply, list) else [reply]
+    for item in replies:
+        error = item.get("error") if isinstance(item, dict) else None
+        if error is not None and any(message in str(error.get("message", "")).lower() for message in BEHIND_ERRORS):
+            raise RPCError(error)
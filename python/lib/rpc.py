@@ -0,0 +1,135 @@
+import aiohttp
+import itertools
+import requests
+
+
+class RPCError(Exception):
+    def __init__(self, error):
+        self.code = error.get("code")
+        self.data = error.get("data")
+        super().__init__(error.get("message", str(error)))
+
+
+class BatchCaller:
+    """Sends many eth_calls to a node as a single JSON-RPC batch request.
+
+    All calls of a batch are pinned to the same block so that the results are
+    comparable with each other, no matter which backend of the node serves them.
+    """
+
+    def __init__(self, endpoint_uri, timeout=30, recorder=None):
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout
+        self.recorder = recorder
+        self.session = requests.Session()
+        self._ids = itertools.count()
+
+    def call(self, transactions, block_identifier='latest'):
+        """Returns the raw results of `transactions`, failed calls are returned as `RPCError`."""
+        block_identifier = _block_tag(block_identifier)
+        payload = _batch_payload(self._ids, [("eth_call", [tx, block_identifier]) for tx in transactions])
+        if len(payload) == 0:
+            return []
+        replies = self._post(payload)
+        if self.recorder is not None:
+            self.recorder.record_batch(payload, replies)
+        return _batch_results(payload, replies)
+
+    def _post(self, payload):
+        response = self.session.post(
+            self.endpoint_uri, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class AsyncRPC:
+    """JSON-RPC client on a keep-alive aiohttp connection pool.
+
+    The session is created lazily so it binds to the running event loop.
+    """
+
+    def __init__(self, endpoint_uri, pool_size=16, timeout=30, recorder=None):
+        self.endpoint_uri = endpoint_uri
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.recorder = recorder
+        self.session = None
+        self._ids = itertools.count()
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def _post(self, payload):
+        async with self._session().post(self.endpoint_uri, json=payload) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def request(self, method, params):
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+        reply = await self._post(payload)
+        if self.recorder is not None:
+            self.recorder.record(method, params, reply)
+        if "error" in reply:
+            raise RPCError(reply["error"])
+        return reply["result"]
+
+    async def batch(self, requests):
+        """Sends [(method, params)] as one batch, failed requests are returned as `RPCError`."""
+        payload = _batch_payload(self._ids, requests)
+        if len(payload) == 0:
+            return []
+        replies = await self._post(payload)
+        if self.recorder is not None:
+            self.recorder.record_batch(payload, replies)
+        return _batch_results(payload, replies)
+
+    async def call(self, transaction, block_identifier='latest'):
+        return await self.request("eth_call", [transaction, _block_tag(block_identifier)])
+
+    async def call_batch(self, transactions, block_identifier='latest'):
+        block_identifier = _block_tag(block_identifier)
+        return await self.batch([("eth_call", [tx, block_identifier]) for tx in transactions])
+
+    async def block_number(self):
+        return int(await self.request("eth_blockNumber", []), 16)
+
+
+def batch_caller(provider):
+    """Returns the `BatchCaller` to use next to a web3 provider, which may bring its own."""
+    if hasattr(provider, "batch_caller"):
+        return provider.batch_caller()
+    return BatchCaller(provider.endpoint_uri)
+
+
+def _block_tag(block_identifier):
+    return hex(block_identifier) if isinstance(block_identifier, int) else block_identifier
+
+
+def _batch_payload(ids, requests):
+    return [{"jsonrpc": "2.0", "id": next(ids), "method": method, "params": params}
+            for method, params in requests]
+
+
+def _batch_results(payload, replies):
+    if isinstance(replies, dict):
+        # the whole batch is rejected
+        raise RPCError(replies.get("error", replies))
+    by_id = {reply["id"]: reply for reply in replies}
+    results = []
+    for request in payload:
+        reply = by_id.get(request["id"])
+        if reply is None:
+            results.append(RPCError({"message": "missing reply"}))
+        elif "error" in reply:
+            results.append(RPCError(reply["error"]))
+        else:
+            results.append(reply["result"])
+    return results
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+
+
+class Task:
+    def __init__(self, name, func, state_key=None):
+        self.name = name
+        self.func = func
+        self.state_key = state_key
+        self.last_block = None
+        self.last_state = None
+
+
+class BlockScheduler:
+    """Runs tasks once per new block of a `BlockFeed`.
+
+    Tasks are functions taking the block number, they run one after another;
+    blocking functions run in the default executor, coroutine functions on the
+    loop. A task with a `state_key` function is skipped while the key it returns
+    is unchanged since the task last ran; a key of None never matches. Key
+    functions shared by several tasks are evaluated once per block.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, feed, logger=None):
+        if logger is not None:
+            self.logger = logger
+        self.feed = feed
+        self.tasks = []
+
+    def add(self, name, func, state_key=None):
+        self.tasks.append(Task(name, func, state_key))
+
+    async def run(self):
+        async for block_number in self.feed:
+            await self.run_block(block_number)
+
+    async def run_block(self, block_number):
+        loop = asyncio.get_event_loop()
+        states = {}
+        for task in self.tasks:
+            if task.last_block == block_number:
+                continue
+            state = None
+            if task.state_key is not None:
+                try:
+                    if task.state_key not in states:
+                        states[task.state_key] = await loop.run_in_executor(None, task.state_key, block_number)
+                    state = states[task.state_key]
+                except Exception as e:
+                    self.logger.error(f"[scheduler] {task.name} state error:{e}")
+                    continue
+                if state is not None and state == task.last_state:
+                    continue
+            try:
+                if asyncio.iscoroutinefunction(task.func):
+                    await task.func(block_number)
+                else:
+                    await loop.run_in_executor(None, task.func, block_number)
+            except Exception as e:
+                self.logger.error(f"[scheduler] {task.name} error:{e}")
+                continue
+            task.last_block = block_number
+            task.last_state = state
@@ -0,0 +1,231 @@
+from collections import namedtuple
+
+
+# x and cost are None when no candidate was feasible, evaluations counts the distinct candidates
+SearchResult = namedtuple("SearchResult", ["x", "cost", "evaluations"])
+
+# golden-section step (3 - sqrt(5)) / 2, as a fraction so the search stays on integers
+_CGOLD_NUM, _CGOLD_DEN = 381966011250105, 10**15
+
+
+def grid_search(begin, end, xatol, grid_size):
+    """Zooming grid search over the integer interval [begin, end].
+
+    This is a generator: it yields lists of candidate amounts and expects the list
+    of their costs to be sent back, so the caller decides how a whole grid gets
+    evaluated (e.g. in one batch request). A cost of None marks a candidate that
+    reverts. After each grid the interval shrinks to the neighbours of the best
+    feasible candidate, until it is narrower than `xatol`.
+    Returns a SearchResult.
+    """
+    assert grid_size >= 3, "grid size too small"
+    begin, end = int(begin), int(end)
+    best_x, best_cost, evaluations = None, None, 0
+    while True:
+        xs = _grid(begin, end, grid_size)
+        costs = yield xs
+        assert len(costs) == len(xs)
+        evaluations += len(xs)
+        feasible = [k for k in range(len(xs)) if costs[k] is not None]
+        if len(feasible) == 0:
+            return SearchResult(best_x, best_cost, evaluations)
+        i = min(feasible, key=lambda k: costs[k])
+        if best_cost is None or costs[i] < best_cost:
+            best_x, best_cost = xs[i], costs[i]
+        begin, end = xs[max(i - 1, 0)], xs[min(i + 1, len(xs) - 1)]
+        if end - begin <= max(xatol, len(xs) - 1):
+            return SearchResult(best_x, best_cost, evaluations)
+
+
+def integer_search(begin, end, xatol, grid_size=3, max_grid_size=33, guess=None, width=None):
+    """Integer search for the minimum cost over [begin, end], down to `xatol`.
+
+    Same protocol as `grid_search`. A coarse grid of `grid_size` candidates brackets
+    the best feasible amount, it is refined up to `max_grid_size` candidates while
+    all of them revert. Then Brent's method (golden-section steps, parabolic
+    steps when the curve allows) refines the bracket one candidate at a time, on
+    integers and never closer than `xatol` to a known amount.
+
+    The feasible amounts are assumed to be one interval and the cost unimodal on it,
+    which is what the arbitrage profit curves look like. So a candidate that reverts
+    bounds the bracket like a worse one: everything beyond it reverts too.
+
+    With a `guess`, e.g. the optimum of the previous block, the bracket starts as
+    [guess - width, guess + width] and grows downhill instead of the coarse grid,
+    which is only used if all of it reverts.
+    """
+    assert grid_size >= 3, "grid size too small"
+    begin, end = int(begin), int(end)
+    # ends with the optimum within 2 * tol = xatol of x
+    tol = max(int(xatol) // 2, 1)
+    memo = {}
+
+    feasible = []
+    if guess is not None:
+        guess = min(max(int(guess), begin), end)
+        xs, costs = yield from _expand(memo, begin, end, guess, max(int(width or xatol), 1))
+        feasible = [k for k in range(len(xs)) if costs[k] is not None]
+    if len(feasible) == 0:
+        xs = _grid(begin, end, grid_size)
+        while True:
+            costs = yield from _evaluate(memo, xs)
+            feasible = [k for k in range(len(xs)) if costs[k] is not None]
+            if len(feasible) > 0:
+                break
+            if len(xs) >= max_grid_size or len(xs) > end - begin:
+                return SearchResult(None, None, len(memo))
+            # all revert, look between the candidates
+            xs = _grid(begin, end, 2 * len(xs) - 1)
+    i = min(feasible, key=lambda k: costs[k])
+    a, b = xs[max(i - 1, 0)], xs[min(i + 1, len(xs) - 1)]
+    x, fx = xs[i], costs[i]
+    # the feasible neighbours seed the parabola
+    w, fw, v, fv = x, fx, x, fx
+    for k in (i - 1, i + 1):
+        if 0 <= k < len(xs) and costs[k] is not None:
+            v, fv, w, fw = w, fw, xs[k], costs[k]
+    # allow a parabolic step right away, the grid already gives three points
+    d = e = b - a
+    while 2 * max(x - a, b - x) > 4 * tol:
+        middle = (a + b) // 2
+        golden = True
+        if abs(e) > tol and len({x, w, v}) == 3:
+            r = (x - w) * (fx - fv)
+            q = (x - v) * (fx - fw)
+            p = (x - v) * q - (x - w) * r
+            q = 2 * (q - r)
+            if q > 0:
+                p = -p
+            q = abs(q)
+            previous_e, e = e, d
+            if 2 * abs(p) < abs(q * previous_e) and q * (a - x) < p < q * (b - x):
+                d = p // q
+                u = x + d
+                if u - a < 2 * tol or b - u < 2 * tol:
+                    d = tol if x < middle else -tol
+                golden = False
+        if golden:
+            e = a - x if x >= middle else b - x
+            d = e * _CGOLD_NUM // _CGOLD_DEN
+        if abs(d) < tol:
+            d = tol if d >= 0 else -tol
+        u = x + d
+
+        fu, = yield from _evaluate(memo, [u])
+        if fu is not None and fu <= fx:
+            if u >= x:
+                a = x
+            else:
+                b = x
+            v, fv, w, fw, x, fx = w, fw, x, fx, u, fu
+        else:
+            if u < x:
+                a = u
+            else:
+                b = u
+            if fu is None:
+                continue
+            if fu <= fw or w == x:
+                v, fv, w, fw = w, fw, u, fu
+            elif fu <= fv or v == x or v == w:
+                v, fv = u, fu
+    return SearchResult(x, fx, len(memo))
+
+
+def _expand(memo, begin, end, guess, width):
+    """Brackets the best amount starting around `guess`, doubling the step downhill.
+
+    Returns the sorted candidates and their costs, either the best feasible one is
+    inside or at an end of [begin, end], or none is feasible.
+    """
+    xs = sorted({max(begin, guess - width), guess, min(end, guess + width)})
+    costs = yield from _evaluate(memo, xs)
+    step = width
+    while True:
+        feasible = [k for k in range(len(xs)) if costs[k] is not None]
+        if len(feasible) == 0:
+            return xs, costs
+        i = min(feasible, key=lambda k: costs[k])
+        step *= 2
+        if i == 0 and xs[0] > begin:
+            x = max(begin, xs[0] - step)
+            cost, = yield from _evaluate(memo, [x])
+            xs.insert(0, x)
+            costs.insert(0, cost)
+        elif i == len(xs) - 1 and xs[-1] < end:
+            x = min(end, xs[-1] + step)
+            cost, = yield from _evaluate(memo, [x])
+            xs.append(x)
+            costs.append(cost)
+        else:
+            return xs, costs
+
+
+class WarmStart:
+    """Remembers the last optimum of each search, to start the next one around it.
+
+    The bracket half-width is how far the optimum moved between the last two
+    searches, at least `xatol`, so a steady optimum is confirmed with three
+    evaluations and a drifting one is bracketed without growing the step much.
+    """
+
+    def __init__(self):
+        self.optimums = {}
+
+    def guess(self, key, begin, end, xatol):
+        """Returns (guess, width) for `integer_search`, (None, None) without a previous optimum."""
+        if key not in self.optimums:
+            return None, None
+        x, shift = self.optimums[key]
+        if not begin <= x <= end:
+            return min(max(x, begin), end), max(shift, xatol, abs(end - begin) // 8)
+        return x, max(shift, xatol)
+
+    def update(self, key, x):
+        if x is None:
+            self.optimums.pop(key, None)
+            return
+        shift = abs(x - self.optimums[key][0]) if key in self.optimums else 0
+        self.optimums[key] = (x, shift)
+
+    def forget(self, key=None):
+        if key is None:
+            self.optimums.clear()
+        else:
+            self.optimums.pop(key, None)
+
+
+def _grid(begin, end, size):
+    if end - begin < size:
+        return list(range(begin, end + 1))
+    return [begin + (end - begin) * k // (size - 1) for k in range(size)]
+
+
+def _evaluate(memo, xs):
+    """Asks for the costs of the amounts of `xs` not in `memo` yet."""
+    missing = [x for x in dict.fromkeys(xs) if x not in memo]
+    if len(missing) > 0:
+        costs = yield missing
+        assert len(costs) == len(missing)
+        memo.update(zip(missing, costs))
+    return [memo[x] for x in xs]
+
+
+def run_search(search, batch_func):
+    """Drives a search generator, evaluating each grid with `batch_func`."""
+    try:
+        xs = next(search)
+        while True:
+            xs = search.send(batch_func(xs))
+    except StopIteration as e:
+        return e.value
+
+
+async def run_search_async(search, batch_func):
+    """Same as `run_search` with a coroutine `batch_func`."""
+    try:
+        xs = next(search)
+        while True:
+            xs = search.send(await batch_func(xs))
+    except StopIteration as e:
+        return e.value
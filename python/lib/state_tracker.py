@@ -0,0 +1,192 @@
+import asyncio
+import logging
+
+from eth_utils import keccak
+
+from .rpc import AsyncRPC, RPCError
+
+
+SWAP_TOPIC = "0x" + keccak(text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex()
+MINT_TOPIC = "0x" + keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").hex()
+BURN_TOPIC = "0x" + keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)").hex()
+TRANSFER_TOPIC = "0x" + keccak(text="Transfer(address,address,uint256)").hex()
+
+
+class StateTracker:
+    """Keeps the pool price and the account of the arbitrageur current from event logs.
+
+    Every block the logs since the last one are fetched in a single batch request:
+    those of the MAI3 liquidity pool and the Uniswap V3 pool, and the ERC20 transfers
+    from or to the account. Swap, Mint and Burn update slot0 and the active liquidity
+    exactly, transfers update the token balances. Any liquidity pool log mentioning
+    the account (a trade, deposit, withdraw or liquidation) marks the account read by
+    `read_account` stale, any other one marks the perpetual changed. Funding and
+    oracle prices move without logs, so the account is read again at least every
+    `max_age` blocks anyway. The headers of the blocks come in the same batch as the
+    logs: when the first new block doesn't follow the last one seen, or a log was
+    removed, a reorg undid logs already applied and the pool and the account are
+    read again.
+
+    `read_account(block_number)` and `read_pool(block_number)` are the RPC reads used
+    to bootstrap and refresh, they run in the default executor. They return the tuple
+    of UniswapV3Arbitrage.readAccountInfo and (sqrtPriceX96, tick, liquidity).
+    `underlying_asset` and `collateral` are (token address, scale of its balance to wad).
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, rpc: AsyncRPC, account, liquidity_pool, uniswap_pool, underlying_asset, collateral,
+                 read_account, read_pool, max_age=20, max_range=1000, logger=None):
+        assert(isinstance(rpc, AsyncRPC))
+        if logger is not None:
+            self.logger = logger
+        self.rpc = rpc
+        self.account = account.lower()
+        self.liquidity_pool = liquidity_pool.lower()
+        self.uniswap_pool = uniswap_pool.lower()
+        # token -> (index of its balance in the account info, scale)
+        self.tokens = {underlying_asset[0].lower(): (0, underlying_asset[1]), collateral[0].lower(): (1, collateral[1])}
+        self.read_account = read_account
+        self.read_pool = read_pool
+        self.max_age = max_age
+        self.max_range = max_range
+        self.block_number = None
+        self.block_hash = None
+        self.account_info = None
+        self.account_block = None
+        self.pool = None
+        # counts the liquidity pool logs not about the account
+        self.perpetual_version = 0
+        self.reads = 0
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Feeds `listener.apply_log(log)` the Uniswap V3 pool logs in order, then calls
+        `listener.set_block(block_number)` once the update reached the block."""
+        self.listeners.append(listener)
+
+    def invalidate(self):
+        """Reads the account again on the next update, e.g. once our own transaction confirmed."""
+        self.account_block = None
+
+    def is_current(self, block_number):
+        return self.block_number == block_number and self.account_info is not None
+
+    def key(self):
+        """Returns the tracked state, it only changes when the state does."""
+        return (self.pool, self.perpetual_version, self.account_info)
+
+    async def update(self, block_number):
+        """Brings the state to `block_number`."""
+        if self.block_number is not None and block_number <= self.block_number:
+            return
+        loop = asyncio.get_event_loop()
+        reorg = False
+        if self.block_number is not None and block_number - self.block_number <= self.max_range:
+            logs, parent_hash, block_hash = await self.logs(self.block_number + 1, block_number)
+            reorg = parent_hash != self.block_hash
+            if reorg:
+                self.logger.warning(f"[state tracker] reorg before block {self.block_number + 1}, reading the pool again")
+            else:
+                reorg = not self.apply(logs)
+        if self.block_number is None or block_number - self.block_number > self.max_range or reorg:
+            # nothing to start from, too far behind to catch up with logs, or logs undone
+            self.pool = await loop.run_in_executor(None, self.read_pool, block_number)
+            self.reads += 1
+            self.account_block = None
+            block_hash = (await self.rpc.request("eth_getBlockByNumber", [hex(block_number), False]))["hash"]
+        self.block_hash = block_hash
+        if self.account_block is None or block_number - self.account_block >= self.max_age:
+            self.account_info = tuple(await loop.run_in_executor(None, self.read_account, block_number))
+            self.account_block = block_number
+            self.reads += 1
+        self.block_number = block_number
+        for listener in self.listeners:
+            listener.set_block(block_number)
+
+    async def logs(self, from_block, to_block):
+        """Returns the relevant logs of the blocks in order, the parent hash of the first block and
+        the hash of the last one."""
+        block_range = {"fromBlock": hex(from_block), "toBlock": hex(to_block)}
+        account_topic = "0x" + "0" * 24 + self.account[2:]
+        tokens = list(self.tokens)
+        replies = await self.rpc.batch([
+            ("eth_getLogs", [dict(block_range, address=[self.liquidity_pool, self.uniswap_pool])]),
+            ("eth_getLogs", [dict(block_range, address=tokens, topics=[TRANSFER_TOPIC, account_topic])]),
+            ("eth_getLogs", [dict(block_range, address=tokens, topics=[TRANSFER_TOPIC, None, account_topic])]),
+            ("eth_getBlockByNumber", [hex(from_block), False]),
+            ("eth_getBlockByNumber", [hex(to_block), False]),
+        ])
+        for reply in replies:
+            if isinstance(reply, Exception):
+                raise reply
+        first, last = replies[3:]
+        if first is None or last is None:
+            raise RPCError({"message": f"blocks {from_block} to {to_block} not found"})
+        logs = {}
+        for reply in replies[:3]:
+            for log in reply:
+                # a transfer to ourselves is returned twice
+                logs[(int(log["blockNumber"], 16), int(log["logIndex"], 16))] = log
+        return [logs[key] for key in sorted(logs)], first["parentHash"], last["hash"]
+
+    def apply(self, logs):
+        """Applies `logs`, returns False at the first one removed by a reorg."""
+        for log in logs:
+            if log.get("removed"):
+                return False
+            address = log["address"].lower()
+            topics = [topic.lower() for topic in log["topics"]]
+            if address == self.uniswap_pool:
+                self.pool = apply_pool_log(log, *self.pool)[:3]
+                for listener in self.listeners:
+                    listener.apply_log(log)
+            elif address == self.liquidity_pool:
+                if any(topic[-40:] == self.account[2:] for topic in topics[1:]):
+                    self.account_block = None
+                else:
+                    self.perpetual_version += 1
+            elif address in self.tokens and len(topics) == 3 and topics[0] == TRANSFER_TOPIC:
+                self._apply_transfer(address, topics, log_words(log["data"]))
+        return True
+
+    def _apply_transfer(self, token, topics, words):
+        if self.account_info is None:
+            return
+        index, scale = self.tokens[token]
+        value = words[0] * scale
+        delta = (value if topics[2][-40:] == self.account[2:] else 0) - \
+            (value if topics[1][-40:] == self.account[2:] else 0)
+        account_info = list(self.account_info)
+        account_info[index] += delta
+        self.account_info = tuple(account_info)
+
+
+def apply_pool_log(log, sqrt_price_x96, tick, liquidity):
+    """Returns (sqrtPriceX96, tick, liquidity, position change) after the Uniswap V3 pool log `log`.
+
+    The position change is (tickLower, tickUpper, liquidity delta) of a Mint or a
+    Burn, None for the other logs.
+    """
+    topics = [topic.lower() for topic in log["topics"]]
+    words = log_words(log["data"])
+    if topics[0] == SWAP_TOPIC:
+        # the swap reports the state it left
+        return words[2], signed_word(words[4]), words[3], None
+    if topics[0] in (MINT_TOPIC, BURN_TOPIC):
+        tick_lower, tick_upper = signed_word(int(topics[2], 16)), signed_word(int(topics[3], 16))
+        # Mint(sender, amount, ...) and Burn(amount, ...)
+        delta = words[1] if topics[0] == MINT_TOPIC else -words[0]
+        if tick_lower <= tick < tick_upper:
+            liquidity += delta
+        return sqrt_price_x96, tick, liquidity, (tick_lower, tick_upper, delta)
+    return sqrt_price_x96, tick, liquidity, None
+
+
+def log_words(data):
+    data = data[2:] if data.startswith("0x") else data
+    return [int(data[i:i + 64], 16) for i in range(0, len(data), 64)]
+
+
+def signed_word(word):
+    return word - 2**256 if word >= 2**255 else word
@@ -0,0 +1,333 @@
+import asyncio
+import logging
+import threading
+import time
+
+from eth_keys import keys
+from eth_utils import keccak
+from web3 import Web3
+
+from . import metrics
+from .rpc import AsyncRPC
+
+
+SUBMIT_SECONDS = metrics.histogram(
+    "arbitrage_submit_seconds", "Duration of building, signing and sending a transaction.")
+RECEIPT_SECONDS = metrics.histogram(
+    "arbitrage_receipt_seconds", "Seconds from sending a transaction to its receipt.", ["tag", "status"])
+
+
+class NonceManager:
+    """Hands out nonces locally, so sending a transaction doesn't wait for the previous one.
+
+    The counter is read from the node's pending nonce on first use and after `reset`.
+    """
+
+    def __init__(self, web3: Web3, address):
+        assert(isinstance(web3, Web3))
+        self.web3 = web3
+        self.address = address
+        self.nonce = None
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            if self.nonce is None:
+                self.nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+            nonce = self.nonce
+            self.nonce += 1
+            return nonce
+
+    def load(self):
+        """Reads the counter now if it has to be, so that `next` doesn't."""
+        with self.lock:
+            if self.nonce is None:
+                self.nonce = self.web3.eth.get_transaction_count(self.address, 'pending')
+
+    def reset(self):
+        with self.lock:
+            self.nonce = None
+
+
+class TransactionSubmitter:
+    """Signs contract calls locally and broadcasts them without waiting for the receipt."""
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, web3: Web3, account, nonce_manager: NonceManager = None):
+        assert(isinstance(web3, Web3))
+        self.web3 = web3
+        self.account = account
+        self.nonce_manager = nonce_manager or NonceManager(web3, account.address)
+
+    def submit(self, contract_function):
+        """Sends `contract_function` as a transaction and returns its hash."""
+        nonce = self.nonce_manager.next()
+        try:
+            with SUBMIT_SECONDS.time():
+                tx = contract_function.buildTransaction({
+                    'from': self.account.address,
+                    'nonce': nonce,
+                })
+                signed = self.account.sign_transaction(tx)
+                return self.web3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception:
+            # the nonce is unused or the node state is unknown, read it again
+            self.nonce_manager.reset()
+            raise
+
+    def submit_call(self, contract, fn_name, args):
+        """Sends `fn_name(*args)` of the `lib.contract.Contract` client `contract`, returns the hash."""
+        return self.submit(getattr(contract.contract.functions, fn_name)(*args))
+
+    def prepare(self, contract, fn_names, estimate=None):
+        """Readies the calls `fn_names` of `contract` to be sent, nothing to do here.
+
+        `estimate(fn_name)` returns a coroutine estimating the gas of the call, or None.
+        """
+
+    async def refresh(self, block_number):
+        """Keeps what the transactions need current, run once per block."""
+
+
+class CallTemplate:
+    """A legacy transaction calling a function of static arguments, RLP encoded ahead but
+    for the nonce and the argument words."""
+
+    def __init__(self, to, selector, input_types, gas, estimate=None):
+        assert all(_is_word(input_type) for input_type in input_types), "not a static call"
+        self.to = _rlp_bytes(bytes.fromhex(to[2:]))
+        self.selector = bytes.fromhex(selector[2:])
+        self.input_types = input_types
+        # the calldata has a fixed length
+        self.data_prefix = _rlp_length(4 + 32 * len(input_types), 0x80)
+        # gas limit, kept current from `estimate()` if any, a coroutine returning the gas
+        self.gas = gas
+        self.estimate = estimate
+
+    def calldata(self, args):
+        if len(args) != len(self.input_types):
+            raise ValueError(f"{len(self.input_types)} arguments expected, got {len(args)}")
+        return self.selector + b"".join(_word(input_type, value) for input_type, value in zip(self.input_types, args))
+
+
+class TemplateSubmitter(TransactionSubmitter):
+    """Sends the calls prepared with `prepare` from templates: at decision time only the
+    argument words and the nonce are filled in, the transaction is signed locally and
+    broadcast, nothing else is asked to the node.
+
+    `refresh` keeps the gas price, the chain id and the nonce ready in the background,
+    and every `gas_interval` blocks the gas limits of the calls prepared with an
+    `estimate`, at `gas_margin` times the estimate. Until the first estimate, or if
+    it fails, the gas limit is `gas_limits[fn_name]` or `gas_limit`. The calls not
+    prepared, or before the first refresh, go through `TransactionSubmitter`.
+    Signing is fast with coincurve installed, eth_keys uses it.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, web3: Web3, account, nonce_manager: NonceManager = None, rpc: AsyncRPC = None,
+                 gas_limit=3000000, gas_limits=None, gas_margin=1.5, gas_interval=10, logger=None):
+        super().__init__(web3, account, nonce_manager)
+        assert(isinstance(rpc, AsyncRPC))
+        if logger is not None:
+            self.logger = logger
+        self.rpc = rpc
+        self.gas_limit = gas_limit
+        self.gas_limits = dict(gas_limits or {})
+        # the L1 part of the gas on Arbitrum moves with the L1 gas price
+        self.gas_margin = gas_margin
+        self.gas_interval = gas_interval
+        self.gas_block = None
+        self.private_key = keys.PrivateKey(bytes(account.key))
+        self.templates = {}
+        self.block_number = None
+        self.chain_id = None
+        # RLP of gasPrice, and of chainId, 0, 0 for signing
+        self.gas_price_item = None
+        self.chain_items = None
+
+    def prepare(self, contract, fn_names, estimate=None):
+        for fn_name in fn_names:
+            function = getattr(contract.abi, "functions", {}).get(fn_name)
+            if function is None or not all(_is_word(input_type) for input_type in function[1]):
+                continue
+            self.templates[(contract.address.address.lower(), fn_name)] = CallTemplate(
+                contract.address.address, function[0], function[1], self.gas_limits.get(fn_name, self.gas_limit),
+                None if estimate is None else (lambda fn_name=fn_name: estimate(fn_name)))
+
+    async def refresh(self, block_number):
+        if self.block_number is not None and block_number <= self.block_number:
+            return
+        self.block_number = block_number
+        requests = [self.rpc.batch([("eth_gasPrice", []), ("eth_chainId", [])])]
+        if self.gas_block is None or block_number - self.gas_block >= self.gas_interval:
+            self.gas_block = block_number
+            requests.append(self.estimate_gas())
+        (gas_price, chain_id), *_ = await asyncio.gather(*requests)
+        if isinstance(gas_price, Exception):
+            raise gas_price
+        if self.chain_id is None:
+            if isinstance(chain_id, Exception):
+                raise chain_id
+            self.chain_id = int(chain_id, 16)
+            self.chain_items = _rlp_int(self.chain_id) + b"\x80\x80"
+        self.gas_price_item = _rlp_int(int(gas_price, 16))
+        await asyncio.get_event_loop().run_in_executor(None, self.nonce_manager.load)
+
+    async def estimate_gas(self):
+        """Sets the gas limits of the templates from their estimates, a failed one keeps the last."""
+        templates = []
+        coroutines = []
+        for template in self.templates.values():
+            coroutine = None if template.estimate is None else template.estimate()
+            if coroutine is not None:
+                templates.append(template)
+                coroutines.append(coroutine)
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        for template, gas in zip(templates, results):
+            if isinstance(gas, Exception):
+                self.logger.info(f"[submit] estimate gas error:{gas}")
+                continue
+            template.gas = int(gas * self.gas_margin)
+
+    def submit_call(self, contract, fn_name, args):
+        template = self.templates.get((contract.address.address.lower(), fn_name))
+        if template is None or self.gas_price_item is None:
+            return super().submit_call(contract, fn_name, args)
+        nonce = self.nonce_manager.next()
+        try:
+            with SUBMIT_SECONDS.time():
+                raw_transaction = self.sign(template, args, nonce, template.gas)
+                return self.web3.eth.send_raw_transaction(raw_transaction)
+        except Exception:
+            self.nonce_manager.reset()
+            raise
+
+    def sign(self, template, args, nonce, gas):
+        """Returns the signed EIP-155 transaction."""
+        # nonce, gasPrice, gas, to, value, data
+        fields = _rlp_int(nonce) + self.gas_price_item + _rlp_int(gas) + template.to + b"\x80" + \
+            template.data_prefix + template.calldata(args)
+        signature = self.private_key.sign_msg_hash(keccak(_rlp_list(fields + self.chain_items)))
+        v = signature.v + 35 + 2 * self.chain_id
+        return _rlp_list(fields + _rlp_int(v) + _rlp_int(signature.r) + _rlp_int(signature.s))
+
+
+def _is_word(input_type):
+    return input_type in ("address", "bool") or \
+        (input_type.startswith(("uint", "int")) and "[" not in input_type)
+
+
+def _word(input_type, value):
+    if input_type == "address":
+        return bytes(12) + bytes.fromhex(value[2:])
+    if input_type.startswith("int"):
+        return (value % 2**256).to_bytes(32, "big")
+    return int(value).to_bytes(32, "big")
+
+
+def _rlp_length(length, offset):
+    if length < 56:
+        return bytes([offset + length])
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([offset + 55 + len(length_bytes)]) + length_bytes
+
+
+def _rlp_bytes(value):
+    if len(value) == 1 and value[0] < 0x80:
+        return value
+    return _rlp_length(len(value), 0x80) + value
+
+
+def _rlp_int(value):
+    return _rlp_bytes(value.to_bytes((value.bit_length() + 7) // 8, "big"))
+
+
+def _rlp_list(items):
+    return _rlp_length(len(items), 0xc0) + items
+
+
+class PendingTransaction:
+    def __init__(self, tx_hash, tag, amount, on_receipt):
+        self.tx_hash = tx_hash
+        self.tag = tag
+        self.amount = amount
+        self.on_receipt = on_receipt
+        self.sent_at = time.time()
+
+
+class ReceiptTracker:
+    """Polls the receipts of pending transactions in the background.
+
+    `on_receipt(pending, receipt)` runs in the default executor when the receipt
+    arrives, or with a receipt of None if it didn't arrive within `timeout` seconds.
+    `track` may be called from any thread.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, rpc: AsyncRPC, nonce_manager: NonceManager = None, timeout=120, poll_interval=0.5, logger=None):
+        assert(isinstance(rpc, AsyncRPC))
+        if logger is not None:
+            self.logger = logger
+        self.rpc = rpc
+        self.nonce_manager = nonce_manager
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def track(self, tx_hash, tag, amount, on_receipt):
+        tx_hash = Web3.toHex(tx_hash)
+        with self.lock:
+            self.pending[tx_hash] = PendingTransaction(tx_hash, tag, amount, on_receipt)
+
+    def pending_amount(self, tag):
+        with self.lock:
+            return sum(pending.amount for pending in self.pending.values() if pending.tag == tag)
+
+    def has_pending(self, tag=None):
+        with self.lock:
+            return any(tag is None or pending.tag == tag for pending in self.pending.values())
+
+    async def run(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                self.logger.error(f"[receipt tracker] error:{e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def poll(self):
+        with self.lock:
+            pendings = list(self.pending.values())
+        if len(pendings) == 0:
+            return
+        receipts = await self.rpc.batch(
+            [("eth_getTransactionReceipt", [pending.tx_hash]) for pending in pendings])
+        loop = asyncio.get_event_loop()
+        now = time.time()
+        for pending, receipt in zip(pendings, receipts):
+            if isinstance(receipt, Exception):
+                self.logger.error(f"[receipt tracker] {pending.tx_hash} error:{receipt}")
+                continue
+            if receipt is None and now - pending.sent_at < self.timeout:
+                continue
+            if receipt is None:
+                self.logger.error(f"[receipt tracker] {pending.tx_hash} timeout")
+                if self.nonce_manager is not None:
+                    self.nonce_manager.reset()
+                status = "timeout"
+            else:
+                status = "success" if int(receipt["status"], 16) == 1 else "fail"
+            RECEIPT_SECONDS.observe(now - pending.sent_at, tag=pending.tag, status=status)
+            with self.lock:
+                self.pending.pop(pending.tx_hash, None)
+            loop.run_in_executor(None, self._callback, pending, receipt)
+
+    def _callback(self, pending, receipt):
+        try:
+            pending.on_receipt(pending, receipt)
+        except Exception as e:
+            self.logger.error(f"[receipt tracker] {pending.tx_hash} callback error:{e}")
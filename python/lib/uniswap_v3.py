@@ -0,0 +1,365 @@
+from bisect import bisect_left, bisect_right, insort
+
+# Integer port of the Uniswap V3 core libraries used by a single pool swap
+# (TickMath, SqrtPriceMath, SwapMath, TickBitmap and UniswapV3Pool.swap).
+# Results are bit-exact with the solidity implementation.
+
+MIN_TICK = -887272
+MAX_TICK = -MIN_TICK
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+Q96 = 2**96
+UINT256_MAX = 2**256 - 1
+UINT160_MAX = 2**160 - 1
+
+_TICK_RATIOS = [
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+]
+
+
+class SwapError(Exception):
+    pass
+
+
+def mul_div(a, b, denominator):
+    return a * b // denominator
+
+
+def mul_div_rounding_up(a, b, denominator):
+    return -(-a * b // denominator)
+
+
+def div_rounding_up(x, y):
+    return -(-x // y)
+
+
+def get_sqrt_ratio_at_tick(tick):
+    abs_tick = abs(tick)
+    if abs_tick > MAX_TICK:
+        raise SwapError("T")
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 != 0 else 0x100000000000000000000000000000000
+    for bit, factor in _TICK_RATIOS:
+        if abs_tick & bit != 0:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = UINT256_MAX // ratio
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96):
+    """Returns the greatest tick whose sqrt ratio is less than or equal to `sqrt_price_x96`."""
+    if not (MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO):
+        raise SwapError("R")
+    low, high = MIN_TICK, MAX_TICK
+    while low < high:
+        mid = (low + high + 1) // 2
+        if get_sqrt_ratio_at_tick(mid) <= sqrt_price_x96:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def get_amount0_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_ratio_b - sqrt_ratio_a
+    if round_up:
+        return div_rounding_up(mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b), sqrt_ratio_a)
+    return mul_div(numerator1, numerator2, sqrt_ratio_b) // sqrt_ratio_a
+
+
+def get_amount1_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_ratio_b - sqrt_ratio_a, Q96)
+    return mul_div(liquidity, sqrt_ratio_b - sqrt_ratio_a, Q96)
+
+
+def _next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount, add):
+    if amount == 0:
+        return sqrt_price_x96
+    numerator1 = liquidity << 96
+    product = amount * sqrt_price_x96
+    if add:
+        # the solidity code falls back to a less precise formula when the product overflows
+        if product <= UINT256_MAX and numerator1 + product <= UINT256_MAX:
+            return mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 + product)
+        return div_rounding_up(numerator1, numerator1 // sqrt_price_x96 + amount)
+    if product > UINT256_MAX or numerator1 <= product:
+        raise SwapError("price overflow")
+    result = mul_div_rounding_up(numerator1, sqrt_price_x96, numerator1 - product)
+    if result > UINT160_MAX:
+        raise SwapError("price overflow")
+    return result
+
+
+def _next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount, add):
+    if add:
+        result = sqrt_price_x96 + (amount << 96) // liquidity
+        if result > UINT160_MAX:
+            raise SwapError("price overflow")
+        return result
+    quotient = div_rounding_up(amount << 96, liquidity)
+    if sqrt_price_x96 <= quotient:
+        raise SwapError("price underflow")
+    return sqrt_price_x96 - quotient
+
+
+def get_next_sqrt_price_from_input(sqrt_price_x96, liquidity, amount_in, zero_for_one):
+    if zero_for_one:
+        return _next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_in, True)
+    return _next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_in, True)
+
+
+def get_next_sqrt_price_from_output(sqrt_price_x96, liquidity, amount_out, zero_for_one):
+    if zero_for_one:
+        return _next_sqrt_price_from_amount1_rounding_down(sqrt_price_x96, liquidity, amount_out, False)
+    return _next_sqrt_price_from_amount0_rounding_up(sqrt_price_x96, liquidity, amount_out, False)
+
+
+def compute_swap_step(sqrt_ratio_current, sqrt_ratio_target, liquidity, amount_remaining, fee_pips):
+    zero_for_one = sqrt_ratio_current >= sqrt_ratio_target
+    exact_in = amount_remaining >= 0
+    if exact_in:
+        amount_remaining_less_fee = mul_div(amount_remaining, 10**6 - fee_pips, 10**6)
+        if zero_for_one:
+            amount_in = get_amount0_delta(sqrt_ratio_target, sqrt_ratio_current, liquidity, True)
+        else:
+            amount_in = get_amount1_delta(sqrt_ratio_current, sqrt_ratio_target, liquidity, True)
+        if amount_remaining_less_fee >= amount_in:
+            sqrt_ratio_next = sqrt_ratio_target
+        else:
+            sqrt_ratio_next = get_next_sqrt_price_from_input(
+                sqrt_ratio_current, liquidity, amount_remaining_less_fee, zero_for_one)
+    else:
+        if zero_for_one:
+            amount_out = get_amount1_delta(sqrt_ratio_target, sqrt_ratio_current, liquidity, False)
+        else:
+            amount_out = get_amount0_delta(sqrt_ratio_current, sqrt_ratio_target, liquidity, False)
+        if -amount_remaining >= amount_out:
+            sqrt_ratio_next = sqrt_ratio_target
+        else:
+            sqrt_ratio_next = get_next_sqrt_price_from_output(
+                sqrt_ratio_current, liquidity, -amount_remaining, zero_for_one)
+
+    is_max = sqrt_ratio_target == sqrt_ratio_next
+    if zero_for_one:
+        if not (is_max and exact_in):
+            amount_in = get_amount0_delta(sqrt_ratio_next, sqrt_ratio_current, liquidity, True)
+        if not (is_max and not exact_in):
+            amount_out = get_amount1_delta(sqrt_ratio_next, sqrt_ratio_current, liquidity, False)
+    else:
+        if not (is_max and exact_in):
+            amount_in = get_amount1_delta(sqrt_ratio_current, sqrt_ratio_next, liquidity, True)
+        if not (is_max and not exact_in):
+            amount_out = get_amount0_delta(sqrt_ratio_current, sqrt_ratio_next, liquidity, False)
+
+    if not exact_in and amount_out > -amount_remaining:
+        amount_out = -amount_remaining
+    if exact_in and sqrt_ratio_next != sqrt_ratio_target:
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee_pips, 10**6 - fee_pips)
+    return sqrt_ratio_next, amount_in, amount_out, fee_amount
+
+
+def _most_significant_bit(x):
+    return x.bit_length() - 1
+
+
+def _least_significant_bit(x):
+    return (x & -x).bit_length() - 1
+
+
+class TickIndex:
+    """Initialized ticks of a pool, indexed like the pool does: liquidityNet by tick,
+    the sorted ticks and the TickBitmap words.
+
+    `gross` maps ticks to their liquidityGross, only needed to `update` the index.
+    An index never changes once built, `update` returns a new one sharing nothing
+    with it, so the pool states built on an index stay valid while a mirror moves on.
+    """
+
+    def __init__(self, tick_spacing, ticks, gross=None):
+        self.tick_spacing = tick_spacing
+        self.net = dict(ticks)
+        self.gross = dict(gross or {})
+        self.sorted = sorted(self.net)
+        self.bitmap = {}
+        for tick in self.sorted:
+            word, bit = self.position(tick)
+            self.bitmap[word] = self.bitmap.get(word, 0) | (1 << bit)
+
+    def position(self, tick):
+        """Returns the (word, bit) of an initialized `tick` in the bitmap."""
+        compressed = tick // self.tick_spacing
+        return compressed >> 8, compressed & 0xff
+
+    def next_initialized_tick_within_one_word(self, tick, lte):
+        """Same result as TickBitmap.nextInitializedTickWithinOneWord."""
+        compressed = tick // self.tick_spacing
+        if lte:
+            word, bit_pos = compressed >> 8, compressed & 0xff
+            masked = self.bitmap.get(word, 0) & ((1 << (bit_pos + 1)) - 1)
+            if masked != 0:
+                return (compressed - (bit_pos - _most_significant_bit(masked))) * self.tick_spacing, True
+            return (compressed - bit_pos) * self.tick_spacing, False
+        compressed += 1
+        word, bit_pos = compressed >> 8, compressed & 0xff
+        masked = self.bitmap.get(word, 0) >> bit_pos
+        if masked != 0:
+            return (compressed + _least_significant_bit(masked)) * self.tick_spacing, True
+        return (compressed + (255 - bit_pos)) * self.tick_spacing, False
+
+    def update(self, tick, liquidity_delta, upper):
+        """Returns the index after a position of `liquidity_delta` was added at `tick`, as in Tick.update."""
+        index = TickIndex.__new__(TickIndex)
+        index.tick_spacing = self.tick_spacing
+        index.net, index.gross = dict(self.net), dict(self.gross)
+        index.sorted, index.bitmap = self.sorted, self.bitmap
+        gross_before = self.gross.get(tick, 0)
+        gross_after = gross_before + liquidity_delta
+        if gross_after < 0:
+            raise SwapError("LS")
+        net = index.net.get(tick, 0) + (-liquidity_delta if upper else liquidity_delta)
+        if gross_after == 0:
+            index.net.pop(tick, None)
+            index.gross.pop(tick, None)
+        else:
+            index.net[tick] = net
+            index.gross[tick] = gross_after
+        if (gross_before == 0) != (gross_after == 0):
+            # the tick flips
+            word, bit = self.position(tick)
+            index.bitmap = dict(self.bitmap)
+            index.bitmap[word] = index.bitmap.get(word, 0) ^ (1 << bit)
+            if index.bitmap[word] == 0:
+                del index.bitmap[word]
+            index.sorted = list(self.sorted)
+            if gross_after == 0:
+                index.sorted.pop(bisect_left(index.sorted, tick))
+            else:
+                insort(index.sorted, tick)
+        return index
+
+    def between(self, tick_lower, tick_upper):
+        """Returns the initialized ticks in [tick_lower, tick_upper]."""
+        return self.sorted[bisect_left(self.sorted, tick_lower):bisect_right(self.sorted, tick_upper)]
+
+
+class PoolState:
+    """Snapshot of a Uniswap V3 pool: slot0, active liquidity and the initialized ticks.
+
+    `ticks` maps every initialized tick to its liquidityNet, or is a `TickIndex`
+    which is used as it is.
+    """
+
+    def __init__(self, sqrt_price_x96, tick, liquidity, fee, tick_spacing, ticks):
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        self.liquidity = liquidity
+        self.fee = fee
+        self.tick_spacing = tick_spacing
+        self.index = ticks if isinstance(ticks, TickIndex) else TickIndex(tick_spacing, ticks)
+        self.ticks = self.index.net
+        self.sorted_ticks = self.index.sorted
+
+    def copy(self):
+        return PoolState(self.sqrt_price_x96, self.tick, self.liquidity, self.fee, self.tick_spacing, self.index)
+
+    def next_initialized_tick_within_one_word(self, tick, lte):
+        """Same result as TickBitmap.nextInitializedTickWithinOneWord."""
+        return self.index.next_initialized_tick_within_one_word(tick, lte)
+
+    def liquidity_net(self, tick):
+        return self.ticks.get(tick, 0)
+
+    def swap(self, zero_for_one, amount_specified, sqrt_price_limit_x96=None, commit=False):
+        """Simulates UniswapV3Pool.swap and returns (amount0, amount1) from the pool's perspective.
+
+        Positive amounts are paid to the pool, negative amounts are paid by the pool.
+        The pool state is only updated if `commit` is set.
+        """
+        if amount_specified == 0:
+            raise SwapError("AS")
+        if sqrt_price_limit_x96 is None:
+            sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+        if zero_for_one:
+            if not (MIN_SQRT_RATIO < sqrt_price_limit_x96 < self.sqrt_price_x96):
+                raise SwapError("SPL")
+        else:
+            if not (self.sqrt_price_x96 < sqrt_price_limit_x96 < MAX_SQRT_RATIO):
+                raise SwapError("SPL")
+
+        exact_input = amount_specified > 0
+        remaining = amount_specified
+        calculated = 0
+        sqrt_price_x96 = self.sqrt_price_x96
+        tick = self.tick
+        liquidity = self.liquidity
+        while remaining != 0 and sqrt_price_x96 != sqrt_price_limit_x96:
+            sqrt_price_start = sqrt_price_x96
+            tick_next, initialized = self.next_initialized_tick_within_one_word(tick, zero_for_one)
+            tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+            sqrt_price_next = get_sqrt_ratio_at_tick(tick_next)
+            if (sqrt_price_next < sqrt_price_limit_x96) if zero_for_one else (sqrt_price_next > sqrt_price_limit_x96):
+                target = sqrt_price_limit_x96
+            else:
+                target = sqrt_price_next
+            sqrt_price_x96, amount_in, amount_out, fee_amount = compute_swap_step(
+                sqrt_price_x96, target, liquidity, remaining, self.fee)
+            if exact_input:
+                remaining -= amount_in + fee_amount
+                calculated -= amount_out
+            else:
+                remaining += amount_out
+                calculated += amount_in + fee_amount
+            if sqrt_price_x96 == sqrt_price_next:
+                if initialized:
+                    liquidity_net = self.liquidity_net(tick_next)
+                    liquidity += -liquidity_net if zero_for_one else liquidity_net
+                    if liquidity < 0:
+                        raise SwapError("LS")
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif sqrt_price_x96 != sqrt_price_start:
+                tick = get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+        if commit:
+            self.sqrt_price_x96, self.tick, self.liquidity = sqrt_price_x96, tick, liquidity
+        if zero_for_one == exact_input:
+            return amount_specified - remaining, calculated
+        return calculated, amount_specified - remaining
+
+    def exact_input(self, zero_for_one, amount_in, commit=False):
+        """Same as SwapSingle.exactInputSingle without price limit, returns the amount out."""
+        amount0, amount1 = self.swap(zero_for_one, amount_in, commit=commit)
+        return -(amount1 if zero_for_one else amount0)
+
+    def exact_output(self, zero_for_one, amount_out, commit=False):
+        """Same as SwapSingle.exactOutputSingle without price limit, returns the amount in."""
+        amount0, amount1 = self.swap(zero_for_one, -amount_out, commit=commit)
+        amount_in, amount_out_received = (amount0, -amount1) if zero_for_one else (amount1, -amount0)
+        if amount_out_received != amount_out:
+            raise SwapError("not enough liquidity")
+        return amount_in
@@ -1,12 +1,33 @@
+import sys
 from functools import total_ordering, reduce
-from decimal import *
+from decimal import Decimal
 
 
-_context = Context(prec=1000, rounding=ROUND_DOWN)
+ONE = 10**18
+_new = object.__new__
+
+
+def _div_down(x, y):
+    """Integer division rounding toward zero (ROUND_DOWN)."""
+    q = abs(x) // abs(y)
+    return q if (x >= 0) == (y >= 0) else -q
+
+
+def _wmul(x, y):
+    return _div_down(x * y, ONE)
+
+
+def _wad(value):
+    """Builds a Wad from a known int, skipping the checks of __init__."""
+    wad = _new(Wad)
+    wad.value = value
+    return wad
 
 
 @total_ordering
 class Wad:
+    __slots__ = ('value',)
+
     def __init__(self, value):
         if isinstance(value, Wad):
             self.value = value.value
@@ -19,9 +40,10 @@ class Wad:
     @classmethod
     def from_number(cls, number):
         # assert(number >= 0)
-        pwr = Decimal(10) ** 18
-        dec = Decimal(str(number)) * pwr
-        return Wad(int(dec.quantize(1, context=_context)))
+        if isinstance(number, int):
+            return Wad(number * ONE)
+        numerator, denominator = Decimal(str(number)).as_integer_ratio()
+        return Wad(_div_down(numerator * ONE, denominator))
 
     def __repr__(self):
         return "Wad(" + str(self.value) + ")"
@@ -32,33 +54,32 @@ class Wad:
 
     def __add__(self, other):
         if isinstance(other, Wad):
-            return Wad(self.value + other.value)
+            return _wad(self.value + other.value)
         else:
             raise ArithmeticError
 
     def __sub__(self, other):
         if isinstance(other, Wad):
-            return Wad(self.value - other.value)
+            return _wad(self.value - other.value)
         else:
             raise ArithmeticError
 
     def __mul__(self, other):
         if isinstance(other, Wad):
-            result = Decimal(self.value) * Decimal(other.value) / (Decimal(10) ** Decimal(18))
-            return Wad(int(result.quantize(1, context=_context)))
+            return _wad(_wmul(self.value, other.value))
         elif isinstance(other, int):
-            return Wad(int((Decimal(self.value) * Decimal(other)).quantize(1, context=_context)))
+            return _wad(self.value * other)
         else:
             raise ArithmeticError
 
     def __truediv__(self, other):
         if isinstance(other, Wad):
-            return Wad(int((Decimal(self.value) * (Decimal(10) ** Decimal(18)) / Decimal(other.value)).quantize(1, context=_context)))
+            return _wad(_div_down(self.value * ONE, other.value))
         else:
             raise ArithmeticError
 
     def __abs__(self):
-        return Wad(abs(self.value))
+        return _wad(abs(self.value))
 
     def __eq__(self, other):
         if isinstance(other, Wad):
@@ -73,11 +94,11 @@ class Wad:
             raise ArithmeticError
 
     def __int__(self):
-        return int(self.value / 10**18)
+        return _div_down(self.value, ONE)
 
     def __float__(self):
-        return self.value / 10**18
-    
+        return self.value / ONE
+
     def is_zero(self):
         return self.value == 0
 
@@ -91,3 +112,61 @@ class Wad:
         """Returns the higher of the Wad values"""
         return reduce(lambda x, y: x if x > y else y, args[1:], args[0])
 
+    # Bulk helpers working on raw integer values, so that scanning many amounts
+    # doesn't allocate a Wad per element. `values` is a list or a NumPy array of
+    # python ints (dtype=object); results are written to `out` when given, a list
+    # or an object array, which may be `values` itself to update it in place.
+
+    @staticmethod
+    def values(wads):
+        """Returns the raw values of a sequence of Wads."""
+        return [wad.value for wad in wads]
+
+    @staticmethod
+    def array(values):
+        """Returns a NumPy object array of raw values, exact for any magnitude."""
+        import numpy
+        result = numpy.empty(len(values), dtype=object)
+        result[:] = [value.value if isinstance(value, Wad) else int(value) for value in values]
+        return result
+
+    @staticmethod
+    def mul_values(values, factor, out=None):
+        """Wad-multiplies every raw value by `factor` (a Wad or raw value), rounding down."""
+        factor = factor.value if isinstance(factor, Wad) else factor
+        return _apply(lambda x: _wmul(x, factor), values, out)
+
+    @staticmethod
+    def div_values(values, divisor, out=None):
+        """Wad-divides every raw value by `divisor` (a Wad or raw value), rounding down."""
+        divisor = divisor.value if isinstance(divisor, Wad) else divisor
+        return _apply(lambda x: _div_down(x * ONE, divisor), values, out)
+
+    @staticmethod
+    def add_values(values, other, out=None):
+        """Adds `other` (a Wad or raw value) to every raw value."""
+        other = other.value if isinstance(other, Wad) else other
+        return _apply(lambda x: x + other, values, out)
+
+    @staticmethod
+    def sum(wads):
+        """Returns the sum of a sequence of Wads."""
+        return _wad(sum(wad.value for wad in wads))
+
+
+def _apply(func, values, out):
+    # an array comes from a caller that imported NumPy already
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(out, numpy.ndarray) and out.dtype != object:
+        # the results would be cast back to int64 and overflow
+        raise TypeError("out must be an object array")
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        if values.dtype != object:
+            # int64 would overflow on wad products
+            values = values.astype(object)
+        ufunc = numpy.frompyfunc(func, 1, 1)
+        return ufunc(values) if out is None else ufunc(values, out=out)
+    if out is None:
+        return [func(x) for x in values]
+    out[:] = [func(x) for x in values]
+    return out
@@ -1,32 +1,110 @@
+import time
+# startup is measured from here, the interpreter's own start is not included
+STARTED = time.perf_counter()
+
 from web3 import Web3, HTTPProvider
 from eth_account import Account
 from web3.middleware import construct_sign_and_send_raw_middleware
-import time
-from scipy import optimize
+import asyncio
 import logging
 from logging.handlers import TimedRotatingFileHandler
 
 from lib.address import Address
+from lib.block_feed import BlockFeed
+from lib.cache import BlockCache
+from lib.gas import GasEstimator
+from lib.log import EventLogger, JsonFormatter, queue_handler
+from lib import metrics, profit_scan
+from lib.pool_mirror import PoolMirror
+from lib.risk import RiskGuard
+from lib.scheduler import BlockScheduler
+from lib.rpc import AsyncRPC
+from lib.search import SearchResult, WarmStart, grid_search, integer_search, run_search, run_search_async
+from lib.state_tracker import StateTracker
+from lib.transaction import NonceManager, ReceiptTracker, TemplateSubmitter
 from lib.wad import Wad
-from contract import Arbitrage
+from contract import Arbitrage, AsyncArbitrage, UniswapV3Pool
 
 _logger = None
 _debug_logger = None
 
+SEARCH_SECONDS = metrics.histogram(
+    "arbitrage_search_seconds", "Duration of a search for the best amount.", ["search"])
+SEARCH_EVALUATIONS = metrics.histogram(
+    "arbitrage_search_evaluations", "Amounts evaluated by a search.", ["search"], metrics.COUNT_BUCKETS)
+CHECK_SECONDS = metrics.histogram(
+    "arbitrage_check_seconds", "Duration of a strategy check.", ["check"])
+DETECTION_SECONDS = metrics.histogram(
+    "arbitrage_detection_to_submit_seconds", "Seconds from seeing a block to sending the transaction it triggered.", ["strategy"])
+STARTUP_SECONDS = metrics.histogram(
+    "arbitrage_startup_seconds", "Seconds from the start of main to the imports, the clients and the first block.", ["stage"])
+STARTUP_SECONDS.observe(time.perf_counter() - STARTED, stage="imports")
+
+
+class Opportunity:
+    """A transaction a strategy of `market` decided to send.
+
+    `submit()` sends it and returns the hash, `profit` is the expected profit (None
+    when unknown). Risk actions rank before the profitable ones, which rank by
+    decreasing profit.
+    """
+
+    RISK, PROFIT = 0, 1
+
+    def __init__(self, market, tag, verb, amount, profit, submit, priority=PROFIT):
+        self.market = market
+        self.tag = tag
+        self.verb = verb
+        self.amount = amount
+        self.profit = profit
+        self.submit = submit
+        self.priority = priority
+
+    def rank(self):
+        return (self.priority, 0 if self.profit is None else -self.profit.value)
+
 
 class MyArbitrage():
 
     big_number = Wad.from_number(9999999)
+    # candidates per request of the concurrent searches when batch_size is not set
+    default_batch_size = 16
+    # curve of lib.profit_scan searched by each cost function, and its amounts evaluated exactly
+    scan_curves = {"profit_open_cost": "open", "profit_close_cost": "close", "deleverage_close_cost": "deleverage"}
+    scan_candidates = 8
 
-    def __init__(self, arb_address, wallet_key, profit_limit, max_trade_amount, trade_amount_atol, max_leverage, min_funding_rate):
+    def __init__(self, arb_address, wallet_key, profit_limit, max_trade_amount, trade_amount_atol, max_leverage, min_funding_rate, batch_size=0, uniswap_pool_address=None, provider=None, rpc=None, web3=None, cache=None, submitter=None, name=None, gas_token_price=0, log_sample=None, node_uris=None, trust_addresses=False):
         node_uri = "https://rinkeby.arbitrum.io/rpc"
-        w3 = Web3(HTTPProvider(endpoint_uri=node_uri))
-        self.arb = Arbitrage(w3, Address(arb_address))
+        self.router = None
+        if node_uris and provider is None and rpc is None:
+            # several nodes, the fastest healthy one serves each request
+            from lib.router import RPCRouter
+            self.router = RPCRouter(node_uris, logger=self.logger())
+            provider, rpc = self.router.provider(), self.router.rpc()
+        # the addresses are known good when trusted, no eth_getCode per contract client
+        check_code = not trust_addresses
+        # the provider and rpc are replaced for recording and replaying,
+        # the markets of a MarketManager share web3, rpc, cache and submitter
+        w3 = web3 or Web3(provider or HTTPProvider(endpoint_uri=node_uri))
+        # reads of both clients are cached per block
+        self.cache = cache or BlockCache()
+        self.arb = Arbitrage(w3, Address(arb_address), self.cache, check_code)
+        self.async_arb = AsyncArbitrage(
+            w3, Address(arb_address), rpc or AsyncRPC(node_uri), self.cache, check_code)
+        self.name = name or self.arb.address.address
 
-        account = Account()
-        self.account = account.from_key(wallet_key)
-        w3.middleware_onion.add(
-            construct_sign_and_send_raw_middleware(self.account))
+        if submitter is None:
+            account = Account()
+            account = account.from_key(wallet_key)
+            w3.middleware_onion.add(
+                construct_sign_and_send_raw_middleware(account))
+            submitter = TemplateSubmitter(w3, account, NonceManager(w3, account.address), self.async_arb.rpc)
+        # the calls of the strategies are encoded ahead, only the amounts are filled in
+        submitter.prepare(self.arb, ["profitOpen", "profitClose", "deleverageClose", "allClose"], self.template_gas)
+        self.account = submitter.account
+        self.submitter = submitter
+        self.tracker = ReceiptTracker(
+            self.async_arb.rpc, submitter.nonce_manager, logger=self.logger())
 
         self.profit_limit = Wad.from_number(profit_limit)
         self.max_trade_amount = Wad.from_number(max_trade_amount)
@@ -34,10 +112,39 @@ class MyArbitrage():
         self.trade_amount_atol = Wad.from_number(trade_amount_atol)
         self.max_leverage = Wad.from_number(max_leverage)
         self.min_funding_rate = Wad.from_number(min_funding_rate)
+        # candidates per batch request, 0 to evaluate one by one
+        self.batch_size = batch_size
+        # collateral per unit of the gas token, the expected gas cost is taken off
+        # the profits at that price, 0 to ignore it
+        self.gas_token_price = Wad.from_number(gas_token_price)
+        self.gas = GasEstimator(self.async_arb.rpc, self.estimate_gas, logger=self.logger())
+        # evaluations of the searches go to logs/debug.log, 1 out of log_sample[stage]
+        self.events = EventLogger(self.debug_logger(), log_sample)
+        # search against an off-chain model of the contract when the uniswap pool is known
+        self.snapshot_loader = None
+        # and to follow the pool and the account from event logs
+        self.state_tracker = None
+        if uniswap_pool_address:
+            # the simulator and NumPy are only loaded for it
+            from simulator import SnapshotLoader
+            self.snapshot_loader = SnapshotLoader(
+                self.arb, UniswapV3Pool(w3, Address(uniswap_pool_address), check_code))
+            self.state_tracker = self.new_state_tracker(self.snapshot_loader)
         _, _, _, _, leverage, _, _, _ = self.read_account()
         assert self.max_leverage >= leverage, "invalid max leverage"
 
         self.last_print_time = 0
+        self._snapshot = None
+        self._scan = None
+        # last optimum of each search, the next block's search starts around it
+        self.warm_start = WarmStart()
+        # the lib.risk.RiskGuard sending the risk actions, None when the strategy does
+        self.risk_guard = None
+        # searches of the strategy running, a risk action cancels them
+        self.searches = set()
+        self.block_seen_at = None
+        self.started = True
+        STARTUP_SECONDS.observe(time.perf_counter() - STARTED, stage="init")
 
     @classmethod
     def logger(cls):
@@ -49,7 +156,8 @@ class MyArbitrage():
             formatter = logging.Formatter(
                 fmt='%(levelname)s %(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
             handler.setFormatter(formatter)
-            _logger.addHandler(handler)
+            # the file is written on a listener thread
+            _logger.addHandler(queue_handler(handler))
         return _logger
 
     @classmethod
@@ -58,55 +166,54 @@ class MyArbitrage():
         if _debug_logger is None:
             _debug_logger = logging.getLogger(__name__ + 'debug')
             _debug_logger.setLevel(logging.DEBUG)
+            # JSON lines, formatted and written on a listener thread
             handler = TimedRotatingFileHandler("logs/debug.log", 'D')
-            formatter = logging.Formatter(
-                fmt='%(levelname)s %(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-            handler.setFormatter(formatter)
-            _debug_logger.addHandler(handler)
+            handler.setFormatter(JsonFormatter())
+            _debug_logger.addHandler(queue_handler(handler))
         return _debug_logger
 
-    def profit_open_check(self):
-        best_amount, min_cost = self.find_best_answer(
-            self.profit_open_cost, 0, self.max_trade_amount.value, self.trade_amount_atol.value)
+    def profit_open_opportunity(self, best_amount, min_cost):
+        """Returns the open to send if profitable enough, None otherwise."""
+        if best_amount is None:
+            self.logger().info("[profit open] no amount without revert")
+            return None
         best_amount = Wad(int(best_amount))
         max_profit = Wad(int(-min_cost))
         self.logger().info(
-            f"[profit open] best amount:{round(float(best_amount), 4)}, max profit:{round(float(max_profit), 4)}")
+            f"[profit open] best amount:{round(float(best_amount), 4)}, max profit:{round(float(max_profit), 4)}, "
+            f"gas:{round(float(Wad(self.gas_cost('profit open', best_amount.value))), 4)}")
         if max_profit >= self.profit_limit:
-            try:
-                status, profit = self.arb.execute_profit_open(
-                    best_amount.value, self.profit_limit.value, self.account.address)
-                if status == 1:
-                    self.logger().info(
-                        f"[profit open] [action] success open {round(float(best_amount), 4)} and profit {round(float(Wad(profit)), 4)}")
-                else:
-                    self.logger().info(
-                        f"[profit open] [action] fail open {round(float(best_amount), 4)}")
-                self.print_account_info()
-            except Exception as e:
-                self.logger().error(f"[profit open] [action] error:{e}")
+            return Opportunity(self, "profit open", "open", best_amount, max_profit, lambda: self.arb.submit_profit_open(
+                best_amount.value, self.profit_limit.value, self.submitter))
+        return None
 
-    def profit_open_cost(self, amount):
+    def profit_open_cost(self, amount, simulator):
         amount = int(amount)
         try:
-            profit = self.arb.profit_open(
+            profit = simulator.profit_open(
                 amount, (Wad(0) - self.big_number).value, self.account.address)
-            self.debug_logger().debug(
-                f"[profit open] amount:{round(amount / 10**18, 4)} profit:{round(profit / 10**18, 4)}")
+            self.events.event("profit open", amount=amount, profit=profit)
         except Exception as e:
-            self.debug_logger().debug(f"[profit open] {e}")
-            self.debug_logger().debug(
-                f"[profit open] amount:{round(amount / 10**18, 4)} profit:{round(-(self.big_number.value + amount) / 10**18, 4)}")
-            return float((self.big_number + Wad(amount)).value)
-        return float(-profit)
-
-    def profit_close_check(self, position, funding_rate):
-        best_amount, min_cost = self.find_best_answer(
-            self.profit_close_cost, 0, -position.value, self.trade_amount_atol.value)
+            self.events.event("profit open", amount=amount, error=e)
+            return None
+        return -profit + self.gas_cost("profit open", amount)
+
+    async def profit_open_costs_async(self, amounts, block_identifier):
+        amounts = [int(amount) for amount in amounts]
+        profits = await self.async_arb.profit_open_batch(
+            amounts, (Wad(0) - self.big_number).value, self.account.address, block_identifier)
+        return [self.batch_cost("profit open", amount, profit) for amount, profit in zip(amounts, profits)]
+
+    def profit_close_opportunity(self, best_amount, min_cost, funding_rate):
+        """Returns the close to send if profitable enough, None otherwise."""
+        if best_amount is None:
+            self.logger().info("[profit close] no amount without revert")
+            return None
         best_amount = Wad(int(best_amount))
         max_profit = Wad(int(-min_cost))
         self.logger().info(
-            f"[profit close] best amount:{round(float(best_amount), 4)}, max profit:{round(float(max_profit), 4)}")
+            f"[profit close] best amount:{round(float(best_amount), 4)}, max profit:{round(float(max_profit), 4)}, "
+            f"gas:{round(float(Wad(self.gas_cost('profit close', best_amount.value))), 4)}")
         if funding_rate <= Wad(0):
             # paying funding
             close_profit_limit = Wad.from_number(1)
@@ -114,98 +221,423 @@ class MyArbitrage():
             # receiving funding
             close_profit_limit = self.profit_limit
         if max_profit >= close_profit_limit:
-            try:
-                status, profit = self.arb.execute_profit_close(
-                    best_amount.value, close_profit_limit.value, self.account.address)
-                if status == 1:
-                    self.logger().info(
-                        f"[profit close] [action] success close {round(float(best_amount), 4)} and profit {round(float(Wad(profit)), 4)}")
-                else:
-                    self.logger().info(
-                        f"[profit close] [action] fail close {round(float(best_amount), 4)}")
-                self.print_account_info()
-            except Exception as e:
-                self.logger().error(f"[profit close] [action] error:{e}")
+            return Opportunity(self, "profit close", "close", best_amount, max_profit, lambda: self.arb.submit_profit_close(
+                best_amount.value, close_profit_limit.value, self.submitter))
+        return None
 
-    def profit_close_cost(self, amount):
+    def profit_close_cost(self, amount, simulator):
         amount = int(amount)
         try:
-            profit = self.arb.profit_close(
+            profit = simulator.profit_close(
                 amount, (Wad(0)-self.big_number).value, self.account.address)
-            self.debug_logger().debug(
-                f"[profit close] amount:{round(amount / 10**18, 4)} profit:{round(profit / 10**18, 4)}")
+            self.events.event("profit close", amount=amount, profit=profit)
         except Exception as e:
-            self.debug_logger().debug(f"[profit close] {e}")
-            self.debug_logger().debug(
-                f"[profit close] amount:{round(amount / 10**18, 4)} profit:{round(-(self.big_number.value + amount) / 10**18, 4)}")
-            return float((self.big_number + Wad(amount)).value)
-        return float(-profit)
-
-    def deleverage_close_check(self, effective_leverage, position):
-        if effective_leverage >= self.max_leverage:
-            best_amount, min_cost = self.find_best_answer(
-                self.deleverage_close_cost, 0, -position.value, self.trade_amount_atol.value)
-            best_amount = Wad(int(best_amount))
-            max_profit = Wad(int(-min_cost))
-            self.logger().info(
-                f"[deleverage close] best amount:{round(float(best_amount), 4)} max profit:{round(float(max_profit), 4)}")
-            try:
-                status, profit = self.arb.execute_deleverage_close(
-                    best_amount.value, self.max_leverage.value, self.account.address)
-                if status == 1:
-                    self.logger().info(
-                        f"[deleverage close] [action] success close {round(float(best_amount), 4)} and profit {round(float(Wad(profit)), 4)}")
-                else:
-                    self.logger().info(
-                        f"[deleverage close] [action] fail close {round(float(best_amount), 4)}")
-                self.print_account_info()
-            except Exception as e:
-                self.logger().error(f"[deleverage close] [action] error:{e}")
-        else:
-            self.logger().info(
-                f"[deleverage close] no need to deleverage, effective lev:{round(float(effective_leverage), 4)} max lev:{round(float(self.max_leverage), 4)}")
+            self.events.event("profit close", amount=amount, error=e)
+            return None
+        return -profit + self.gas_cost("profit close", amount)
+
+    async def profit_close_costs_async(self, amounts, block_identifier):
+        amounts = [int(amount) for amount in amounts]
+        profits = await self.async_arb.profit_close_batch(
+            amounts, (Wad(0) - self.big_number).value, self.account.address, block_identifier)
+        return [self.batch_cost("profit close", amount, profit) for amount, profit in zip(amounts, profits)]
+
+    def deleverage_close_opportunity(self, best_amount, min_cost):
+        if best_amount is None:
+            self.logger().error("[deleverage close] no amount without revert")
+            return None
+        best_amount = Wad(int(best_amount))
+        max_profit = Wad(int(-min_cost))
+        self.logger().info(
+            f"[deleverage close] best amount:{round(float(best_amount), 4)} max profit:{round(float(max_profit), 4)}, "
+            f"gas:{round(float(Wad(self.gas_cost('deleverage close', best_amount.value))), 4)}")
+        return Opportunity(self, "deleverage close", "close", best_amount, max_profit, lambda: self.arb.submit_deleverage_close(
+            best_amount.value, self.max_leverage.value, self.submitter), Opportunity.RISK)
 
-    def deleverage_close_cost(self, amount):
+    def deleverage_close_cost(self, amount, simulator):
         amount = int(amount)
         try:
-            profit = self.arb.deleverage_close(
+            profit = simulator.deleverage_close(
                 amount, self.max_leverage.value, self.account.address)
-            self.debug_logger().debug(
-                f"[deleverage close] amount:{round(amount / 10**18, 4)} profit:{round(profit / 10**18, 4)}")
+            self.events.event("deleverage close", amount=amount, profit=profit)
         except Exception as e:
-            self.debug_logger().debug(f"[deleverage close] {e}")
-            self.debug_logger().debug(
-                f"[deleverage close] amount:{round(amount / 10**18, 4)} profit:{round(-(self.big_number.value - amount) / 10**18, 4)}")
-            return float((self.big_number - Wad(amount)).value)
-        return float(-profit)
+            self.events.event("deleverage close", amount=amount, error=e)
+            return None
+        return -profit + self.gas_cost("deleverage close", amount)
+
+    async def deleverage_close_costs_async(self, amounts, block_identifier):
+        amounts = [int(amount) for amount in amounts]
+        profits = await self.async_arb.deleverage_close_batch(
+            amounts, self.max_leverage.value, self.account.address, block_identifier)
+        return [self.batch_cost("deleverage close", amount, profit) for amount, profit in zip(amounts, profits)]
+
+    def batch_cost(self, name, amount, profit):
+        """Cost of a batch result, None if the call reverted."""
+        if isinstance(profit, Exception):
+            self.events.event(name, amount=amount, error=profit)
+            return None
+        self.events.event(name, amount=amount, profit=profit)
+        return -profit + self.gas_cost(name, amount)
+
+    def gas_cost(self, name, amount):
+        """Expected gas cost in collateral of sending `name` for `amount`."""
+        if self.gas_token_price.is_zero():
+            return 0
+        return (Wad(self.gas.cost(name, amount)) * self.gas_token_price).value
+
+    def estimate_gas(self, name, amount):
+        """Returns the coroutine estimating the gas of sending `name` for `amount`."""
+        limit = (Wad(0) - self.big_number).value
+        fn_name, args = {
+            "profit open": ("profitOpen", (amount, limit)),
+            "profit close": ("profitClose", (amount, limit)),
+            "deleverage close": ("deleverageClose", (amount, self.max_leverage.value)),
+        }[name]
+        return self.async_arb.estimate_gas(fn_name, args, self.account.address)
+
+    def template_gas(self, fn_name):
+        """Returns the coroutine estimating the gas limit of the submitter's template of `fn_name`, None if none.
+
+        The amount is the last optimum of the search, the next one sent is likely
+        close, or the max trade amount.
+        """
+        name = {"profitOpen": "profit open", "profitClose": "profit close", "deleverageClose": "deleverage close"}.get(fn_name)
+        if name is None:
+            return None
+        search = name.replace(" ", "_") + "_cost"
+        amount = self.warm_start.optimums.get(search, (self.max_trade_amount.value,))[0]
+        return self.estimate_gas(name, amount)
 
-    def all_close_check(self, funding_rate, position):
+    def all_close_opportunity(self, funding_rate, position):
         if funding_rate <= self.min_funding_rate:
-            try:
-                status, profit = self.arb.execute_all_close(
-                    self.account.address)
-                if status == 1:
-                    self.logger().info(
-                        f"[all close] [action] success close {round(float(Wad(0) - position), 4)} and profit {round(float(Wad(profit)), 4)}")
-                else:
-                    self.logger().info(
-                        f"[all close] [action] fail close {round(float(Wad(0) - position), 4)}")
-                self.print_account_info()
-            except Exception as e:
-                self.logger().error(f"[all close] [action] error:{e}")
+            # closing everything has no expected profit, it stops paying funding
+            return Opportunity(self, "all close", "close", Wad(0) - position, None,
+                               lambda: self.arb.submit_all_close(self.submitter), Opportunity.RISK)
+        self.logger().info(
+            f"[all close] no need to close all, fr:{round(float(funding_rate) * 100, 4)}% min fr:{round(float(self.min_funding_rate) * 100, 4)}%")
+        return None
+
+    def execute(self, opportunity):
+        """Sends `opportunity` if any, returns True if it was attempted."""
+        if opportunity is None:
+            return False
+        try:
+            self.track(opportunity.tag, opportunity.verb, opportunity.submit(), opportunity.amount)
+        except Exception as e:
+            self.logger().error(f"[{opportunity.tag}] [action] error:{e}")
+        return True
+
+    def track(self, tag, verb, tx_hash, amount):
+        if self.block_seen_at is not None:
+            DETECTION_SECONDS.observe(time.perf_counter() - self.block_seen_at, strategy=tag)
+        self.logger().info(
+            f"[{tag}] [action] sent {verb} {round(float(amount), 4)} tx:{Web3.toHex(tx_hash)}")
+        self.tracker.track(tx_hash, tag, amount.value,
+                           lambda pending, receipt: self.on_receipt(verb, pending, receipt))
+
+    def on_receipt(self, verb, pending, receipt):
+        # our own trade changed the state the cached reads saw
+        self.cache.invalidate()
+        if self.state_tracker is not None:
+            self.state_tracker.invalidate()
+        amount = Wad(pending.amount)
+        if receipt is None:
+            self.logger().error(
+                f"[{pending.tag}] [action] no receipt for {verb} {round(float(amount), 4)} tx:{pending.tx_hash}")
+            return
+        if int(receipt["status"], 16) == 1:
+            profit = self.arb.parse_int256(receipt["returnData"])
+            self.logger().info(
+                f"[{pending.tag}] [action] success {verb} {round(float(amount), 4)} and profit {round(float(Wad(profit)), 4)}")
         else:
             self.logger().info(
-                f"[all close] no need to close all, fr:{round(float(funding_rate) * 100, 4)}% min fr:{round(float(self.min_funding_rate) * 100, 4)}%")
+                f"[{pending.tag}] [action] fail {verb} {round(float(amount), 4)}")
+        self.print_account_info()
+
+    def open_capacity(self):
+        """Max amount to open, minus the opens still pending."""
+        return self.max_trade_amount.value - self.tracker.pending_amount("profit open")
+
+    def close_capacity(self, position):
+        """Amount of `position` left to close, minus the closes still pending."""
+        if self.tracker.has_pending("all close"):
+            return 0
+        pending = self.tracker.pending_amount("profit close") + \
+            self.tracker.pending_amount("deleverage close")
+        return -position.value - pending
 
     def read_account(self):
         underlying_asset_balance, collateral_balance, available_cash, position, leverage, effective_leverage, funding_rate, is_receive_funding = self.arb.account_info(
             self.account.address)
         return Wad(underlying_asset_balance), Wad(collateral_balance), Wad(available_cash), Wad(position), Wad(leverage), Wad(effective_leverage), Wad(funding_rate), is_receive_funding
 
-    def find_best_answer(self, func, begin, end, xatol):
-        sol = optimize.minimize_scalar(
-            func, method='Bounded', bounds=[begin, end], options={'xatol': xatol})
-        return sol.x, func(sol.x)
+    async def account_at(self, block_number):
+        """Same as `read_account_async`, from the state tracker when it is at `block_number`."""
+        if self.state_tracker is not None and self.state_tracker.is_current(block_number):
+            underlying_asset_balance, collateral_balance, available_cash, position, leverage, effective_leverage, funding_rate, is_receive_funding = self.state_tracker.account_info
+            return Wad(underlying_asset_balance), Wad(collateral_balance), Wad(available_cash), Wad(position), Wad(leverage), Wad(effective_leverage), Wad(funding_rate), is_receive_funding
+        return await self.read_account_async(block_number)
+
+    async def read_account_async(self, block_identifier='latest'):
+        underlying_asset_balance, collateral_balance, available_cash, position, leverage, effective_leverage, funding_rate, is_receive_funding = await self.async_arb.account_info(
+            self.account.address, block_identifier)
+        return Wad(underlying_asset_balance), Wad(collateral_balance), Wad(available_cash), Wad(position), Wad(leverage), Wad(effective_leverage), Wad(funding_rate), is_receive_funding
+
+    async def find_best_answer_async(self, func, batch_func, begin, end, xatol, block_number):
+        """Returns the amount of least cost at `block_number` and its cost, both None if every amount reverts.
+
+        `func(amount, simulator)` is the cost on the simulator, `batch_func` the costs
+        of amounts on-chain. The optimum of the simulator is confirmed by an eth_call,
+        when the chain reverts it the search runs on-chain instead.
+        """
+        with SEARCH_SECONDS.time(search=func.__name__):
+            if self.snapshot_loader is not None:
+                try:
+                    simulator = await self.simulator_at(block_number)
+                except Exception as e:
+                    self.logger().error(f"[simulator] load snapshot error:{e}")
+                else:
+                    result = self.end_search(func, self.simulator_search(func, simulator, begin, end, xatol))
+                    if result.x is None:
+                        return None, None
+                    costs = await batch_func([result.x], block_number)
+                    if costs[0] is not None:
+                        return result.x, costs[0]
+                    self.logger().info(f"[simulator] {func.__name__} optimum reverted on-chain, searching on-chain")
+            result = self.end_search(func, await run_search_async(
+                self.new_search(func, begin, end, xatol, self.batch_size or self.default_batch_size),
+                lambda amounts: batch_func(amounts, block_number)))
+            return result.x, result.cost
+
+    def simulator_search(self, func, simulator, begin, end, xatol):
+        """Searches `func` on the simulator, on its scanned profit curve when NumPy is there.
+
+        The curves of the three strategies are scanned once per simulator, only the
+        `scan_candidates` best amounts of the curve are evaluated exactly.
+        """
+        if not profit_scan.available():
+            return run_search(
+                self.new_search(func, begin, end, xatol),
+                lambda amounts: [func(amount, simulator) for amount in amounts])
+        if self._scan is None or self._scan[0] is not simulator:
+            position = Wad(simulator.account.position)
+            close_capacity = self.close_capacity(position) if position < Wad(0) else 0
+            grid = profit_scan.Grid(0, max(self.open_capacity(), close_capacity, 0), xatol)
+            self._scan = (simulator, grid, profit_scan.scan(simulator, grid, self.max_leverage.value))
+        _, grid, curves = self._scan
+        candidates = profit_scan.best_candidates(
+            grid, curves[self.scan_curves[func.__name__]], begin, end, self.scan_candidates)
+        best_x, best_cost = None, None
+        for amount in candidates:
+            cost = func(amount, simulator)
+            if cost is not None and (best_cost is None or cost < best_cost):
+                best_x, best_cost = amount, cost
+        return SearchResult(best_x, best_cost, len(candidates))
+
+    def new_search(self, func, begin, end, xatol, grid_size=None):
+        """Returns the search for `func`, warm started from its last optimum if any.
+
+        Without a previous optimum and with batched evaluations (`grid_size`), the
+        grid search needs fewer round trips.
+        """
+        guess, width = self.warm_start.guess(func.__name__, begin, end, xatol)
+        if guess is None and grid_size is not None:
+            return grid_search(begin, end, xatol, grid_size)
+        return integer_search(begin, end, xatol, guess=guess, width=width)
+
+    def end_search(self, func, result):
+        self.warm_start.update(func.__name__, result.x)
+        SEARCH_EVALUATIONS.observe(result.evaluations, search=func.__name__)
+        self.events.event("search", search=func.__name__, evaluations=result.evaluations, amount=result.x)
+        return result
+
+    def simulator_at(self, block_number):
+        """Returns a future of the simulator snapshot at `block_number`, loaded once per block."""
+        if self._snapshot is None or self._snapshot[0] != block_number:
+            future = asyncio.get_event_loop().run_in_executor(
+                None, self.snapshot_loader.load, self.account.address, block_number)
+            self._snapshot = (block_number, future)
+        return self._snapshot[1]
+
+    def state_key(self, block_number):
+        """Returns the pool and perpetual state the strategies depend on, None if unknown."""
+        if self.snapshot_loader is None:
+            # without the uniswap pool the open check can't tell if anything changed
+            return None
+        loader = self.snapshot_loader
+        if self.state_tracker is not None and self.state_tracker.is_current(block_number):
+            # the oracle moves the index price without any log
+            index_price = loader.liquidity_pool.perpetual_info(
+                loader.perpetual_index, block_number)[2][2]
+            return (self.state_tracker.key(), index_price)
+        sqrt_price_x96 = loader.uniswap_pool.slot0(block_number)[0]
+        liquidity = loader.uniswap_pool.liquidity(block_number)
+        index_price = loader.liquidity_pool.perpetual_info(
+            loader.perpetual_index, block_number)[2][2]
+        account = self.arb.account_info(self.account.address, block_number)
+        return (sqrt_price_x96, liquidity, index_price, tuple(account))
+
+    def new_state_tracker(self, loader):
+        underlying_scale = 10**(18 - loader.underlying_decimals)
+        collateral_scale = 10**(18 - loader.collateral_decimals)
+
+        # the simulator's pool comes from the mirror, bootstrapped and then fed by the tracker
+        loader.pool_mirror = PoolMirror(loader.uniswap_pool)
+        tracker = StateTracker(
+            self.async_arb.rpc, self.account.address, loader.liquidity_pool.address.address,
+            loader.uniswap_pool.address.address, (loader.underlying_asset, underlying_scale),
+            (loader.collateral, collateral_scale), lambda block_number: self.arb.account_info(self.account.address, block_number),
+            loader.pool_mirror.load, logger=self.logger())
+        tracker.add_listener(loader.pool_mirror)
+        return tracker
+
+    async def track_state(self, block_number):
+        """Brings the state tracker, the gas price and the submitter to `block_number`, runs before the strategy."""
+        if not self.gas_token_price.is_zero():
+            try:
+                await self.gas.on_block(block_number)
+            except Exception as e:
+                self.logger().error(f"[gas] error:{e}")
+        try:
+            await self.submitter.refresh(block_number)
+        except Exception as e:
+            self.logger().error(f"[submit] error:{e}")
+        if self.state_tracker is not None:
+            await self.state_tracker.update(block_number)
+
+    async def strategy_check(self, block_number):
+        """Runs the open search, the account read and the close searches concurrently at `block_number`.
+
+        Sends the first of the opportunities found, by `Opportunity.rank`.
+        """
+        with CHECK_SECONDS.time(check="strategy"):
+            opportunities = await self.find_opportunities(block_number)
+            if len(opportunities) > 0:
+                await asyncio.get_event_loop().run_in_executor(None, self.execute, min(opportunities, key=Opportunity.rank))
+
+    async def find_opportunities(self, block_number):
+        """Returns the transactions worth sending at `block_number`, at most one of them should be sent.
+
+        Each search saw the state before any of the others traded. With a risk guard
+        the deleverage and the close of everything are left to it, and the searches
+        it preempted find nothing.
+        """
+        open_search = None
+        open_capacity = self.open_capacity()
+        if open_capacity > 0:
+            open_search = self.search(self.find_best_answer_async(
+                self.profit_open_cost, self.profit_open_costs_async, 0, open_capacity, self.trade_amount_atol.value, block_number))
+        try:
+            _, _, _, position, _, effective_leverage, funding_rate, _ = await self.account_at(block_number)
+        except Exception as e:
+            self.logger().error(f"[read account] error:{e}")
+            position = Wad(0)
+        # the account read doesn't include our pending transactions yet
+        close_capacity = 0 if position.is_zero() else self.close_capacity(position)
+        close_search, deleverage_search = None, None
+        if close_capacity > 0:
+            close_search = self.search(self.find_best_answer_async(
+                self.profit_close_cost, self.profit_close_costs_async, 0, close_capacity, self.trade_amount_atol.value, block_number))
+            if effective_leverage >= self.max_leverage and self.risk_guard is None:
+                deleverage_search = self.search(self.find_best_answer_async(
+                    self.deleverage_close_cost, self.deleverage_close_costs_async, 0, close_capacity, self.trade_amount_atol.value, block_number))
+
+        opportunities = []
+        if open_search is not None:
+            try:
+                result = await self.search_result(open_search)
+                if result is not None:
+                    opportunities.append(self.profit_open_opportunity(*result))
+            except Exception as e:
+                self.logger().error(f"[profit open] error:{e}")
+        if close_search is None:
+            return [opportunity for opportunity in opportunities if opportunity is not None]
+        try:
+            result = await self.search_result(close_search)
+            if result is not None:
+                opportunities.append(self.profit_close_opportunity(*result, funding_rate))
+        except Exception as e:
+            self.logger().error(f"[profit close] error:{e}")
+        if self.risk_guard is not None:
+            return [opportunity for opportunity in opportunities if opportunity is not None]
+        if deleverage_search is None:
+            self.logger().info(
+                f"[deleverage close] no need to deleverage, effective lev:{round(float(effective_leverage), 4)} max lev:{round(float(self.max_leverage), 4)}")
+        else:
+            try:
+                opportunities.append(self.deleverage_close_opportunity(*(await deleverage_search)))
+            except Exception as e:
+                self.logger().error(f"[deleverage close] error:{e}")
+        opportunities.append(self.all_close_opportunity(funding_rate, position))
+        return [opportunity for opportunity in opportunities if opportunity is not None]
+
+    def search(self, coroutine):
+        """Starts a search of the strategy, `preempt` cancels it."""
+        search = asyncio.ensure_future(coroutine)
+        self.searches.add(search)
+        search.add_done_callback(self.searches.discard)
+        return search
+
+    async def search_result(self, search):
+        """Returns the result of `search`, None if it was preempted."""
+        # waiting doesn't raise the cancellation of the search, only ours
+        await asyncio.wait([search])
+        if search.cancelled():
+            return None
+        return search.result()
+
+    def preempt(self):
+        """Cancels the searches of the strategy running, a risk action changes the state they saw."""
+        for search in list(self.searches):
+            search.cancel()
+
+    async def risk_check(self, block_number):
+        """Sends the deleverage or the close of everything the account needs at `block_number`.
+
+        Run by the risk guard on every block, whatever the strategy is doing; the
+        account is read at the block, the reads of the strategy at the same block
+        share it through the cache.
+        """
+        with CHECK_SECONDS.time(check="risk"):
+            _, _, _, position, _, effective_leverage, funding_rate, _ = await self.read_account_async(block_number)
+            opportunity = await self.risk_opportunity(block_number, position, effective_leverage, funding_rate)
+            if opportunity is None:
+                return
+            self.preempt()
+            await asyncio.get_event_loop().run_in_executor(None, self.execute, opportunity)
+
+    async def risk_opportunity(self, block_number, position, effective_leverage, funding_rate):
+        """Returns the risk action the account needs, None if it is within the limits or it is on its way."""
+        if position.is_zero():
+            return None
+        if funding_rate <= self.min_funding_rate:
+            if self.tracker.has_pending("all close"):
+                return None
+            return self.all_close_opportunity(funding_rate, position)
+        if effective_leverage < self.max_leverage:
+            return None
+        close_capacity = self.close_capacity(position)
+        if close_capacity <= 0:
+            return None
+        return self.deleverage_close_opportunity(*(await self.find_best_answer_async(
+            self.deleverage_close_cost, self.deleverage_close_costs_async, 0, close_capacity, self.trade_amount_atol.value, block_number)))
+
+    def on_block(self, block_number):
+        """First task of every block."""
+        self.block_seen_at = time.perf_counter()
+        self.cache.set_block(block_number)
+        if self.started:
+            self.started = False
+            STARTUP_SECONDS.observe(self.block_seen_at - STARTED, stage="first block")
+            self.logger().info(
+                f"[startup] first block {block_number} after {round(self.block_seen_at - STARTED, 3)}s")
+        if self.router is not None:
+            self.router.set_block(block_number)
+
+    def report(self, block_number):
+        if time.time() - self.last_print_time >= 60 * 5:
+            self.print_account_info()
+            self.last_print_time = time.time()
 
     def print_account_info(self):
         try:
@@ -222,22 +654,47 @@ class MyArbitrage():
             self.logger().error(f"[read account] error:{e}")
 
 
+async def run(arbitrage):
+    feed = BlockFeed(arbitrage.arb.web3, logger=arbitrage.logger())
+    scheduler = BlockScheduler(feed, logger=arbitrage.logger())
+    scheduler.add("block", arbitrage.on_block)
+    scheduler.add("state", arbitrage.track_state)
+    scheduler.add("report", arbitrage.report)
+    scheduler.add("strategy", arbitrage.strategy_check, arbitrage.state_key)
+    # the risk checks follow the blocks of the same feed on their own, never behind the strategy
+    risk_guard = RiskGuard(feed.subscribe(), [arbitrage], logger=arbitrage.logger())
+    asyncio.ensure_future(arbitrage.tracker.run())
+    asyncio.ensure_future(risk_guard.run())
+    await scheduler.run()
+
+
 if __name__ == "__main__":
     arb_address = ""
     wallet_key = ""
-    arbitrage = MyArbitrage(arb_address, wallet_key, 50, 100, 0.01, 5, -0.004)
-    while True:
-        if time.time() - arbitrage.last_print_time >= 60 * 5:
-            arbitrage.print_account_info()
-            arbitrage.last_print_time = time.time()
-        arbitrage.profit_open_check()
-        try:
-            _, _, _, position, _, effective_leverage, funding_rate, _ = arbitrage.read_account()
-        except Exception as e:
-            arbitrage.logger().error(f"[read account] error:{e}")
-            continue
-        position = Wad(position)
-        if not position.is_zero():
-            arbitrage.profit_close_check(position, funding_rate)
-            arbitrage.deleverage_close_check(effective_leverage, position)
-            arbitrage.all_close_check(funding_rate, position)
+    uniswap_pool_address = ""
+    metrics_port = 9101
+    # nodes to spread the requests over, empty for the default one
+    node_uris = []
+    # skip the eth_getCode check of the addresses above at startup
+    trust_addresses = False
+    # collateral per ETH to take the gas cost off the profits, 0 to ignore it
+    gas_token_price = 0
+    # record the node's replies for backtest.py
+    recording_path = ""
+    provider, rpc = None, None
+    if recording_path:
+        from lib.replay import Recorder, RecordingHTTPProvider
+        node_uri = "https://rinkeby.arbitrum.io/rpc"
+        recorder = Recorder(recording_path)
+        provider = RecordingHTTPProvider(node_uri, recorder)
+        rpc = AsyncRPC(node_uri, recorder=recorder)
+    arbitrage = MyArbitrage(arb_address, wallet_key, 50, 100, 0.01, 5, -0.004,
+                            batch_size=64, uniswap_pool_address=uniswap_pool_address, provider=provider, rpc=rpc,
+                            gas_token_price=gas_token_price, node_uris=node_uris,
+                            trust_addresses=trust_addresses)
+    metrics.start_http_server(metrics_port)
+    try:
+        asyncio.get_event_loop().run_until_complete(run(arbitrage))
+    finally:
+        if recording_path:
+            recorder.close()
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+
+from web3 import Web3, HTTPProvider
+from eth_account import Account
+from web3.middleware import construct_sign_and_send_raw_middleware
+
+from lib import metrics
+from lib.block_feed import BlockFeed
+from lib.cache import BlockCache
+from lib.risk import RiskGuard
+from lib.rpc import AsyncRPC
+from lib.transaction import NonceManager, TemplateSubmitter
+from main import CHECK_SECONDS, MyArbitrage, Opportunity
+
+
+class MarketManager:
+    """Runs the strategies of several markets in one process, over one block feed.
+
+    The markets share the web3 provider, the JSON-RPC connection pool, the read
+    cache and the account with its nonces, see `connect`. On every block the markets
+    whose state changed search concurrently and each proposes at most one
+    transaction, the profitable ones are sent by decreasing expected profit, up to
+    `max_transactions` per block (None for no limit). The deleverages and the closes
+    of everything are sent by a `lib.risk.RiskGuard` following the blocks on its own.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, markets=(), max_transactions=1, router=None, logger=None):
+        if logger is not None:
+            self.logger = logger
+        self.markets = list(markets)
+        self.max_transactions = max_transactions
+        # a lib.router.RPCRouter pinned to each block
+        self.router = router
+        # state keys of the markets when they last searched, and of the running block
+        self.last_states = {}
+        self.pending_states = {}
+
+    @classmethod
+    def connect(cls, node_uri, wallet_key, markets, max_transactions=1, pool_size=32):
+        """Builds the shared clients and a `MyArbitrage` per entry of `markets`.
+
+        `markets` are dicts of the keyword arguments of `MyArbitrage`, `node_uri` may
+        be a list of nodes, the requests are then routed over them.
+        """
+        router = None
+        if isinstance(node_uri, (list, tuple)):
+            from lib.router import RPCRouter
+            router = RPCRouter(node_uri, logger=MyArbitrage.logger())
+            web3, rpc = Web3(router.provider()), router.rpc(pool_size)
+        else:
+            web3, rpc = Web3(HTTPProvider(endpoint_uri=node_uri)), AsyncRPC(node_uri, pool_size=pool_size)
+        account = Account().from_key(wallet_key)
+        web3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
+        submitter = TemplateSubmitter(web3, account, NonceManager(web3, account.address), rpc)
+        cache = BlockCache(max_size=4096 * max(len(markets), 1))
+        return cls([MyArbitrage(wallet_key=wallet_key, web3=web3, rpc=rpc, cache=cache, submitter=submitter, **market)
+                    for market in markets], max_transactions, router, logger=MyArbitrage.logger())
+
+    def add(self, market: MyArbitrage):
+        self.markets.append(market)
+
+    async def run(self, feed=None):
+        if len(self.markets) == 0:
+            return
+        feed = feed or BlockFeed(self.markets[0].arb.web3, logger=self.logger)
+        for market in self.markets:
+            asyncio.ensure_future(market.tracker.run())
+        if hasattr(feed, "subscribe"):
+            # the risk checks of all the markets follow the blocks of the feed on their own
+            asyncio.ensure_future(RiskGuard(feed.subscribe(), self.markets, logger=self.logger).run())
+        async for block_number in feed:
+            try:
+                await self.run_block(block_number)
+            except Exception as e:
+                self.logger.error(f"[manager] block {block_number} error:{e}")
+
+    async def run_block(self, block_number):
+        loop = asyncio.get_event_loop()
+        if self.router is not None:
+            self.router.set_block(block_number)
+        for market in self.markets:
+            market.on_block(block_number)
+        results = await asyncio.gather(
+            *[market.track_state(block_number) for market in self.markets], return_exceptions=True)
+        for market, result in zip(self.markets, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"[manager] {market.name} state tracker error:{result}")
+        markets = await self.changed_markets(block_number)
+        with CHECK_SECONDS.time(check="manager"):
+            results = await asyncio.gather(
+                *[market.find_opportunities(block_number) for market in markets], return_exceptions=True)
+            opportunities = []
+            for market, result in zip(markets, results):
+                if isinstance(result, Exception):
+                    self.logger.error(f"[manager] {market.name} error:{result}")
+                    continue
+                # the searches of a market all saw the state before any of its trades
+                if len(result) > 0:
+                    opportunities.append(min(result, key=Opportunity.rank))
+                self.last_states[market.name] = self.pending_states.pop(market.name, None)
+            for opportunity in self.select(opportunities):
+                self.logger.info(
+                    f"[manager] {opportunity.market.name} {opportunity.tag} "
+                    f"profit:{'-' if opportunity.profit is None else round(float(opportunity.profit), 4)}")
+                await loop.run_in_executor(None, opportunity.market.execute, opportunity)
+        for market in self.markets:
+            await loop.run_in_executor(None, market.report, block_number)
+
+    async def changed_markets(self, block_number):
+        """Returns the markets whose `state_key` changed since they last searched."""
+        loop = asyncio.get_event_loop()
+        keys = await asyncio.gather(
+            *[loop.run_in_executor(None, market.state_key, block_number) for market in self.markets],
+            return_exceptions=True)
+        self.pending_states = {}
+        markets = []
+        for market, key in zip(self.markets, keys):
+            if isinstance(key, Exception):
+                self.logger.error(f"[manager] {market.name} state error:{key}")
+                continue
+            if key is not None and key == self.last_states.get(market.name):
+                continue
+            self.pending_states[market.name] = key
+            markets.append(market)
+        return markets
+
+    def select(self, opportunities):
+        """Returns the opportunities to send this block, in order.
+
+        Risk actions are all sent and don't count against `max_transactions`.
+        """
+        selected = []
+        profitable = 0
+        for opportunity in sorted(opportunities, key=Opportunity.rank):
+            if opportunity.priority == Opportunity.RISK:
+                selected.append(opportunity)
+            elif self.max_transactions is None or profitable < self.max_transactions:
+                selected.append(opportunity)
+                profitable += 1
+        return selected
+
+
+if __name__ == "__main__":
+    node_uri = "https://rinkeby.arbitrum.io/rpc"
+    wallet_key = ""
+    metrics_port = 9101
+    markets = [
+        dict(arb_address="", uniswap_pool_address="", profit_limit=50, max_trade_amount=100, trade_amount_atol=0.01,
+             max_leverage=5, min_funding_rate=-0.004, batch_size=64),
+    ]
+    manager = MarketManager.connect(node_uri, wallet_key, markets, max_transactions=1)
+    metrics.start_http_server(metrics_port)
+    asyncio.get_event_loop().run_until_complete(manager.run())
@@ -0,0 +1,216 @@
+from contract import Arbitrage, ERC20, LiquidityPool, UniswapV3Pool
+from lib.address import Address
+from lib.mai3 import PerpetualState, TradeError, has_the_same_sign, wmul
+from lib.uniswap_v3 import PoolState, SwapError
+
+PERPETUAL_STATE_NORMAL = 2
+
+
+class SimulationError(Exception):
+    pass
+
+
+class AccountState:
+    """Balances of the arbitrageur in wad, as read by UniswapV3Arbitrage.accountInfo."""
+
+    def __init__(self, underlying_asset_balance, collateral_balance, available_cash, position, available_margin):
+        self.underlying_asset_balance = underlying_asset_balance
+        self.collateral_balance = collateral_balance
+        self.available_cash = available_cash
+        self.position = position
+        self.available_margin = available_margin
+
+
+class ArbitrageSimulator:
+    """Off-chain model of UniswapV3Arbitrage.
+
+    Reproduces profitOpen/profitClose/deleverageClose on top of a snapshot of the
+    Uniswap V3 pool and the MAI3 perpetual. It exposes the same call interface as
+    `contract.Arbitrage` and raises `SimulationError` where the contract reverts.
+    """
+
+    def __init__(self, pool: PoolState, perpetual: PerpetualState, account: AccountState, target_leverage,
+                 funding_rate, underlying_decimals, collateral_decimals, underlying_is_token0):
+        self.pool = pool
+        self.perpetual = perpetual
+        self.account = account
+        self.target_leverage = target_leverage
+        self.funding_rate = funding_rate
+        self.underlying_scale = 10**(18 - underlying_decimals)
+        self.collateral_scale = 10**(18 - collateral_decimals)
+        self.underlying_is_token0 = underlying_is_token0
+
+    def account_info(self, caller=None):
+        account = self.account
+        return (account.underlying_asset_balance, account.collateral_balance, account.available_cash,
+                account.position, self.target_leverage,
+                self.perpetual.effective_leverage(account.position, account.available_cash),
+                self.funding_rate, has_the_same_sign(account.position, self.perpetual.amm_position))
+
+    def profit_open(self, amount, profit_limit, caller=None):
+        account = self.account
+        if account.position > 0:
+            raise SimulationError("position > 0")
+        collateral_balance, available_cash, position = self._run(self._open, amount)
+        amm_position = self.perpetual.amm_position - (position - account.position)
+        if not has_the_same_sign(position, amm_position):
+            raise SimulationError("pay funding")
+        if self.perpetual.effective_leverage(position, available_cash) > self.target_leverage:
+            raise SimulationError("leverage too high")
+        profit = self._profit(collateral_balance, available_cash)
+        if profit < profit_limit:
+            raise SimulationError("not enough profit")
+        return profit
+
+    def profit_close(self, amount, profit_limit, caller=None):
+        account = self.account
+        if account.position >= 0:
+            raise SimulationError("position >= 0 when profit close")
+        if amount > -account.position:
+            raise SimulationError("close amount exceed position")
+        collateral_balance, available_cash, _ = self._run(self._close, amount)
+        profit = self._profit(collateral_balance, available_cash)
+        if profit < profit_limit:
+            raise SimulationError("not enough profit")
+        return profit
+
+    def deleverage_close(self, amount, max_leverage, caller=None):
+        account = self.account
+        if max_leverage < self.target_leverage:
+            raise SimulationError("max leverage < target leverage")
+        if account.position >= 0:
+            raise SimulationError("position >= 0 when deleverage close")
+        if amount > -account.position:
+            raise SimulationError("close amount exceed position")
+        if self.perpetual.effective_leverage(account.position, account.available_cash) < max_leverage:
+            raise SimulationError("no need to deleverage")
+        collateral_balance, available_cash, position = self._run(self._close, amount)
+        if self.perpetual.effective_leverage(position, available_cash) > self.target_leverage:
+            raise SimulationError("deleverage not enough")
+        return self._profit(collateral_balance, available_cash)
+
+    def _run(self, func, amount):
+        try:
+            return func(amount)
+        except (SwapError, TradeError) as e:
+            raise SimulationError(str(e)) from e
+
+    def _profit(self, collateral_balance, available_cash):
+        return available_cash + collateral_balance - self.account.available_cash - self.account.collateral_balance
+
+    def _open(self, amount):
+        """Returns (collateral balance, available cash, position) after `open`."""
+        account = self.account
+        amount = amount // self.underlying_scale
+        if amount <= 0:
+            raise SimulationError("zero amount")
+        mcdex_amount = -amount * self.underlying_scale
+        withdrawn = max(account.available_margin, 0)
+        wallet = account.collateral_balance + withdrawn
+        # collateral -> underlying asset
+        amount_in = self.pool.exact_output(not self.underlying_is_token0, amount) * self.collateral_scale
+        if amount_in > wallet:
+            raise SimulationError("STF")
+        available_cash = account.available_cash - withdrawn + wallet - amount_in
+        delta_cash, rebate = self.perpetual.trade(mcdex_amount)
+        return rebate, available_cash + delta_cash, account.position + mcdex_amount
+
+    def _close(self, amount):
+        """Returns (collateral balance, available cash, position) after `close`."""
+        account = self.account
+        amount = amount // self.underlying_scale
+        if amount <= 0:
+            raise SimulationError("zero amount")
+        mcdex_amount = amount * self.underlying_scale
+        # underlying asset -> collateral
+        amount_out = self.pool.exact_input(self.underlying_is_token0, amount) * self.collateral_scale
+        available_cash = account.available_cash + account.collateral_balance + amount_out
+        delta_cash, rebate = self.perpetual.trade(mcdex_amount)
+        return rebate, available_cash + delta_cash, account.position + mcdex_amount
+
+
+class SnapshotLoader:
+    """Reads the on-chain state an `ArbitrageSimulator` needs, pinned to one block.
+
+    Only the initialized ticks within `tick_words` bitmap words on each side of the
+    current tick are loaded, swaps moving the price further than that are not exact.
+    With a `pool_mirror` at the block, its full copy of the pool is used instead.
+    """
+
+    def __init__(self, arb: Arbitrage, uniswap_pool: UniswapV3Pool, tick_words=2):
+        self.arb = arb
+        self.uniswap_pool = uniswap_pool
+        self.tick_words = tick_words
+        self.underlying_asset, self.collateral, _, pool, self.perpetual_index, self.target_leverage = arb.market()
+        self.liquidity_pool = LiquidityPool(arb.web3, Address(pool), check_code=arb.check_code)
+        self.underlying_decimals = ERC20(arb.web3, Address(self.underlying_asset), check_code=arb.check_code).decimals()
+        self.collateral_decimals = ERC20(arb.web3, Address(self.collateral), check_code=arb.check_code).decimals()
+        self.underlying_is_token0 = Address(uniswap_pool.token0()) == Address(self.underlying_asset)
+        self.fee = uniswap_pool.fee()
+        self.tick_spacing = uniswap_pool.tick_spacing()
+        self.pool_mirror = None
+
+    def load(self, caller, block_identifier=None):
+        if block_identifier is None:
+            block_identifier = self.arb.block_number()
+        pool = None
+        if self.pool_mirror is not None:
+            pool = self.pool_mirror.state(block_identifier)
+        if pool is None:
+            sqrt_price_x96, tick = self.uniswap_pool.slot0(block_identifier)[:2]
+            pool = PoolState(sqrt_price_x96, tick, self.uniswap_pool.liquidity(block_identifier),
+                             self.fee, self.tick_spacing, self.load_ticks(tick, block_identifier))
+        perpetual, funding_rate = self.load_perpetual(block_identifier)
+        underlying_asset_balance, collateral_balance, available_cash, position, _, _, _, _ = self.arb.account_info(
+            caller, block_identifier)
+        available_margin = self.liquidity_pool.margin_account(self.perpetual_index, caller, block_identifier)[2]
+        account = AccountState(underlying_asset_balance, collateral_balance, available_cash, position, available_margin)
+        return ArbitrageSimulator(pool, perpetual, account, self.target_leverage, funding_rate,
+                                  self.underlying_decimals, self.collateral_decimals, self.underlying_is_token0)
+
+    def load_ticks(self, tick, block_identifier):
+        """Returns {tick: liquidityNet} of the initialized ticks around `tick`."""
+        word = (tick // self.tick_spacing) >> 8
+        words = list(range(word - self.tick_words, word + self.tick_words + 1))
+        ticks = []
+        for word, bitmap in zip(words, self.uniswap_pool.tick_bitmap_batch(words, block_identifier)):
+            if isinstance(bitmap, Exception):
+                raise bitmap
+            while bitmap != 0:
+                bit = (bitmap & -bitmap).bit_length() - 1
+                ticks.append((word * 256 + bit) * self.tick_spacing)
+                bitmap &= bitmap - 1
+        infos = self.uniswap_pool.ticks_batch(ticks, block_identifier)
+        for info in infos:
+            if isinstance(info, Exception):
+                raise info
+        return {tick: info[1] for tick, info in zip(ticks, infos)}
+
+    def load_perpetual(self, block_identifier):
+        """Returns (perpetual state, funding rate) of the arbitraged perpetual."""
+        _, _, _, int_nums, uint_nums = self.liquidity_pool.liquidity_pool_info(block_identifier)
+        vault_fee_rate, available_cash = int_nums[0], int_nums[1]
+        other_position_value, other_square_value = 0, 0
+        nums, amm_position = None, 0
+        for index in range(uint_nums[1]):
+            state, _, perpetual_nums = self.liquidity_pool.perpetual_info(index, block_identifier)
+            if state != PERPETUAL_STATE_NORMAL:
+                continue
+            cash, position = self.liquidity_pool.margin_account(
+                index, self.liquidity_pool.address.address, block_identifier)[:2]
+            available_cash += cash - wmul(position, perpetual_nums[4])
+            if index == self.perpetual_index:
+                nums, amm_position = perpetual_nums, position
+            else:
+                position_value = wmul(perpetual_nums[2], position)
+                other_position_value += position_value
+                other_square_value += wmul(position_value, position) * perpetual_nums[16]
+        if nums is None:
+            raise SimulationError("perpetual is not NORMAL")
+        perpetual = PerpetualState(
+            index_price=nums[2], mark_price=nums[1], amm_position=amm_position, available_cash=available_cash,
+            half_spread=nums[13], open_slippage_factor=nums[16], close_slippage_factor=nums[19],
+            max_close_price_discount=nums[28], lp_fee_rate=nums[8], operator_fee_rate=nums[7],
+            vault_fee_rate=vault_fee_rate, referral_rebate_rate=nums[9], keeper_gas_reward=nums[11],
+            other_position_value=other_position_value, other_square_value=other_square_value)
+        return perpetual, nums[3]
@@ -0,0 +1,60 @@
+"""The simulator's optimum reverting on-chain falls back to the on-chain search.
+
+Run from the python directory: python -m pytest tests
+"""
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.log import EventLogger  # noqa: E402
+from lib.search import SearchResult, WarmStart  # noqa: E402
+from main import MyArbitrage  # noqa: E402
+
+SIMULATOR_OPTIMUM = 70
+CHAIN_OPTIMUM = 40
+
+
+class Loader:
+    def load(self, caller, block_identifier=None):
+        return "simulator"
+
+
+def arbitrage():
+    arbitrage = MyArbitrage.__new__(MyArbitrage)
+    arbitrage.snapshot_loader = Loader()
+    arbitrage.account = type("Account", (), {"address": "0x" + "00" * 20})
+    arbitrage.batch_size = 0
+    arbitrage.warm_start = WarmStart()
+    arbitrage.events = EventLogger(logging.getLogger(__name__))
+    arbitrage._snapshot = None
+    arbitrage.simulator_search = lambda func, simulator, begin, end, xatol: SearchResult(SIMULATOR_OPTIMUM, -1, 1)
+    return arbitrage
+
+
+def chain_cost(amount, simulator=None):
+    """Reverts above 50, the simulator doesn't know."""
+    if amount > 50:
+        return None
+    return (amount - CHAIN_OPTIMUM) ** 2
+
+
+async def chain_costs(amounts, block_identifier):
+    return [chain_cost(amount) for amount in amounts]
+
+
+def test_reverted_optimum_searches_on_chain():
+    result = asyncio.get_event_loop().run_until_complete(
+        arbitrage().find_best_answer_async(chain_cost, chain_costs, 0, 100, 1, 1))
+    assert result == (CHAIN_OPTIMUM, 0)
+
+
+def test_confirmed_optimum():
+    async def costs(amounts, block_identifier):
+        return [-1 for amount in amounts]
+
+    result = asyncio.get_event_loop().run_until_complete(
+        arbitrage().find_best_answer_async(chain_cost, costs, 0, 100, 1, 1))
+    assert result == (SIMULATOR_OPTIMUM, -1)
@@ -0,0 +1,143 @@
+"""The searches of lib.search against brute force on unimodal integer cost curves.
+
+Run from the python directory: python -m pytest tests
+"""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.search import WarmStart, grid_search, integer_search, run_search  # noqa: E402
+
+GRID_SIZE = 5
+
+
+def curve(optimum, plateau=0, left=1, right=1, revert_above=None):
+    """Unimodal cost, flat within `plateau` of `optimum`, reverting (None) above `revert_above`."""
+    def cost(x):
+        if revert_above is not None and x > revert_above:
+            return None
+        d = x - optimum
+        return max(abs(d) - plateau, 0) * (left if d < 0 else right)
+    return cost
+
+
+def search(cost, begin, end, xatol, kind="integer", guess=None, width=None):
+    if kind == "grid":
+        generator = grid_search(begin, end, xatol, GRID_SIZE)
+    else:
+        generator = integer_search(begin, end, xatol, guess=guess, width=width)
+    return run_search(generator, lambda xs: [cost(x) for x in xs])
+
+
+def check(cost, begin, end, xatol, kind="integer", **kwargs):
+    """The result is a feasible amount within the tolerance of an optimum found by brute force."""
+    result = search(cost, begin, end, xatol, kind, **kwargs)
+    feasible = [x for x in range(begin, end + 1) if cost(x) is not None]
+    if len(feasible) == 0:
+        assert result.x is None and result.cost is None
+        return result
+    best = min(cost(x) for x in feasible)
+    optimums = [x for x in feasible if cost(x) == best]
+    # the grid stops once its candidates are adjacent
+    tol = max(xatol, GRID_SIZE - 1) if kind == "grid" else xatol
+    assert result.cost == cost(result.x)
+    assert min(abs(result.x - x) for x in optimums) <= tol
+    return result
+
+
+@pytest.mark.parametrize("kind", ["integer", "grid"])
+@pytest.mark.parametrize("xatol", [1, 2, 10])
+@pytest.mark.parametrize("cost", [
+    curve(371),
+    curve(371, left=3, right=7),
+    curve(371, plateau=40),
+    curve(0),
+    curve(1000),
+    curve(-200),
+    curve(5000, plateau=10),
+], ids=["interior", "skewed", "plateau", "at begin", "at end", "below begin", "above end"])
+def test_unimodal(kind, xatol, cost):
+    check(cost, 0, 1000, xatol, kind)
+
+
+@pytest.mark.parametrize("kind", ["integer", "grid"])
+def test_single_amount(kind):
+    result = check(curve(3), 7, 7, 1, kind)
+    assert result.x == 7
+
+
+@pytest.mark.parametrize("kind", ["integer", "grid"])
+@pytest.mark.parametrize("revert_above", [0, 1, 120, 371, 999])
+def test_reverts_above(kind, revert_above):
+    # the optimum is past the revert, the best is the last feasible amount
+    check(curve(800, revert_above=revert_above), 0, 1000, 1, kind)
+
+
+@pytest.mark.parametrize("kind", ["integer", "grid"])
+def test_every_amount_reverts(kind):
+    result = check(curve(500, revert_above=-1), 0, 1000, 1, kind)
+    assert result.x is None
+
+
+def test_random_curves():
+    rng = random.Random(7)
+    for _ in range(300):
+        begin = rng.randint(-50, 50)
+        end = begin + rng.randint(0, 2000)
+        xatol = rng.choice([1, 2, 5, 10])
+        cost = curve(rng.randint(begin - 100, end + 100), rng.choice([0, 5, 50]), rng.choice([1, 3]),
+                     rng.choice([1, 7]), rng.choice([None, rng.randint(begin, end)]))
+        check(cost, begin, end, xatol)
+        check(cost, begin, end, xatol, "grid")
+        check(cost, begin, end, xatol, guess=rng.randint(begin, end), width=xatol)
+
+
+def test_warm_start_steady_optimum():
+    warm_start = WarmStart()
+    assert warm_start.guess("open", 0, 1000, 10) == (None, None)
+    warm_start.update("open", 371)
+    assert warm_start.guess("open", 0, 1000, 10) == (371, 10)
+    guess, width = warm_start.guess("open", 0, 1000, 10)
+    warm = check(curve(371), 0, 1000, 10, guess=guess, width=width)
+    cold = check(curve(371), 0, 1000, 10)
+    # the bracket around the last optimum is confirmed right away
+    assert warm.evaluations == 3
+    assert warm.evaluations < cold.evaluations
+
+
+def test_warm_start_drifting_optimum():
+    warm_start = WarmStart()
+    warm_start.update("open", 371)
+    warm_start.update("open", 400)
+    # the bracket is as wide as the last move
+    assert warm_start.guess("open", 0, 1000, 10) == (400, 29)
+    guess, width = warm_start.guess("open", 0, 1000, 10)
+    check(curve(430), 0, 1000, 10, guess=guess, width=width)
+
+
+def test_warm_start_outside_the_interval():
+    warm_start = WarmStart()
+    warm_start.update("close", 900)
+    # clamped, and wide enough to find its way back
+    assert warm_start.guess("close", 0, 500, 1) == (500, 62)
+    guess, width = warm_start.guess("close", 0, 500, 1)
+    check(curve(120), 0, 500, 1, guess=guess, width=width)
+
+
+def test_warm_start_forgets():
+    warm_start = WarmStart()
+    warm_start.update("open", 371)
+    warm_start.update("open", None)
+    assert warm_start.guess("open", 0, 1000, 10) == (None, None)
+    warm_start.update("open", 371)
+    warm_start.forget()
+    assert warm_start.guess("open", 0, 1000, 10) == (None, None)
+
+
+def test_warm_start_reverted_bracket():
+    # everything around the guess reverts, the coarse grid takes over
+    check(curve(50, revert_above=100), 0, 1000, 1, guess=800, width=10)
@@ -0,0 +1,316 @@
+"""The state tracker and the pool mirror fed with Swap, Mint, Burn and Transfer logs, and reorgs.
+
+Run from the python directory: python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.pool_mirror import PoolMirror  # noqa: E402
+from lib.rpc import AsyncRPC  # noqa: E402
+from lib.state_tracker import (  # noqa: E402
+    BURN_TOPIC, MINT_TOPIC, SWAP_TOPIC, TRANSFER_TOPIC, StateTracker, apply_pool_log)
+from lib.uniswap_v3 import get_sqrt_ratio_at_tick  # noqa: E402
+
+ACCOUNT = "0x00000000000000000000000000000000000000a1"
+OTHER = "0x00000000000000000000000000000000000000b2"
+LIQUIDITY_POOL = "0x00000000000000000000000000000000000000c3"
+UNISWAP_POOL = "0x00000000000000000000000000000000000000d4"
+UNDERLYING = "0x00000000000000000000000000000000000000e5"
+COLLATERAL = "0x00000000000000000000000000000000000000f6"
+TICK_SPACING = 60
+# the collateral has 6 decimals
+COLLATERAL_SCALE = 10**12
+
+
+def word(value):
+    return (value % 2**256).to_bytes(32, "big").hex()
+
+
+def topic(value):
+    if isinstance(value, str):
+        return "0x" + "0" * 24 + value[2:]
+    return "0x" + word(value)
+
+
+def log(block_number, log_index, address, topics, words, removed=False):
+    """A log as eth_getLogs returns it."""
+    return {
+        "address": address,
+        "topics": topics,
+        "data": "0x" + "".join(word(value) for value in words),
+        "blockNumber": hex(block_number),
+        "blockHash": block_hash(block_number),
+        "transactionHash": "0x" + word(block_number * 1000 + log_index),
+        "logIndex": hex(log_index),
+        "removed": removed,
+    }
+
+
+def swap(block_number, log_index, sqrt_price_x96, liquidity, tick, amount0=10**18, amount1=-2 * 10**18):
+    # Swap(sender, recipient, amount0, amount1, sqrtPriceX96, liquidity, tick)
+    return log(block_number, log_index, UNISWAP_POOL, [SWAP_TOPIC, topic(OTHER), topic(OTHER)],
+               [amount0, amount1, sqrt_price_x96, liquidity, tick])
+
+
+def mint(block_number, log_index, tick_lower, tick_upper, amount):
+    # Mint(sender, owner, tickLower, tickUpper, amount, amount0, amount1)
+    return log(block_number, log_index, UNISWAP_POOL, [MINT_TOPIC, topic(OTHER), topic(tick_lower), topic(tick_upper)],
+               [int(OTHER, 16), amount, 7, 11])
+
+
+def burn(block_number, log_index, tick_lower, tick_upper, amount):
+    # Burn(owner, tickLower, tickUpper, amount, amount0, amount1)
+    return log(block_number, log_index, UNISWAP_POOL, [BURN_TOPIC, topic(OTHER), topic(tick_lower), topic(tick_upper)],
+               [amount, 7, 11])
+
+
+def transfer(block_number, log_index, token, source, destination, value):
+    return log(block_number, log_index, token, [TRANSFER_TOPIC, topic(source), topic(destination)], [value])
+
+
+def block_hash(block_number, fork=0):
+    return "0x" + word(block_number * 10 + fork)
+
+
+class Chain:
+    """Blocks, their logs and the pool state at each of them, served like a node."""
+
+    def __init__(self, block_number, pool):
+        self.hashes = {block_number: block_hash(block_number)}
+        self.logs = {}
+        # block -> (sqrtPriceX96, tick, liquidity, {tick: (liquidityGross, liquidityNet)})
+        self.pools = {block_number: pool}
+        self.accounts = {block_number: (5 * 10**18, 1000 * 10**18)}
+
+    def mine(self, block_number, logs, pool=None, fork=0, account=None):
+        self.hashes[block_number] = block_hash(block_number, fork)
+        self.logs[block_number] = logs
+        self.pools[block_number] = pool or self.pools[block_number - 1]
+        self.accounts[block_number] = account or self.accounts[block_number - 1]
+
+    def header(self, block_number):
+        if block_number not in self.hashes:
+            return None
+        return {"number": hex(block_number), "hash": self.hashes[block_number],
+                "parentHash": self.hashes.get(block_number - 1, "0x" + word(0))}
+
+    def get_logs(self, query):
+        addresses = [address.lower() for address in query["address"]]
+        topics = query.get("topics", [])
+        result = []
+        for block_number in range(int(query["fromBlock"], 16), int(query["toBlock"], 16) + 1):
+            for entry in self.logs.get(block_number, []):
+                if entry["address"].lower() not in addresses:
+                    continue
+                if all(t is None or (i < len(entry["topics"]) and entry["topics"][i] == t) for i, t in enumerate(topics)):
+                    result.append(entry)
+        return result
+
+    def reply(self, method, params):
+        if method == "eth_getLogs":
+            return self.get_logs(params[0])
+        if method == "eth_getBlockByNumber":
+            return self.header(int(params[0], 16))
+        raise ValueError(method)
+
+
+class ChainRPC(AsyncRPC):
+    def __init__(self, chain):
+        super().__init__("http://127.0.0.1:1")
+        self.chain = chain
+
+    async def request(self, method, params):
+        return self.chain.reply(method, params)
+
+    async def batch(self, requests):
+        return [self.chain.reply(method, params) for method, params in requests]
+
+
+class ChainPool:
+    """The `contract.UniswapV3Pool` reads of the pool mirror."""
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def fee(self):
+        return 3000
+
+    def tick_spacing(self):
+        return TICK_SPACING
+
+    def slot0(self, block_number):
+        sqrt_price_x96, tick, _, _ = self.chain.pools[block_number]
+        return [sqrt_price_x96, tick, 0, 1, 1, 0, True]
+
+    def liquidity(self, block_number):
+        return self.chain.pools[block_number][2]
+
+    def tick_bitmap_batch(self, words, block_number):
+        bitmap = {}
+        for tick in self.chain.pools[block_number][3]:
+            compressed = tick // TICK_SPACING
+            bitmap[compressed >> 8] = bitmap.get(compressed >> 8, 0) | (1 << (compressed & 0xff))
+        return [bitmap.get(word, 0) for word in words]
+
+    def ticks_batch(self, ticks, block_number):
+        infos = self.chain.pools[block_number][3]
+        return [list(infos[tick]) + [0, 0, 0, 0, 0, True] for tick in ticks]
+
+
+def pool_at(tick, liquidity, ticks):
+    return (get_sqrt_ratio_at_tick(tick), tick, liquidity, ticks)
+
+
+def tracker(chain):
+    mirror = PoolMirror(ChainPool(chain))
+    state_tracker = StateTracker(
+        ChainRPC(chain), ACCOUNT, LIQUIDITY_POOL, UNISWAP_POOL, (UNDERLYING, 1), (COLLATERAL, COLLATERAL_SCALE),
+        lambda block_number: chain.accounts[block_number], mirror.load, max_age=1000)
+    state_tracker.add_listener(mirror)
+    return state_tracker, mirror
+
+
+def update(state_tracker, block_number):
+    asyncio.get_event_loop().run_until_complete(state_tracker.update(block_number))
+
+
+def mirror_slot(mirror):
+    sqrt_price_x96, tick, liquidity, index = mirror.slot
+    return sqrt_price_x96, tick, liquidity, dict(index.net)
+
+
+# one position over [-120, 120] of 10**6 around tick 0
+START_POOL = pool_at(0, 10**6, {-120: (10**6, 10**6), 120: (10**6, -10**6)})
+
+
+def test_apply_pool_log():
+    sqrt_price_x96 = get_sqrt_ratio_at_tick(0)
+    # a swap reports the state it left, a negative tick included
+    assert apply_pool_log(swap(1, 0, 123456789, 42, -887), sqrt_price_x96, 0, 10) == (123456789, -887, 42, None)
+    # mints and burns in range move the liquidity, all report the position
+    assert apply_pool_log(mint(1, 0, -120, 60, 500), sqrt_price_x96, 0, 10) == \
+        (sqrt_price_x96, 0, 510, (-120, 60, 500))
+    assert apply_pool_log(burn(1, 0, -120, 60, 500), sqrt_price_x96, 0, 510) == \
+        (sqrt_price_x96, 0, 10, (-120, 60, -500))
+    # out of range, the upper tick is excluded
+    assert apply_pool_log(mint(1, 0, 60, 180, 500), sqrt_price_x96, 0, 10) == \
+        (sqrt_price_x96, 0, 10, (60, 180, 500))
+    assert apply_pool_log(mint(1, 0, -120, 0, 500), sqrt_price_x96, 0, 10)[2] == 10
+    # other logs of the pool leave it as it was
+    assert apply_pool_log(transfer(1, 0, UNISWAP_POOL, OTHER, ACCOUNT, 5), sqrt_price_x96, 0, 10) == \
+        (sqrt_price_x96, 0, 10, None)
+
+
+def test_follows_the_logs():
+    chain = Chain(100, START_POOL)
+    state_tracker, mirror = tracker(chain)
+    update(state_tracker, 100)
+    assert mirror_slot(mirror) == (get_sqrt_ratio_at_tick(0), 0, 10**6, {-120: 10**6, 120: -10**6})
+    assert state_tracker.reads == 2
+
+    # a mint in range, one out of range, then a swap down through -60
+    swap_price = get_sqrt_ratio_at_tick(-90) + 12345
+    chain.mine(101, [
+        mint(101, 0, -60, 60, 3000),
+        mint(101, 1, 600, 1200, 7000),
+        swap(101, 2, swap_price, 10**6, -90),
+    ])
+    update(state_tracker, 101)
+    assert mirror_slot(mirror) == (swap_price, -90, 10**6, {
+        -120: 10**6, -60: 3000, 60: -3000, 120: -10**6, 600: 7000, 1200: -7000})
+    assert state_tracker.pool == (swap_price, -90, 10**6)
+
+    # burns in and out of range, the ticks left empty are dropped
+    chain.mine(102, [burn(102, 0, -120, 120, 4 * 10**5), burn(102, 1, 600, 1200, 7000)])
+    update(state_tracker, 102)
+    assert mirror_slot(mirror) == (swap_price, -90, 6 * 10**5, {
+        -120: 6 * 10**5, -60: 3000, 60: -3000, 120: -6 * 10**5})
+    assert mirror.block_number == 102
+    # only logs, nothing read again
+    assert state_tracker.reads == 2
+
+    # the quotes run on the mirror
+    amount_out, sqrt_price_after = mirror.quote_exact_input(True, 1000)
+    assert amount_out > 0 and sqrt_price_after < swap_price
+
+
+def test_transfers_update_the_account():
+    chain = Chain(100, START_POOL)
+    state_tracker, _ = tracker(chain)
+    update(state_tracker, 100)
+    chain.mine(101, [
+        transfer(101, 0, UNDERLYING, OTHER, ACCOUNT, 2 * 10**18),
+        transfer(101, 1, COLLATERAL, ACCOUNT, OTHER, 3 * 10**6),
+        # to ourselves, it comes back from both queries once
+        transfer(101, 2, COLLATERAL, ACCOUNT, ACCOUNT, 10**6),
+        # not ours
+        transfer(101, 3, UNDERLYING, OTHER, OTHER, 10**18),
+    ])
+    update(state_tracker, 101)
+    assert state_tracker.account_info == (7 * 10**18, 997 * 10**18)
+
+
+def test_liquidity_pool_logs():
+    chain = Chain(100, START_POOL)
+    state_tracker, _ = tracker(chain)
+    update(state_tracker, 100)
+    reads = state_tracker.reads
+    # someone else's trade changes the perpetual
+    chain.mine(101, [log(101, 0, LIQUIDITY_POOL, ["0x" + word(1), topic(OTHER)], [1])])
+    update(state_tracker, 101)
+    assert state_tracker.perpetual_version == 1 and state_tracker.reads == reads
+    # ours makes the account read again
+    chain.mine(102, [log(102, 0, LIQUIDITY_POOL, ["0x" + word(1), topic(ACCOUNT)], [1])],
+               account=(1, 2))
+    update(state_tracker, 102)
+    assert state_tracker.perpetual_version == 1 and state_tracker.reads == reads + 1
+    assert state_tracker.account_info == (1, 2)
+
+
+def test_reorg_reads_the_pool_again():
+    chain = Chain(100, START_POOL)
+    state_tracker, mirror = tracker(chain)
+    update(state_tracker, 100)
+    chain.mine(101, [mint(101, 0, -60, 60, 3000)])
+    update(state_tracker, 101)
+    assert mirror_slot(mirror)[2] == 10**6 + 3000
+
+    # 101 is replaced by a block without the mint, 102 follows it
+    reorged_pool = pool_at(-30, 10**6 + 5, {-120: (10**6, 10**6), 120: (10**6, -10**6)})
+    chain.mine(101, [], reorged_pool, fork=1)
+    chain.mine(102, [swap(102, 0, get_sqrt_ratio_at_tick(-31), 10**6 + 5, -31)])
+    reads = state_tracker.reads
+    update(state_tracker, 102)
+    # read at 102, the mint of the old 101 is gone
+    assert state_tracker.reads == reads + 2
+    assert mirror_slot(mirror) == (get_sqrt_ratio_at_tick(-30), -30, 10**6 + 5, {-120: 10**6, 120: -10**6})
+    assert state_tracker.block_hash == chain.hashes[102]
+
+    # and it goes on from the new chain
+    chain.mine(103, [swap(103, 0, get_sqrt_ratio_at_tick(-40), 10**6 + 5, -40)])
+    update(state_tracker, 103)
+    assert mirror_slot(mirror)[:3] == (get_sqrt_ratio_at_tick(-40), -40, 10**6 + 5)
+    assert state_tracker.reads == reads + 2
+
+
+def test_removed_log_reads_the_pool_again():
+    chain = Chain(100, START_POOL)
+    state_tracker, mirror = tracker(chain)
+    update(state_tracker, 100)
+    chain.mine(101, [mint(101, 0, -60, 60, 3000)])
+    update(state_tracker, 101)
+
+    # the node reports the mint of 101 removed, with the block after it
+    chain.pools[102] = pool_at(10, 10**6, {-120: (10**6, 10**6), 120: (10**6, -10**6)})
+    chain.hashes[102] = block_hash(102)
+    chain.logs[102] = [dict(mint(101, 0, -60, 60, 3000), removed=True), mint(102, 0, -60, 60, 3000)]
+    chain.accounts[102] = chain.accounts[101]
+    reads = state_tracker.reads
+    update(state_tracker, 102)
+    # the mint after the removed log is not applied on top of the state read
+    assert state_tracker.reads == reads + 2
+    assert mirror_slot(mirror) == (get_sqrt_ratio_at_tick(10), 10, 10**6, {-120: 10**6, 120: -10**6})
+    assert state_tracker.pool == (get_sqrt_ratio_at_tick(10), 10, 10**6)
@@ -0,0 +1,118 @@
+"""The transactions signed from templates are byte for byte those of eth_account.
+
+Run from the python directory: python -m pytest tests
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from eth_account import Account
+from web3 import HTTPProvider, Web3
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from contract import Arbitrage  # noqa: E402
+from lib.address import Address  # noqa: E402
+from lib.rpc import AsyncRPC  # noqa: E402
+from lib.transaction import NonceManager, TemplateSubmitter  # noqa: E402
+
+KEY = "0x4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318"
+ARB_ADDRESS = "0xF0109fC8DF283027b6285cc889F5aA624EaC1F55"
+# secp256k1 order, EIP-2 only accepts s up to half of it
+SECP256K1_N = 0xfffffffffffffffffffffffffffffffebaaedce6af48a03bbfd25e8cd0364141
+
+
+class StaticRPC(AsyncRPC):
+    """Answers the refresh of the submitter without a node."""
+
+    def __init__(self, gas_price, chain_id):
+        super().__init__("http://127.0.0.1:1")
+        self.replies = [hex(gas_price), hex(chain_id)]
+
+    async def batch(self, requests):
+        return list(self.replies)
+
+
+def submitter(gas_price=10**9, chain_id=421611, gas_limit=3000000):
+    web3 = Web3(HTTPProvider("http://127.0.0.1:1"))
+    account = Account.from_key(KEY)
+    nonce_manager = NonceManager(web3, account.address)
+    # known, so the refresh doesn't ask the node
+    nonce_manager.nonce = 0
+    submitter = TemplateSubmitter(web3, account, nonce_manager, StaticRPC(gas_price, chain_id), gas_limit=gas_limit)
+    arb = SimpleNamespace(abi=Arbitrage.abi, address=Address(ARB_ADDRESS))
+    submitter.prepare(arb, ["profitOpen", "profitClose", "deleverageClose"])
+    asyncio.get_event_loop().run_until_complete(submitter.refresh(1))
+    return submitter
+
+
+def eth_account_transaction(fn_name, args, nonce, gas, gas_price, chain_id):
+    function = Arbitrage.abi.functions[fn_name]
+    data = function[0] + Web3().codec.encode_abi(function[1], args).hex()
+    return Account.sign_transaction({
+        "nonce": nonce,
+        "gasPrice": gas_price,
+        "gas": gas,
+        "to": ARB_ADDRESS,
+        "value": 0,
+        "data": data,
+        "chainId": chain_id,
+    }, KEY)
+
+
+def template_transaction(submitter, fn_name, args, nonce, gas):
+    template = submitter.templates[(ARB_ADDRESS.lower(), fn_name)]
+    return submitter.sign(template, args, nonce, gas)
+
+
+@pytest.mark.parametrize("fn_name, args", [
+    ("profitOpen", (10**18, -(9999999 * 10**18))),
+    ("profitClose", (123456789, 50 * 10**18)),
+    ("deleverageClose", (0, 5 * 10**18)),
+    ("profitOpen", (2**255 - 1, -2**255)),
+])
+@pytest.mark.parametrize("nonce", [0, 1, 127, 128, 2**32])
+def test_same_bytes_as_eth_account(fn_name, args, nonce):
+    signer = submitter()
+    raw = template_transaction(signer, fn_name, args, nonce, 3000000)
+    signed = eth_account_transaction(fn_name, args, nonce, 3000000, 10**9, 421611)
+    assert raw == bytes(signed.rawTransaction)
+    assert Account.recover_transaction(raw) == Account.from_key(KEY).address
+
+
+@pytest.mark.parametrize("gas_price, chain_id, gas", [
+    # the zero fields are encoded as empty strings
+    (0, 1, 21000),
+    (1, 42161, 0),
+    (2**64, 421611, 2**40),
+])
+def test_fields(gas_price, chain_id, gas):
+    signer = submitter(gas_price, chain_id)
+    raw = template_transaction(signer, "profitClose", (0, 0), 0, gas)
+    assert raw == bytes(eth_account_transaction("profitClose", (0, 0), 0, gas, gas_price, chain_id).rawTransaction)
+
+
+def test_signature_values():
+    """Both recovery ids, r or s shorter than 32 bytes and s close to the EIP-2 bound come out the same."""
+    signer = submitter()
+    seen = set()
+    for nonce in range(600):
+        raw = template_transaction(signer, "profitOpen", (nonce, 0), nonce, 3000000)
+        signed = eth_account_transaction("profitOpen", (nonce, 0), nonce, 3000000, 10**9, 421611)
+        assert raw == bytes(signed.rawTransaction)
+        # the signature is normalized to the low half of s, nodes reject the high one
+        assert signed.s <= SECP256K1_N // 2
+        seen.add(("v", signed.v % 2))
+        if signed.r < 2**248 or signed.s < 2**248:
+            seen.add("short")
+        if signed.s >= SECP256K1_N // 2 - SECP256K1_N // 8:
+            seen.add("high s")
+    assert seen == {("v", 0), ("v", 1), "short", "high s"}
+
+
+def test_wrong_argument_count():
+    signer = submitter()
+    with pytest.raises(ValueError):
+        template_transaction(signer, "profitOpen", (1,), 0, 3000000)
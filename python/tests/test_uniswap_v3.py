@@ -0,0 +1,174 @@
+"""The Uniswap V3 port against the vectors of the v3-core tests, and the tick index against a bisect.
+
+Run from the python directory: python -m pytest tests
+"""
+import os
+import random
+import sys
+from bisect import bisect_left, bisect_right
+from math import isqrt
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.uniswap_v3 import (  # noqa: E402
+    MAX_SQRT_RATIO, MAX_TICK, MIN_SQRT_RATIO, MIN_TICK, SwapError, TickIndex, compute_swap_step,
+    get_next_sqrt_price_from_input, get_next_sqrt_price_from_output, get_sqrt_ratio_at_tick, get_tick_at_sqrt_ratio)
+
+E18 = 10**18
+
+
+def encode_price_sqrt(reserve1, reserve0):
+    """sqrt(reserve1 / reserve0) as a Q64.96, rounded down like the v3-core tests."""
+    return isqrt(reserve1 * 2**192 // reserve0)
+
+
+@pytest.mark.parametrize("tick, sqrt_ratio", [
+    (MIN_TICK, 4295128739),
+    (MIN_TICK + 1, 4295343490),
+    (0, 2**96),
+    (MAX_TICK - 1, 1461373636630004318706518188784493106690254656249),
+    (MAX_TICK, 1461446703485210103287273052203988822378723970342),
+])
+def test_sqrt_ratio_at_tick(tick, sqrt_ratio):
+    assert get_sqrt_ratio_at_tick(tick) == sqrt_ratio
+
+
+@pytest.mark.parametrize("tick", [MIN_TICK - 1, MAX_TICK + 1])
+def test_sqrt_ratio_out_of_range(tick):
+    with pytest.raises(SwapError):
+        get_sqrt_ratio_at_tick(tick)
+
+
+def test_tick_at_sqrt_ratio():
+    assert get_tick_at_sqrt_ratio(MIN_SQRT_RATIO) == MIN_TICK
+    assert get_tick_at_sqrt_ratio(MAX_SQRT_RATIO - 1) == MAX_TICK - 1
+    rng = random.Random(3)
+    for tick in [rng.randint(MIN_TICK, MAX_TICK - 1) for _ in range(50)]:
+        sqrt_ratio = get_sqrt_ratio_at_tick(tick)
+        assert get_tick_at_sqrt_ratio(sqrt_ratio) == tick
+        assert get_tick_at_sqrt_ratio(get_sqrt_ratio_at_tick(tick + 1) - 1) == tick
+
+
+def test_exact_in_capped_at_price_target():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(101, 100)
+    assert compute_swap_step(price, target, 2 * E18, E18, 600) == (
+        target, 9975124224178055, 9925619580021728, 5988667735148)
+
+
+def test_exact_out_capped_at_price_target():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(101, 100)
+    assert compute_swap_step(price, target, 2 * E18, -E18, 600) == (
+        target, 9975124224178055, 9925619580021728, 5988667735148)
+
+
+def test_exact_in_fully_spent():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(1000, 100)
+    sqrt_ratio_next = get_next_sqrt_price_from_input(price, 2 * E18, E18 * (10**6 - 600) // 10**6, False)
+    assert compute_swap_step(price, target, 2 * E18, E18, 600) == (
+        sqrt_ratio_next, 999400000000000000, 666399946655997866, 600000000000000)
+    assert sqrt_ratio_next < target
+
+
+def test_exact_out_fully_received():
+    price, target = encode_price_sqrt(1, 1), encode_price_sqrt(10000, 100)
+    sqrt_ratio_next = get_next_sqrt_price_from_output(price, 2 * E18, E18, False)
+    assert compute_swap_step(price, target, 2 * E18, -E18, 600) == (
+        sqrt_ratio_next, 2 * E18, E18, 1200720432259356)
+    assert sqrt_ratio_next < target
+
+
+@pytest.mark.parametrize("args, result", [
+    # the amount out is capped at the desired amount out
+    ((417332158212080721273783715441582, 1452870262520218020823638996, 159344665391607089467575320103, -1, 1),
+     (417332158212080721273783715441581, 1, 1, 1)),
+    # a target price of 1 uses part of the input
+    ((2, 1, 1, 3915081100057732413702495386755767, 1),
+     (1, 39614081257132168796771975168, 0, 39614120871253040049813)),
+    # the whole input is taken as fee
+    ((2413, 79887613182836312, 1985041575832132834610021537970, 10, 1872),
+     (2413, 0, 0, 10)),
+    # not enough liquidity in the step, exact output
+    ((20282409603651670423947251286016, 20282409603651670423947251286016 * 11 // 10, 1024, -4, 3000),
+     (20282409603651670423947251286016 * 11 // 10, 26215, 0, 79)),
+    ((20282409603651670423947251286016, 20282409603651670423947251286016 * 9 // 10, 1024, -263000, 3000),
+     (20282409603651670423947251286016 * 9 // 10, 1, 26214, 1)),
+])
+def test_swap_step_edge_cases(args, result):
+    assert compute_swap_step(*args) == result
+
+
+def next_tick_bisect(sorted_ticks, tick_spacing, tick, lte):
+    """TickBitmap.nextInitializedTickWithinOneWord from the sorted initialized ticks."""
+    compressed = tick // tick_spacing
+    if lte:
+        word_start = (compressed >> 8) << 8
+        i = bisect_right(sorted_ticks, compressed * tick_spacing)
+        if i > 0 and sorted_ticks[i - 1] >= word_start * tick_spacing:
+            return sorted_ticks[i - 1], True
+        return word_start * tick_spacing, False
+    compressed += 1
+    word_end = ((compressed >> 8) << 8) + 255
+    i = bisect_left(sorted_ticks, compressed * tick_spacing)
+    if i < len(sorted_ticks) and sorted_ticks[i] <= word_end * tick_spacing:
+        return sorted_ticks[i], True
+    return word_end * tick_spacing, False
+
+
+def random_ticks(rng, tick_spacing, count, span):
+    """Ticks of `tick_spacing` over a few words on both sides of 0."""
+    return sorted({rng.randint(-span, span) * tick_spacing for _ in range(count)})
+
+
+@pytest.mark.parametrize("tick_spacing", [1, 10, 60, 200])
+def test_next_initialized_tick(tick_spacing):
+    rng = random.Random(tick_spacing)
+    for count in (0, 1, 5, 200):
+        ticks = random_ticks(rng, tick_spacing, count, 3 * 256)
+        index = TickIndex(tick_spacing, {tick: 1 for tick in ticks})
+        # every initialized tick, its neighbours, the word boundaries and random ticks
+        probes = [t + d for t in ticks for d in (-1, 0, 1)]
+        probes += [word * 256 * tick_spacing + d for word in range(-4, 4) for d in (-tick_spacing, -1, 0, 1)]
+        probes += [rng.randint(-4 * 256 * tick_spacing, 4 * 256 * tick_spacing) for _ in range(200)]
+        for tick in probes:
+            for lte in (True, False):
+                assert index.next_initialized_tick_within_one_word(tick, lte) == \
+                    next_tick_bisect(ticks, tick_spacing, tick, lte), (tick, lte)
+
+
+def test_update_matches_a_rebuilt_index():
+    tick_spacing = 60
+    rng = random.Random(11)
+    index = TickIndex(tick_spacing, {}, {})
+    positions = []
+    for _ in range(300):
+        if len(positions) > 0 and rng.random() < 0.4:
+            tick_lower, tick_upper, liquidity = positions.pop(rng.randrange(len(positions)))
+            liquidity = -liquidity
+        else:
+            tick_lower, tick_upper = (tick * tick_spacing for tick in sorted(rng.sample(range(-600, 600), 2)))
+            liquidity = rng.randint(1, 10**6)
+            positions.append((tick_lower, tick_upper, liquidity))
+        before = index
+        sorted_before, bitmap_before = list(before.sorted), dict(before.bitmap)
+        index = index.update(tick_lower, liquidity, False).update(tick_upper, liquidity, True)
+        # the index updated from is left as it was
+        assert before.sorted == sorted_before and before.bitmap == bitmap_before
+        rebuilt = TickIndex(tick_spacing, index.net, index.gross)
+        assert index.sorted == rebuilt.sorted
+        assert index.bitmap == rebuilt.bitmap
+        for tick in [rng.randint(-700 * tick_spacing, 700 * tick_spacing) for _ in range(20)]:
+            for lte in (True, False):
+                assert index.next_initialized_tick_within_one_word(tick, lte) == \
+                    next_tick_bisect(rebuilt.sorted, tick_spacing, tick, lte)
+    # every position removed, nothing is left
+    for tick_lower, tick_upper, liquidity in positions:
+        index = index.update(tick_lower, -liquidity, False).update(tick_upper, -liquidity, True)
+    assert index.net == {} and index.sorted == [] and index.bitmap == {}
+
+
+def test_update_below_zero_gross():
+    index = TickIndex(60, {60: 5}, {60: 5})
+    with pytest.raises(SwapError):
+        index.update(60, -6, False)
@@ -0,0 +1,126 @@
+"""Wad arithmetic against Decimal rounding down, and the bulk helpers.
+
+Run from the python directory: python -m pytest tests
+"""
+import os
+import random
+import sys
+from decimal import ROUND_DOWN, Decimal, localcontext
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lib.wad import ONE, Wad  # noqa: E402
+
+VALUES = [0, 1, -1, 7, -7, ONE - 1, ONE, -ONE, ONE + 1, 3 * ONE // 2, -3 * ONE // 2,
+          123456789123456789123, -987654321987654321, 2**200, -2**200]
+
+
+def round_down(value):
+    with localcontext() as context:
+        context.prec = 200
+        return int(value.to_integral_value(rounding=ROUND_DOWN))
+
+
+def decimal_mul(x, y):
+    with localcontext() as context:
+        context.prec = 200
+        return round_down(Decimal(x) * Decimal(y) / ONE)
+
+
+def decimal_div(x, y):
+    with localcontext() as context:
+        context.prec = 200
+        return round_down(Decimal(x) * ONE / Decimal(y))
+
+
+def random_values(count):
+    rng = random.Random(5)
+    return [rng.choice([-1, 1]) * rng.randint(0, 10**rng.randint(0, 40)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("x", VALUES)
+@pytest.mark.parametrize("y", VALUES)
+def test_mul(x, y):
+    assert (Wad(x) * Wad(y)).value == decimal_mul(x, y)
+
+
+@pytest.mark.parametrize("x", VALUES)
+@pytest.mark.parametrize("y", [value for value in VALUES if value != 0])
+def test_div(x, y):
+    assert (Wad(x) / Wad(y)).value == decimal_div(x, y)
+
+
+def test_random_operands():
+    values = random_values(400)
+    for x, y in zip(values, reversed(values)):
+        assert (Wad(x) * Wad(y)).value == decimal_mul(x, y)
+        if y != 0:
+            assert (Wad(x) / Wad(y)).value == decimal_div(x, y)
+
+
+def test_negative_rounds_toward_zero():
+    # -1.5e-18 rounds to -1e-18, not -2e-18
+    assert (Wad(-3) * Wad(ONE // 2)).value == -1
+    assert (Wad(-1) / Wad(2 * ONE)).value == 0
+    assert int(Wad(-3 * ONE // 2)) == -1
+    assert Wad.from_number(-0.0000000000000000015).value == -1
+
+
+@pytest.mark.parametrize("number", [0, 1, -1, 5, 0.01, -0.004, 1.1, 123.456789, -9999999, 1e-18, 1e-19])
+def test_from_number(number):
+    assert Wad.from_number(number).value == round_down(Decimal(str(number)) * ONE)
+
+
+def test_div_by_zero():
+    with pytest.raises(ZeroDivisionError):
+        Wad(ONE) / Wad(0)
+
+
+def test_bulk_helpers_on_lists():
+    values = random_values(50)
+    factor = Wad(3 * ONE // 2)
+    assert Wad.mul_values(values, factor) == [(Wad(x) * factor).value for x in values]
+    assert Wad.div_values(values, factor) == [(Wad(x) / factor).value for x in values]
+    assert Wad.add_values(values, factor) == [(Wad(x) + factor).value for x in values]
+    # raw values work as well as Wads
+    assert Wad.mul_values(values, factor.value) == Wad.mul_values(values, factor)
+    assert Wad.values([Wad(x) for x in values]) == values
+    assert Wad.sum([Wad(x) for x in values]).value == sum(values)
+
+
+def test_bulk_helpers_in_place():
+    values = random_values(50)
+    out = list(values)
+    assert Wad.mul_values(out, Wad(2 * ONE), out=out) is out
+    assert out == [2 * x for x in values]
+
+
+def test_bulk_helpers_on_arrays():
+    numpy = pytest.importorskip("numpy")
+    values = random_values(50)
+    array = Wad.array(values)
+    assert array.dtype == object
+    factor = Wad(3 * ONE // 2)
+    assert list(Wad.mul_values(array, factor)) == Wad.mul_values(values, factor)
+    assert list(Wad.div_values(array, factor)) == Wad.div_values(values, factor)
+    assert list(Wad.add_values(array, factor)) == Wad.add_values(values, factor)
+    # int64 inputs are widened, their wad products don't fit in int64
+    small = numpy.array([ONE, -ONE, 5 * ONE], dtype=numpy.int64)
+    assert list(Wad.mul_values(small, Wad(10 * ONE))) == [10 * ONE, -10 * ONE, 50 * ONE]
+    out = numpy.empty(len(values), dtype=object)
+    assert Wad.mul_values(array, factor, out=out) is out
+    assert list(out) == Wad.mul_values(values, factor)
+
+
+@pytest.mark.parametrize("dtype", ["int64", "float64"])
+def test_bulk_helpers_reject_non_object_out(dtype):
+    numpy = pytest.importorskip("numpy")
+    values = [ONE, 2 * ONE]
+    for source in (values, Wad.array(values), numpy.array(values, dtype=numpy.int64)):
+        out = numpy.zeros(2, dtype=dtype)
+        with pytest.raises(TypeError):
+            Wad.mul_values(source, Wad(ONE), out=out)
+        # nothing was written
+        assert not out.any()
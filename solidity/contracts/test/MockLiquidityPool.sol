@@ -0,0 +1,238 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.7.6;
+pragma abicoder v2;
+
+import "@openzeppelin/contracts/math/SignedSafeMath.sol";
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+import "@openzeppelin/contracts/token/ERC20/SafeERC20.sol";
+
+import "../libraries/Constant.sol";
+import "../libraries/SafeMathExt.sol";
+import "../interfaces/ILiquidityPool.sol";
+
+// A MAI3 liquidity pool with a single perpetual, only what UniswapV3Arbitrage uses,
+// for the local benchmarks. The AMM trades at
+//   indexPrice * (1 - slippageFactor * (poolPosition - amount / 2)) * (1 +/- halfSpread)
+// margins are valued at the index price and the funding rate is set by hand,
+// unitAccumulativeFunding stays 0.
+contract MockLiquidityPool is ILiquidityPool {
+    using SafeERC20 for IERC20;
+    using SafeMathExt for int256;
+    using SignedSafeMath for int256;
+
+    struct MarginAccount {
+        int256 cash;
+        int256 position;
+    }
+
+    address public owner;
+    IERC20 public collateral;
+    int256 public collateralScale;
+    int256 public indexPrice;
+    int256 public fundingRate;
+    int256 public initialMarginRate;
+    int256 public maintenanceMarginRate;
+    int256 public halfSpread;
+    int256 public slippageFactor;
+    int256 public lpFeeRate;
+    mapping(address => MarginAccount) public accounts;
+    mapping(address => mapping(address => uint256)) public privileges;
+
+    constructor(
+        address collateral_,
+        uint8 collateralDecimals_,
+        int256 indexPrice_,
+        int256 initialMarginRate_,
+        int256 maintenanceMarginRate_,
+        int256 halfSpread_,
+        int256 slippageFactor_,
+        int256 lpFeeRate_
+    ) {
+        owner = msg.sender;
+        collateral = IERC20(collateral_);
+        collateralScale = int256(10**(18 - uint256(collateralDecimals_)));
+        indexPrice = indexPrice_;
+        initialMarginRate = initialMarginRate_;
+        maintenanceMarginRate = maintenanceMarginRate_;
+        halfSpread = halfSpread_;
+        slippageFactor = slippageFactor_;
+        lpFeeRate = lpFeeRate_;
+    }
+
+    modifier onlyOwner() {
+        require(msg.sender == owner, "only owner");
+        _;
+    }
+
+    modifier onlyAuthorized(address trader, uint256 privilege) {
+        require(
+            msg.sender == trader ||
+                (privileges[trader][msg.sender] & privilege) == privilege,
+            "unauthorized caller"
+        );
+        _;
+    }
+
+    function setIndexPrice(int256 indexPrice_) external onlyOwner {
+        require(indexPrice_ > 0, "invalid index price");
+        indexPrice = indexPrice_;
+    }
+
+    function setFundingRate(int256 fundingRate_) external onlyOwner {
+        fundingRate = fundingRate_;
+    }
+
+    function grantPrivilege(address grantee, uint256 privilege) external {
+        privileges[msg.sender][grantee] |= privilege;
+    }
+
+    function forceToSyncState() external override {}
+
+    function getPerpetualInfo(uint256 perpetualIndex)
+        external
+        view
+        override
+        returns (
+            PerpetualState state,
+            address oracle,
+            int256[39] memory nums
+        )
+    {
+        require(perpetualIndex == 0, "perpetual index out of range");
+        state = PerpetualState.NORMAL;
+        nums[1] = indexPrice;
+        nums[2] = indexPrice;
+        nums[3] = fundingRate;
+        nums[5] = initialMarginRate;
+        nums[6] = maintenanceMarginRate;
+        nums[8] = lpFeeRate;
+    }
+
+    function getMarginAccount(uint256 perpetualIndex, address trader)
+        external
+        view
+        override
+        returns (
+            int256 cash,
+            int256 position,
+            int256 availableMargin,
+            int256 margin,
+            int256 settleableMargin,
+            bool isInitialMarginSafe,
+            bool isMaintenanceMarginSafe,
+            bool isMarginSafe,
+            int256 targetLeverage
+        )
+    {
+        require(perpetualIndex == 0, "perpetual index out of range");
+        MarginAccount storage account = accounts[trader];
+        cash = account.cash;
+        position = account.position;
+        margin = _margin(account);
+        availableMargin = margin.sub(_marginRequirement(account, initialMarginRate));
+        settleableMargin = margin;
+        isInitialMarginSafe = availableMargin >= 0;
+        isMaintenanceMarginSafe =
+            margin >= _marginRequirement(account, maintenanceMarginRate);
+        isMarginSafe = margin >= 0;
+        targetLeverage = Constant.SIGNED_ONE.wdiv(initialMarginRate);
+    }
+
+    function trade(
+        uint256 perpetualIndex,
+        address trader,
+        int256 amount,
+        int256 limitPrice,
+        uint256 deadline,
+        address referrer,
+        uint32 flags
+    )
+        external
+        override
+        onlyAuthorized(trader, Constant.PRIVILEGE_TRADE)
+        returns (int256)
+    {
+        require(perpetualIndex == 0, "perpetual index out of range");
+        require(amount != 0, "invalid amount");
+        require(block.timestamp <= deadline, "deadline exceeded");
+        referrer;
+        flags;
+        MarginAccount storage pool = accounts[address(this)];
+        int256 price = indexPrice
+            .wmul(
+            Constant.SIGNED_ONE.sub(
+                slippageFactor.wmul(pool.position.sub(amount / 2))
+            )
+        )
+            .wmul(
+            amount > 0
+                ? Constant.SIGNED_ONE.add(halfSpread)
+                : Constant.SIGNED_ONE.sub(halfSpread)
+        );
+        require(price > 0, "price out of range");
+        require(
+            amount > 0 ? price <= limitPrice : price >= limitPrice,
+            "price exceeds limit"
+        );
+        int256 value = price.wmul(amount);
+        int256 fee = value.abs().wmul(lpFeeRate);
+        MarginAccount storage account = accounts[trader];
+        account.cash = account.cash.sub(value).sub(fee);
+        account.position = account.position.add(amount);
+        pool.cash = pool.cash.add(value).add(fee);
+        pool.position = pool.position.sub(amount);
+        require(
+            _margin(account) >=
+                _marginRequirement(account, maintenanceMarginRate),
+            "trader margin unsafe"
+        );
+        return amount;
+    }
+
+    function deposit(
+        uint256 perpetualIndex,
+        address trader,
+        int256 amount
+    ) external override onlyAuthorized(trader, Constant.PRIVILEGE_DEPOSIT) {
+        require(perpetualIndex == 0, "perpetual index out of range");
+        require(amount > 0, "invalid amount");
+        uint256 rawAmount = uint256(amount / collateralScale);
+        collateral.safeTransferFrom(trader, address(this), rawAmount);
+        accounts[trader].cash = accounts[trader].cash.add(
+            int256(rawAmount).mul(collateralScale)
+        );
+    }
+
+    function withdraw(
+        uint256 perpetualIndex,
+        address trader,
+        int256 amount
+    ) external override onlyAuthorized(trader, Constant.PRIVILEGE_WITHDRAW) {
+        require(perpetualIndex == 0, "perpetual index out of range");
+        require(amount > 0, "invalid amount");
+        uint256 rawAmount = uint256(amount / collateralScale);
+        MarginAccount storage account = accounts[trader];
+        account.cash = account.cash.sub(int256(rawAmount).mul(collateralScale));
+        require(
+            _margin(account) >= _marginRequirement(account, initialMarginRate),
+            "trader initial margin unsafe"
+        );
+        collateral.safeTransfer(trader, rawAmount);
+    }
+
+    function _margin(MarginAccount storage account)
+        internal
+        view
+        returns (int256)
+    {
+        return account.cash.add(account.position.wmul(indexPrice));
+    }
+
+    function _marginRequirement(MarginAccount storage account, int256 rate)
+        internal
+        view
+        returns (int256)
+    {
+        return account.position.abs().wmul(indexPrice).wmul(rate);
+    }
+}
@@ -0,0 +1,47 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity 0.7.6;
+
+import "@uniswap/v3-core/contracts/interfaces/IUniswapV3Pool.sol";
+import "@uniswap/v3-periphery/contracts/libraries/TransferHelper.sol";
+
+// adds liquidity to a Uniswap V3 pool without the position manager, the tokens come from msg.sender
+contract MockLiquidityProvider {
+    function mint(
+        address pool,
+        int24 tickLower,
+        int24 tickUpper,
+        uint128 amount
+    ) external {
+        IUniswapV3Pool(pool).mint(
+            msg.sender,
+            tickLower,
+            tickUpper,
+            amount,
+            abi.encode(msg.sender)
+        );
+    }
+
+    function uniswapV3MintCallback(
+        uint256 amount0Owed,
+        uint256 amount1Owed,
+        bytes calldata data
+    ) external {
+        address payer = abi.decode(data, (address));
+        if (amount0Owed > 0) {
+            TransferHelper.safeTransferFrom(
+                IUniswapV3Pool(msg.sender).token0(),
+                payer,
+                msg.sender,
+                amount0Owed
+            );
+        }
+        if (amount1Owed > 0) {
+            TransferHelper.safeTransferFrom(
+                IUniswapV3Pool(msg.sender).token1(),
+                payer,
+                msg.sender,
+                amount1Owed
+            );
+        }
+    }
+}
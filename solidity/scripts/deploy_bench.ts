@@ -0,0 +1,118 @@
+const hre = require("hardhat")
+const ethers = hre.ethers
+import * as fs from 'fs';
+
+import { DeploymentOptions } from './deployer/deployer'
+import { restorableEnviron } from './deployer/environ'
+import { printError } from './deployer/utils'
+
+// Local fixture of python/benchmarks/bench_local_chain.py:
+//   npx hardhat node
+//   npx hardhat run scripts/deploy_bench.ts --network localhost
+// account 0 deploys and moves the index price, account 1 is the arbitrageur,
+// account 2 holds a long on the perpetual so that shorting it receives funding.
+
+// the pool bytecode must match the init code hash of PoolAddress, use the published build
+const factoryArtifact = require("@uniswap/v3-core/artifacts/contracts/UniswapV3Factory.sol/UniswapV3Factory.json")
+const poolArtifact = require("@uniswap/v3-core/artifacts/contracts/UniswapV3Pool.sol/UniswapV3Pool.json")
+
+const ENV: DeploymentOptions = {
+    network: hre.network.name,
+    artifactDirectory: './artifacts/contracts',
+    addressOverride: {}
+}
+
+const FEE = 3000
+const TICK_SPACING = 60
+const INDEX_PRICE = "1000"
+const UNDERLYING_DECIMALS = 18
+const COLLATERAL_DECIMALS = 6
+
+function toWei(n) { return hre.ethers.utils.parseEther(n) };
+function toUnits(n, decimals) { return hre.ethers.utils.parseUnits(n, decimals) };
+
+function sqrt(x) {
+    if (x.lt(2)) {
+        return x
+    }
+    let z = x
+    let y = x.div(2).add(1)
+    while (y.lt(z)) {
+        z = y
+        y = x.div(y).add(y).div(2)
+    }
+    return z
+}
+
+// sqrt(amount1 / amount0) * 2^96 of raw token amounts
+function encodePriceSqrt(amount1, amount0) {
+    return sqrt(amount1.mul(ethers.BigNumber.from(2).pow(192)).div(amount0))
+}
+
+async function main(_, deployer, accounts) {
+    const [owner, trader, whale] = accounts
+
+    const underlying = await deployer.deployAs("MockERC20", "UnderlyingAsset", "Wrapped Ether", "WETH", UNDERLYING_DECIMALS)
+    const collateral = await deployer.deployAs("MockERC20", "Collateral", "USD Coin", "USDC", COLLATERAL_DECIMALS)
+
+    const factory = await new ethers.ContractFactory(factoryArtifact.abi, factoryArtifact.bytecode, owner).deploy()
+    const factoryReceipt = await factory.deployTransaction.wait()
+    deployer.deployedContracts["UniswapV3Factory"] = {
+        type: "plain",
+        name: "UniswapV3Factory",
+        address: factory.address,
+        deployedAt: factoryReceipt.blockNumber,
+    }
+    await (await factory.createPool(underlying.address, collateral.address, FEE)).wait()
+    const pool = new ethers.Contract(
+        await factory.getPool(underlying.address, collateral.address, FEE), poolArtifact.abi, owner)
+    deployer.deployedContracts["UniswapV3Pool"] = { type: "preset", name: "UniswapV3Pool", address: pool.address }
+
+    // one underlying at INDEX_PRICE collateral
+    const oneUnderlying = toUnits("1", UNDERLYING_DECIMALS)
+    const price = toUnits(INDEX_PRICE, COLLATERAL_DECIMALS)
+    const underlyingIsToken0 = underlying.address.toLowerCase() < collateral.address.toLowerCase()
+    await (await pool.initialize(
+        underlyingIsToken0 ? encodePriceSqrt(price, oneUnderlying) : encodePriceSqrt(oneUnderlying, price))).wait()
+
+    // full range liquidity of about 1000 underlying and 1000000 collateral
+    const provider = await deployer.deploy("MockLiquidityProvider")
+    await (await underlying.mint(owner.address, toUnits("2000", UNDERLYING_DECIMALS))).wait()
+    await (await collateral.mint(owner.address, toUnits("2000000", COLLATERAL_DECIMALS))).wait()
+    await (await underlying.approve(provider.address, ethers.constants.MaxUint256)).wait()
+    await (await collateral.approve(provider.address, ethers.constants.MaxUint256)).wait()
+    const maxTick = Math.floor(887272 / TICK_SPACING) * TICK_SPACING
+    await (await provider.mint(pool.address, -maxTick, maxTick, "30000000000000000")).wait()
+
+    // imr 10%, mmr 5%, half spread 0.1%, slippage 0.01% per unit of pool position, lp fee 0.07%
+    const liquidityPool = await deployer.deployAs(
+        "MockLiquidityPool", "LiquidityPool", collateral.address, COLLATERAL_DECIMALS, toWei(INDEX_PRICE),
+        toWei("0.1"), toWei("0.05"), toWei("0.001"), toWei("0.0001"), toWei("0.0007"))
+
+    // the whale goes long 100, the pool is short
+    await (await collateral.mint(whale.address, toUnits("100000", COLLATERAL_DECIMALS))).wait()
+    await (await collateral.connect(whale).approve(liquidityPool.address, ethers.constants.MaxUint256)).wait()
+    await (await liquidityPool.connect(whale).deposit(0, whale.address, toWei("100000"))).wait()
+    await (await liquidityPool.connect(whale).trade(
+        0, whale.address, toWei("100"), ethers.constants.MaxInt256, ethers.constants.MaxUint256, whale.address, 0x40000000)).wait()
+
+    // uniswap factory, underlying asset, collateral, fee, pool address, perpetual index, target leverage
+    const arbitrage = await deployer.deploy(
+        "UniswapV3Arbitrage", factory.address, underlying.address, collateral.address, FEE, liquidityPool.address, 0, toWei("2"))
+
+    // what prepare.py does on a live chain
+    await (await collateral.mint(trader.address, toUnits("100000", COLLATERAL_DECIMALS))).wait()
+    await (await collateral.connect(trader).approve(arbitrage.address, ethers.constants.MaxUint256)).wait()
+    await (await collateral.connect(trader).approve(liquidityPool.address, ethers.constants.MaxUint256)).wait()
+    await (await underlying.connect(trader).approve(arbitrage.address, ethers.constants.MaxUint256)).wait()
+    await (await liquidityPool.connect(trader).grantPrivilege(arbitrage.address, 7)).wait()
+}
+
+fs.mkdirSync('./deployments', { recursive: true })
+ethers.getSigners()
+    .then(accounts => restorableEnviron(ethers, ENV, main, accounts))
+    .then(() => process.exit(0))
+    .catch(error => {
+        printError(error);
+        process.exit(1);
+    });